@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Account Matrix - Record counts for every account in every account-keyed table
+Runs one GROUP BY per table in both databases and stores the result as a
+sparse accounts x tables matrix, so per-account table summaries become
+lookups and cross-database coverage questions become set operations
+Usage:
+    python3 account_matrix.py build
+    python3 account_matrix.py [account_number]
+    python3 account_matrix.py missing [raw_table] [cleaned_table]
+"""
+
+import json
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import sys
+import os
+import time
+from datetime import datetime
+from database_connection import DatabaseConnection
+from account_table_summary import find_account_column
+from column_profiler import load_profiles
+from config import TARGET_ACCOUNT, CACHE_CONFIG, ACCOUNT_MATRIX_CONFIG
+
+def matrix_paths():
+    """Locations of the persisted matrix and its row/column labels"""
+    return (os.path.join(CACHE_CONFIG['directory'], ACCOUNT_MATRIX_CONFIG['matrix_file']),
+            os.path.join(CACHE_CONFIG['directory'], ACCOUNT_MATRIX_CONFIG['labels_file']))
+
+class AccountMatrix:
+    """CSR matrix of record counts: one row per account, one column per table
+
+    Rows are sorted account numbers (lookups are a binary search). Columns
+    are described by `tables`, a list of {database, table, column} dicts.
+    """
+
+    def __init__(self, accounts, tables, counts, built_at=None):
+        self.accounts = np.asarray(accounts, dtype=np.int64)
+        self.tables = list(tables)
+        self.counts = sp.csr_matrix(counts, dtype=np.int64)
+        self.built_at = built_at or time.time()
+
+    @classmethod
+    def build(cls, db):
+        """One GROUP BY per account-keyed table in the raw and cleaned databases"""
+        tables, parts = [], []
+
+        for database_name in [db.raw_db, db.cleaned_db]:
+            table_names = db.get_table_list(database_name)
+            print(f"Aggregating {len(table_names)} tables in {database_name}...")
+
+            for table_name in table_names:
+                try:
+                    column = find_account_column(db, table_name, database_name)
+                    if not column:
+                        continue
+                    query = f"""
+                        SELECT `{column}` AS account, COUNT(*) AS records
+                        FROM `{table_name}`
+                        WHERE `{column}` IS NOT NULL
+                        GROUP BY `{column}`
+                    """
+                    df = db.execute_query(query, database_name)
+                except Exception as e:
+                    print(f"  ✗ Skipping {table_name}: {str(e)}")
+                    continue
+
+                accounts = pd.to_numeric(df['account'], errors='coerce')
+                df = pd.DataFrame({'account': accounts, 'records': df['records']}).dropna()
+                # Text account columns can hold '123' and ' 123' as separate groups
+                df = df.groupby('account', as_index=False)['records'].sum()
+                df['column_index'] = len(tables)
+                tables.append({'database': database_name, 'table': table_name, 'column': column})
+                parts.append(df)
+
+        if parts:
+            entries = pd.concat(parts, ignore_index=True)
+        else:
+            entries = pd.DataFrame({'account': [], 'records': [], 'column_index': []})
+
+        accounts = np.unique(entries['account'].to_numpy(dtype=np.int64))
+        rows = np.searchsorted(accounts, entries['account'].to_numpy(dtype=np.int64))
+        counts = sp.coo_matrix(
+            (entries['records'].to_numpy(dtype=np.int64), (rows, entries['column_index'].to_numpy(dtype=np.int64))),
+            shape=(len(accounts), len(tables))
+        ).tocsr()
+        load_profiles().save()
+        return cls(accounts, tables, counts)
+
+    def save(self):
+        """Persist the matrix (.npz) and labels (.json)"""
+        matrix_path, labels_path = matrix_paths()
+        os.makedirs(os.path.dirname(matrix_path) or '.', exist_ok=True)
+        # Write both files aside and swap them in, so a reader never sees a partial file
+        tmp_matrix = f"{matrix_path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_matrix, accounts=self.accounts, data=self.counts.data,
+                            indices=self.counts.indices, indptr=self.counts.indptr,
+                            shape=np.array(self.counts.shape))
+        tmp_labels = f"{labels_path}.{os.getpid()}.tmp"
+        with open(tmp_labels, 'w') as f:
+            json.dump({'built_at': self.built_at, 'tables': self.tables}, f, indent=2)
+        os.replace(tmp_matrix, matrix_path)
+        os.replace(tmp_labels, labels_path)
+        return matrix_path
+
+    @classmethod
+    def load(cls):
+        """Load a matrix written by save()"""
+        matrix_path, labels_path = matrix_paths()
+        with open(labels_path) as f:
+            labels = json.load(f)
+        with np.load(matrix_path) as data:
+            counts = sp.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                   shape=tuple(data['shape']))
+            return cls(data['accounts'], labels['tables'], counts, labels['built_at'])
+
+    @property
+    def age_hours(self):
+        return (time.time() - self.built_at) / 3600
+
+    def _row(self, account_number):
+        pos = np.searchsorted(self.accounts, account_number)
+        if pos < len(self.accounts) and self.accounts[pos] == account_number:
+            return int(pos)
+        return None
+
+    def _column(self, database_name, table_name):
+        for idx, table in enumerate(self.tables):
+            if table['database'] == database_name and table['table'] == table_name:
+                return idx
+        raise KeyError(f"{database_name}.{table_name} is not in the matrix")
+
+    def lookup(self, account_number, database_name=None):
+        """The account's tables as [{table, column, records}], like scan_database"""
+        row = self._row(account_number)
+        if row is None:
+            return []
+
+        start, end = self.counts.indptr[row], self.counts.indptr[row + 1]
+        found = []
+        for idx, records in zip(self.counts.indices[start:end], self.counts.data[start:end]):
+            table = self.tables[idx]
+            if database_name and table['database'] != database_name:
+                continue
+            found.append({'table': table['table'], 'column': table['column'], 'records': int(records)})
+        return found
+
+    def accounts_in(self, database_name, table_name):
+        """Sorted account numbers with at least one row in a table"""
+        column = self.counts.getcol(self._column(database_name, table_name))
+        return self.accounts[column.nonzero()[0]]
+
+    def missing_from(self, source, target):
+        """Accounts present in the source table but absent from the target
+
+        Both arguments are (database, table) tuples.
+        """
+        return np.setdiff1d(self.accounts_in(*source), self.accounts_in(*target))
+
+def load_or_build(db=None, max_age_hours=None):
+    """Load the persisted matrix, rebuilding it when missing or stale"""
+    max_age_hours = max_age_hours or ACCOUNT_MATRIX_CONFIG['max_age_hours']
+    if all(os.path.exists(path) for path in matrix_paths()):
+        matrix = AccountMatrix.load()
+        if matrix.age_hours < max_age_hours:
+            return matrix
+
+    db = db or DatabaseConnection()
+    matrix = AccountMatrix.build(db)
+    matrix.save()
+    return matrix
+
+def build_matrix():
+    """Rebuild the matrix from both databases and persist it"""
+    db = DatabaseConnection()
+    if not db.test_connections():
+        print("Database connection failed!")
+        return
+
+    start = time.time()
+    matrix = AccountMatrix.build(db)
+    path = matrix.save()
+    print(f"✅ Matrix built in {time.time() - start:.1f}s: {len(matrix.accounts):,} accounts x "
+          f"{len(matrix.tables)} tables, {matrix.counts.nnz:,} non-zero cells")
+    print(f"Saved to: {path}")
+
+def report_account(account_number):
+    """Print the account's tables from the matrix"""
+    matrix = load_or_build()
+    built = datetime.fromtimestamp(matrix.built_at).strftime('%Y-%m-%d %H:%M:%S')
+    print(f"\nACCOUNT MATRIX LOOKUP - Account: {account_number} (matrix built {built})")
+    print("="*80)
+
+    found = False
+    for database_name in dict.fromkeys(table['database'] for table in matrix.tables):
+        rows = matrix.lookup(account_number, database_name)
+        if not rows:
+            continue
+        found = True
+        print(f"\n{database_name}:")
+        for item in sorted(rows, key=lambda x: x['records'], reverse=True):
+            print(f"  {item['table']:<30} | {item['column']:<15} | {item['records']:>6} records")
+
+    if not found:
+        print("\nAccount not found in any table")
+
+def report_missing(source_table, target_table):
+    """Print accounts in a raw table with no rows in a cleaned table"""
+    db = DatabaseConnection()
+    matrix = load_or_build(db)
+    missing = matrix.missing_from((db.raw_db, source_table), (db.cleaned_db, target_table))
+
+    print(f"\nAccounts in {db.raw_db}.{source_table} missing from {db.cleaned_db}.{target_table}: {len(missing):,}")
+    for account in missing[:100]:
+        print(f"  {account}")
+    if len(missing) > 100:
+        print(f"  ... and {len(missing) - 100:,} more")
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+
+    if args and args[0] == 'build':
+        build_matrix()
+        return
+
+    if args and args[0] == 'missing':
+        source = args[1] if len(args) > 1 else 'user_registration'
+        target = args[2] if len(args) > 2 else 'mtiusers'
+        report_missing(source, target)
+        return
+
+    if args:
+        try:
+            account_number = int(args[0])
+        except ValueError:
+            print("Usage: python3 account_matrix.py [build | missing [raw_table] [cleaned_table] | account_number]")
+            return
+    else:
+        account_number = TARGET_ACCOUNT
+        print(f"No account number provided, using default: {account_number}")
+
+    report_account(account_number)
+
+if __name__ == "__main__":
+    main()
@@ -2,39 +2,172 @@
 """
 Account Table Summary - Simple focused analysis
 Get all tables and record counts for any target account
-Usage: python3 account_table_summary.py [account_number]
+Usage: python3 account_table_summary.py [account_number] [--matrix | --bloom] [--check | --no-check]
 """
 
-import pandas as pd
-import sys
+import argparse
 import os
 from datetime import datetime
 from database_connection import DatabaseConnection
+from column_profiler import load_profiles
+from report_model import Report
+from cli import lazy_import, add_connection_arguments, connections_ready
 from config import TARGET_ACCOUNT
 
+pd = lazy_import('pandas')
+
+# Common column names for user/account ID, in order of preference
+ACCOUNT_COLUMNS = ['userid', 'user_id', 'account_id', 'id', 'accountid']
+
 def print_and_log(message, file_handle=None):
     """Print to console and optionally write to file"""
     print(message)
     if file_handle:
         file_handle.write(message + '\n')
 
-def main():
-    """Generate focused table summary for target account"""
-
-    # Get account number from command line or use default
-    if len(sys.argv) > 1:
+def find_account_column(db, table_name, database_name):
+    """Name of the column holding the account number, or None
+
+    A row key such as `id` only qualifies when its column statistics show
+    account numbers (see column_profiler).
+    """
+    return load_profiles().account_column(db, table_name, database_name, ACCOUNT_COLUMNS)
+
+def _indexed(db, table_name, database_name, column):
+    """True when the column leads an index (per DESCRIBE's Key)"""
+    structure = db.get_table_structure(table_name, database_name)
+    key = structure.loc[structure['Field'] == column, 'Key'].iloc[0]
+    return bool(key) and str(key) in ('PRI', 'UNI', 'MUL')
+
+def scan_database(db, database_name, account_number, report_file, label, filters=None):
+    """Count the account's records in every table of one database
+
+    With AccountFilters, tables whose Bloom filter rules the account out
+    are skipped without a query; the filter of a table that grew since it
+    was built (per one batched MAX(id) read) is caught up first.
+    """
+    print_and_log(f"\nScanning {label} DATABASE: {database_name}", report_file)
+    print_and_log("-" * 50, report_file)
+
+    tables = db.get_table_list(database_name)
+    print_and_log(f"Total tables in {label.lower()} database: {len(tables)}", report_file)
+
+    # Highest ids, read once: they show which Bloom filters and column profiles are current
+    profiles = load_profiles()
+    key_columns = profiles.id_columns(database_name)
+    if filters is not None:
+        key_columns.update(filters.key_columns(database_name))
+    watermarks = db.get_table_watermarks(database_name, key_columns)
+    found = []
+    skipped = ruled_out = 0
+    for table_name in tables:
+        if filters is not None and not filters.might_contain(database_name, table_name, account_number,
+                                                             db, watermarks):
+            skipped += 1
+            continue
         try:
-            account_number = int(sys.argv[1])
-        except ValueError:
-            print("Error: Account number must be a valid integer")
-            print("Usage: python3 account_table_summary.py [account_number]")
-            return
-    else:
-        account_number = TARGET_ACCOUNT
-        print(f"No account number provided, using default: {account_number}")
-
-    # Create reports directory
-    reports_dir = "reports"
+            found_column = find_account_column(db, table_name, database_name)
+
+            if found_column and not _indexed(db, table_name, database_name, found_column):
+                # Without an index the COUNT is a full scan; the column's cached range may rule
+                # it out first, but only while the table's highest id matches the profile's
+                if profiles.current_estimate(database_name, table_name, found_column, account_number,
+                                             watermarks.get(table_name)) == 0:
+                    ruled_out += 1
+                    continue
+
+            if found_column:
+                # Count records for target account
+                count_query = f"SELECT COUNT(*) as count FROM `{table_name}` WHERE `{found_column}` = {account_number}"
+                result = db.execute_query(count_query, database_name)
+                count = result['count'].iloc[0]
+
+                if count > 0:
+                    found.append({
+                        'table': table_name,
+                        'column': found_column,
+                        'records': count
+                    })
+                    print_and_log(f"{table_name:<30} | {found_column:<15} | {count:>6} records", report_file)
+
+        except Exception as e:
+            # Skip tables that cause errors (permissions, etc.)
+            continue
+
+    if filters is not None:
+        covered = sum(filters.covers(database_name, table_name) for table_name in tables)
+        print_and_log(f"Bloom filters ruled out {skipped} of {covered} account-keyed tables", report_file)
+    if ruled_out:
+        print_and_log(f"Column statistics ruled out {ruled_out} unindexed tables", report_file)
+    profiles.save()
+    if filters is not None and filters.changed:
+        filters.save()
+    return found
+
+def matrix_scan(matrix, database_name, account_number, report_file, label):
+    """Same result as scan_database, read from a prebuilt account matrix"""
+    built = datetime.fromtimestamp(matrix.built_at).strftime('%Y-%m-%d %H:%M:%S')
+    print_and_log(f"\nScanning {label} DATABASE: {database_name} (account matrix built {built})", report_file)
+    print_and_log("-" * 50, report_file)
+
+    tables = [table for table in matrix.tables if table['database'] == database_name]
+    print_and_log(f"Account-keyed tables in {label.lower()} database: {len(tables)}", report_file)
+
+    found = matrix.lookup(account_number, database_name)
+    for item in found:
+        print_and_log(f"{item['table']:<30} | {item['column']:<15} | {item['records']:>6} records", report_file)
+    return found
+
+def write_summary(account_number, results, report_file):
+    """Summary, per-database breakdowns and tables found in only one database"""
+    print_and_log("\n" + "="*80, report_file)
+    print_and_log("SUMMARY REPORT", report_file)
+    print_and_log("="*80, report_file)
+
+    raw_total = sum(item['records'] for item in results['raw_database'])
+    cleaned_total = sum(item['records'] for item in results['cleaned_database'])
+
+    print_and_log(f"Target Account: {account_number}", report_file)
+    print_and_log(f"Raw Database Tables: {len(results['raw_database'])} tables, {raw_total} total records", report_file)
+    print_and_log(f"Cleaned Database Tables: {len(results['cleaned_database'])} tables, {cleaned_total} total records", report_file)
+    report_file.add_value('raw_tables', len(results['raw_database']))
+    report_file.add_value('raw_records', int(raw_total))
+    report_file.add_value('cleaned_tables', len(results['cleaned_database']))
+    report_file.add_value('cleaned_records', int(cleaned_total))
+
+    print_and_log(f"\nRAW DATABASE BREAKDOWN:", report_file)
+    for item in sorted(results['raw_database'], key=lambda x: x['records'], reverse=True):
+        print_and_log(f"  {item['table']:<30} | {item['column']:<15} | {item['records']:>6} records", report_file)
+
+    print_and_log(f"\nCLEANED DATABASE BREAKDOWN:", report_file)
+    for item in sorted(results['cleaned_database'], key=lambda x: x['records'], reverse=True):
+        print_and_log(f"  {item['table']:<30} | {item['column']:<15} | {item['records']:>6} records", report_file)
+
+    # Identify tables only in one database
+    raw_table_names = {item['table'] for item in results['raw_database']}
+    cleaned_table_names = {item['table'] for item in results['cleaned_database']}
+
+    only_in_raw = raw_table_names - cleaned_table_names
+    only_in_cleaned = cleaned_table_names - raw_table_names
+
+    if only_in_raw:
+        print_and_log(f"\nTables ONLY in RAW database:", report_file)
+        for table in sorted(only_in_raw):
+            records = next(item['records'] for item in results['raw_database'] if item['table'] == table)
+            print_and_log(f"  {table} ({records} records)", report_file)
+
+    if only_in_cleaned:
+        print_and_log(f"\nTables ONLY in CLEANED database:", report_file)
+        for table in sorted(only_in_cleaned):
+            records = next(item['records'] for item in results['cleaned_database'] if item['table'] == table)
+            print_and_log(f"  {table} ({records} records)", report_file)
+
+def summarize_account(account_number, db, reports_dir="reports", matrix=None, filters=None):
+    """Generate the table summary for one account and return the report path
+
+    With an AccountMatrix the counts are looked up instead of queried; with
+    AccountFilters only tables that might hold the account are counted.
+    """
     os.makedirs(reports_dir, exist_ok=True)
 
     # Create report file with timestamp
@@ -43,7 +176,7 @@ def main():
     report_path = os.path.join(reports_dir, report_filename)
 
     # Open report file
-    with open(report_path, 'w') as report_file:
+    with Report('account_summary', account_number, report_path) as report_file:
         # Write header with metadata
         report_file.write(f"Account Table Summary Report\n")
         report_file.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
@@ -54,142 +187,71 @@ def main():
         print_and_log("=" * 80, report_file)
         print_and_log(f"Report will be saved to: {report_path}", report_file)
 
-        db = DatabaseConnection()
-
-        # Check connections first
-        if not db.test_connections():
-            print_and_log("Database connection failed!", report_file)
-            return
-
         print_and_log("\nScanning all tables for account data...", report_file)
         print_and_log("-" * 80, report_file)
 
         # Results storage
-        results = {
-            'raw_database': [],
-            'cleaned_database': []
-        }
-
-        # Scan raw database
-        print_and_log(f"\nScanning RAW DATABASE: {db.raw_db}", report_file)
-        print_and_log("-" * 50, report_file)
-
-        raw_tables = db.get_table_list(db.raw_db)
-        print_and_log(f"Total tables in raw database: {len(raw_tables)}", report_file)
-
-        for table_name in raw_tables:
-            try:
-                # Check common column names for user/account ID
-                structure = db.get_table_structure(table_name, db.raw_db)
-                columns = structure['Field'].str.lower().tolist()
-
-                account_columns = ['userid', 'user_id', 'account_id', 'id', 'accountid']
-                found_column = None
-
-                for col in account_columns:
-                    if col in columns:
-                        found_column = structure[structure['Field'].str.lower() == col]['Field'].iloc[0]
-                        break
-
-                if found_column:
-                    # Count records for target account
-                    count_query = f"SELECT COUNT(*) as count FROM `{table_name}` WHERE `{found_column}` = {account_number}"
-                    result = db.execute_query(count_query, db.raw_db)
-                    count = result['count'].iloc[0]
-
-                    if count > 0:
-                        results['raw_database'].append({
-                            'table': table_name,
-                            'column': found_column,
-                            'records': count
-                        })
-                        print_and_log(f"{table_name:<30} | {found_column:<15} | {count:>6} records", report_file)
-
-            except Exception as e:
-                # Skip tables that cause errors (permissions, etc.)
-                continue
-
-        # Scan cleaned database
-        print_and_log(f"\n Scanning CLEANED DATABASE: {db.cleaned_db}", report_file)
-        print_and_log("-" * 50, report_file)
-
-        cleaned_tables = db.get_table_list(db.cleaned_db)
-        print_and_log(f"Total tables in cleaned database: {len(cleaned_tables)}", report_file)
-
-        for table_name in cleaned_tables:
-            try:
-                # Check common column names for user/account ID
-                structure = db.get_table_structure(table_name, db.cleaned_db)
-                columns = structure['Field'].str.lower().tolist()
-
-                account_columns = ['userid', 'user_id', 'account_id', 'id', 'accountid']
-                found_column = None
-
-                for col in account_columns:
-                    if col in columns:
-                        found_column = structure[structure['Field'].str.lower() == col]['Field'].iloc[0]
-                        break
-
-                if found_column:
-                    # Count records for target account
-                    count_query = f"SELECT COUNT(*) as count FROM `{table_name}` WHERE `{found_column}` = {account_number}"
-                    result = db.execute_query(count_query, db.cleaned_db)
-                    count = result['count'].iloc[0]
-
-                    if count > 0:
-                        results['cleaned_database'].append({
-                            'table': table_name,
-                            'column': found_column,
-                            'records': count
-                        })
-                        print_and_log(f"{table_name:<30} | {found_column:<15} | {count:>6} records", report_file)
-
-            except Exception as e:
-                # Skip tables that cause errors (permissions, etc.)
-                continue
-
-        # Summary
-        print_and_log("\n" + "="*80, report_file)
-        print_and_log("SUMMARY REPORT", report_file)
-        print_and_log("="*80, report_file)
-
-        raw_total = sum(item['records'] for item in results['raw_database'])
-        cleaned_total = sum(item['records'] for item in results['cleaned_database'])
-
-        print_and_log(f"Target Account: {account_number}", report_file)
-        print_and_log(f"Raw Database Tables: {len(results['raw_database'])} tables, {raw_total} total records", report_file)
-        print_and_log(f"Cleaned Database Tables: {len(results['cleaned_database'])} tables, {cleaned_total} total records", report_file)
-
-        print_and_log(f"\nRAW DATABASE BREAKDOWN:", report_file)
-        for item in sorted(results['raw_database'], key=lambda x: x['records'], reverse=True):
-            print_and_log(f"  {item['table']:<30} | {item['column']:<15} | {item['records']:>6} records", report_file)
-
-        print_and_log(f"\nCLEANED DATABASE BREAKDOWN:", report_file)
-        for item in sorted(results['cleaned_database'], key=lambda x: x['records'], reverse=True):
-            print_and_log(f"  {item['table']:<30} | {item['column']:<15} | {item['records']:>6} records", report_file)
-
-        # Identify tables only in one database
-        raw_table_names = {item['table'] for item in results['raw_database']}
-        cleaned_table_names = {item['table'] for item in results['cleaned_database']}
-
-        only_in_raw = raw_table_names - cleaned_table_names
-        only_in_cleaned = cleaned_table_names - raw_table_names
-
-        if only_in_raw:
-            print_and_log(f"\nTables ONLY in RAW database:", report_file)
-            for table in sorted(only_in_raw):
-                records = next(item['records'] for item in results['raw_database'] if item['table'] == table)
-                print_and_log(f"  {table} ({records} records)", report_file)
-
-        if only_in_cleaned:
-            print_and_log(f"\nTables ONLY in CLEANED database:", report_file)
-            for table in sorted(only_in_cleaned):
-                records = next(item['records'] for item in results['cleaned_database'] if item['table'] == table)
-                print_and_log(f"  {table} ({records} records)", report_file)
+        if matrix is not None:
+            results = {
+                'raw_database': matrix_scan(matrix, db.raw_db, account_number, report_file, 'RAW'),
+                'cleaned_database': matrix_scan(matrix, db.cleaned_db, account_number, report_file, 'CLEANED')
+            }
+        else:
+            results = {
+                'raw_database': scan_database(db, db.raw_db, account_number, report_file, 'RAW', filters),
+                'cleaned_database': scan_database(db, db.cleaned_db, account_number, report_file, 'CLEANED',
+                                                  filters)
+            }
+
+        for key, items in results.items():
+            report_file.add_table(key, pd.DataFrame(items, columns=['table', 'column', 'records']))
+        write_summary(account_number, results, report_file)
 
         # Final message
         print_and_log(f"\n Report saved to: {report_path}", report_file)
         print_and_log("Analysis complete!", report_file)
 
+    return report_path
+
+def main():
+    """Generate focused table summary for target account"""
+
+    parser = argparse.ArgumentParser(description="Tables and record counts for one account in both databases")
+    parser.add_argument('account_number', nargs='?', type=int, help=f"Account number (default: {TARGET_ACCOUNT})")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--matrix', action='store_true', help="Read counts from the prebuilt account matrix")
+    source.add_argument('--bloom', action='store_true',
+                        help="Only count tables whose Bloom filter might contain the account")
+    add_connection_arguments(parser)
+    args = parser.parse_args()
+
+    # Get account number from command line or use default
+    account_number = args.account_number
+    if account_number is None:
+        account_number = TARGET_ACCOUNT
+        print(f"No account number provided, using default: {account_number}")
+
+    db = DatabaseConnection()
+
+    # Check connections first (skipped if a recent check passed)
+    if not connections_ready(db, args.connection_check):
+        print("Database connection failed!")
+        return
+
+    # Imported here: account_matrix and bloom_filters reuse find_account_column from this module
+    matrix = filters = None
+    if args.matrix:
+        from account_matrix import load_or_build
+        matrix = load_or_build(db)
+    elif args.bloom:
+        from bloom_filters import load_and_refresh
+        filters = load_and_refresh(db)
+
+    summarize_account(account_number, db, matrix=matrix, filters=filters)
+
+    profile_path = db.write_query_profile(f"account_summary_{account_number}")
+    if profile_path:
+        print(f"Query profile saved to: {profile_path}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Activity Features - Per-user time-of-activity features for every account
+Streams visitor and credit_debit once, bucketing each event by hour of day,
+day of week and calendar hour, and keeps one compact row per user: hourly
+and weekday histograms, business-hours / off-hours / weekend ratios, active
+days and the busiest single hour (see ANOMALY_THRESHOLDS)
+Usage:
+    python3 activity_features.py build
+    python3 activity_features.py export [csv_path]
+    python3 activity_features.py [user_id]
+"""
+
+import sys
+import os
+import threading
+import time
+from database_connection import DatabaseConnection
+from cli import lazy_import
+from config import TARGET_ACCOUNT, CACHE_CONFIG, ACTIVITY_CONFIG, ANOMALY_THRESHOLDS
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+COUNT_FIELDS = ['events', 'business_hours', 'weekend', 'active_days', 'peak_hour_events']
+
+_loaded = {}
+_load_lock = threading.Lock()
+
+def features_path():
+    """Location of the persisted feature table"""
+    return os.path.join(CACHE_CONFIG['directory'], ACTIVITY_CONFIG['features_file'])
+
+def _resolve_columns(db, source):
+    """(table, user column, time column) actually present for a source"""
+    settings = ACTIVITY_CONFIG['sources'][source]
+    structure = db.get_table_structure(settings['table'], db.raw_db)
+    fields = {name.lower(): name for name in structure['Field']}
+    user_column = next((fields[col] for col in settings['user_columns'] if col in fields), None)
+    time_column = next((fields[col] for col in settings['time_columns'] if col in fields), None)
+    if not user_column or not time_column:
+        raise ValueError(f"{settings['table']} has no usable user/time columns")
+    return settings['table'], user_column, time_column
+
+class SourceFeatures:
+    """Activity arrays for one source table, rows sorted by user_id
+
+    hourly is users x 24 (hour of day), daily is users x 7 (Monday first),
+    counts is users x len(COUNT_FIELDS).
+    """
+
+    def __init__(self, user_ids, hourly, daily, counts, first_seen, last_seen):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.hourly = np.asarray(hourly, dtype=np.uint32)
+        self.daily = np.asarray(daily, dtype=np.uint32)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.first_seen = np.asarray(first_seen, dtype='datetime64[s]')
+        self.last_seen = np.asarray(last_seen, dtype='datetime64[s]')
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def build(cls, db, source):
+        """Stream the source table and aggregate its events per user"""
+        table, user_column, time_column = _resolve_columns(db, source)
+        start_hour = ANOMALY_THRESHOLDS['business_hours_start']
+        end_hour = ANOMALY_THRESHOLDS['business_hours_end']
+
+        hour_parts, day_parts, bucket_parts, date_parts, span_parts = [], [], [], [], []
+        for chunk in db.iter_table_chunks(table, db.raw_db, columns=[user_column, time_column],
+                                          chunksize=ACTIVITY_CONFIG['chunksize'], schema=table):
+            users = pd.to_numeric(chunk[user_column], errors='coerce')
+            times = pd.to_datetime(chunk[time_column], errors='coerce')
+            valid = users.notna() & times.notna()
+            if not valid.any():
+                continue
+            events = pd.DataFrame({'user_id': users[valid].astype(np.int64), 'time': times[valid]})
+
+            # Histograms add up across chunks, so only the partial tables are kept
+            hour_parts.append(pd.crosstab(events['user_id'], events['time'].dt.hour))
+            day_parts.append(pd.crosstab(events['user_id'], events['time'].dt.dayofweek))
+            bucket_parts.append(events.groupby(['user_id', events['time'].dt.floor('h')]).size())
+            date_parts.append(events.groupby(['user_id', events['time'].dt.normalize()]).size())
+            span_parts.append(events.groupby('user_id')['time'].agg(['min', 'max']))
+
+        if not hour_parts:
+            empty = np.zeros((0,), dtype=np.int64)
+            return cls(empty, np.zeros((0, 24)), np.zeros((0, 7)), np.zeros((0, len(COUNT_FIELDS))),
+                       empty.astype('datetime64[s]'), empty.astype('datetime64[s]'))
+
+        hourly = (pd.concat(hour_parts).groupby(level=0).sum()
+                  .reindex(columns=range(24), fill_value=0).fillna(0))
+        user_ids = hourly.index.to_numpy()
+        daily = (pd.concat(day_parts).groupby(level=0).sum()
+                 .reindex(index=user_ids, columns=range(7), fill_value=0).fillna(0))
+
+        # A calendar hour or day can straddle two chunks, so regroup before counting
+        buckets = pd.concat(bucket_parts).groupby(level=[0, 1]).sum()
+        peak = buckets.groupby(level=0).max().reindex(user_ids, fill_value=0)
+        dates = pd.concat(date_parts).groupby(level=[0, 1]).sum()
+        active_days = dates.groupby(level=0).size().reindex(user_ids, fill_value=0)
+        spans = pd.concat(span_parts).groupby(level=0).agg({'min': 'min', 'max': 'max'}).reindex(user_ids)
+
+        hourly = hourly.to_numpy()
+        daily = daily.to_numpy()
+        counts = np.column_stack([
+            hourly.sum(axis=1),
+            hourly[:, start_hour:end_hour].sum(axis=1),
+            daily[:, 5:].sum(axis=1),
+            active_days.to_numpy(),
+            peak.to_numpy()
+        ])
+        return cls(user_ids, hourly, daily, counts,
+                   spans['min'].to_numpy(dtype='datetime64[s]'),
+                   spans['max'].to_numpy(dtype='datetime64[s]'))
+
+    def position(self, user_id):
+        """Row of a user, or None if they have no activity in this source"""
+        pos = np.searchsorted(self.user_ids, user_id)
+        if pos < len(self.user_ids) and self.user_ids[pos] == user_id:
+            return pos
+        return None
+
+    def to_frame(self, source):
+        """One row per user with ratios, flags and both histograms"""
+        counts = pd.DataFrame(self.counts, columns=COUNT_FIELDS)
+        events = counts['events'].where(counts['events'] > 0)
+        df = pd.DataFrame({'user_id': self.user_ids, 'source': source})
+        df = pd.concat([df, counts], axis=1)
+        df['first_seen'] = self.first_seen
+        df['last_seen'] = self.last_seen
+        df['business_hours_ratio'] = (counts['business_hours'] / events).fillna(0.0).round(4)
+        df['off_hours_ratio'] = ((counts['events'] - counts['business_hours']) / events).fillna(0.0).round(4)
+        df['weekend_ratio'] = (counts['weekend'] / events).fillna(0.0).round(4)
+        df['weekend_flag'] = counts['weekend'] > 0 if ANOMALY_THRESHOLDS['weekend_transaction_flag'] else False
+        df['frequency_flag'] = counts['peak_hour_events'] > ANOMALY_THRESHOLDS['frequency_threshold']
+        hourly = pd.DataFrame(self.hourly, columns=[f"h{hour:02d}" for hour in range(24)])
+        daily = pd.DataFrame(self.daily, columns=[f"d_{day}" for day in WEEKDAYS])
+        return pd.concat([df, hourly, daily], axis=1)
+
+class ActivityFeatures:
+    """SourceFeatures for every configured source, built and stored together"""
+
+    def __init__(self, sources, built_at=None):
+        self.sources = sources
+        self.built_at = built_at or time.time()
+
+    @classmethod
+    def build(cls, db):
+        sources = {}
+        for source in ACTIVITY_CONFIG['sources']:
+            try:
+                sources[source] = SourceFeatures.build(db, source)
+                print(f"✓ {source}: {len(sources[source]):,} users")
+            except Exception as e:
+                print(f"✗ {source}: {str(e)}")
+        return cls(sources)
+
+    def save(self, path=None):
+        """Persist every source's arrays to one compressed .npz file"""
+        path = path or features_path()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        arrays = {'built_at': np.array([self.built_at]), 'sources': np.array(list(self.sources))}
+        for source, features in self.sources.items():
+            arrays.update({
+                f"{source}__user_ids": features.user_ids,
+                f"{source}__hourly": features.hourly,
+                f"{source}__daily": features.daily,
+                f"{source}__counts": features.counts,
+                f"{source}__first_seen": features.first_seen.astype(np.int64),
+                f"{source}__last_seen": features.last_seen.astype(np.int64),
+            })
+        # Per-process name: batch workers may save the same features at once
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        """Load features written by save()"""
+        with np.load(path or features_path()) as data:
+            sources = {
+                str(source): SourceFeatures(
+                    data[f"{source}__user_ids"], data[f"{source}__hourly"], data[f"{source}__daily"],
+                    data[f"{source}__counts"],
+                    data[f"{source}__first_seen"].astype('datetime64[s]'),
+                    data[f"{source}__last_seen"].astype('datetime64[s]'))
+                for source in data['sources']
+            }
+            return cls(sources, float(data['built_at'][0]))
+
+    def to_frame(self):
+        """Feature table for every user and source"""
+        frames = [features.to_frame(source) for source, features in self.sources.items()]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def for_user(self, user_id):
+        """Feature rows for one user (one per source with activity)"""
+        rows = []
+        for source, features in self.sources.items():
+            pos = features.position(user_id)
+            if pos is not None:
+                single = SourceFeatures(features.user_ids[pos:pos + 1], features.hourly[pos:pos + 1],
+                                        features.daily[pos:pos + 1], features.counts[pos:pos + 1],
+                                        features.first_seen[pos:pos + 1], features.last_seen[pos:pos + 1])
+                rows.append(single.to_frame(source))
+        if not rows:
+            return pd.DataFrame()
+        return pd.concat(rows, ignore_index=True)
+
+def load_or_build(db=None):
+    """Load the persisted features, rebuilding them when missing or stale"""
+    path = features_path()
+    with _load_lock:
+        if os.path.exists(path):
+            key = (path, os.path.getmtime(path))
+            # Empty features are falsy (__len__), so test for a cache miss explicitly
+            features = _loaded.get(key)
+            if features is None:
+                features = ActivityFeatures.load(path)
+            if time.time() - features.built_at < ACTIVITY_CONFIG['max_age_hours'] * 3600:
+                _loaded.clear()
+                _loaded[key] = features
+                return features
+
+        db = db or DatabaseConnection()
+        features = ActivityFeatures.build(db)
+        features.save(path)
+        _loaded.clear()
+        _loaded[(path, os.path.getmtime(path))] = features
+        return features
+
+def report_user(user_id):
+    """Print one user's activity features"""
+    features = load_or_build()
+    rows = features.for_user(user_id)
+    if rows.empty:
+        print(f"No visitor or credit_debit activity recorded for user {user_id}")
+        return
+
+    for row in rows.to_dict('records'):
+        print(f"\n{row['source']} ({row['events']:,} events, {row['first_seen']} to {row['last_seen']})")
+        print("-" * 60)
+        print(f"Active days:          {row['active_days']:,}")
+        print(f"Busiest hour:         {row['peak_hour_events']:,} events"
+              f"{'  🔴 above frequency threshold' if row['frequency_flag'] else ''}")
+        print(f"Business hours:       {row['business_hours_ratio']:.1%}")
+        print(f"Off hours:            {row['off_hours_ratio']:.1%}")
+        print(f"Weekend:              {row['weekend_ratio']:.1%}{'  🟡 weekend activity' if row['weekend_flag'] else ''}")
+        print("Hour of day:          " + " ".join(str(row[f"h{hour:02d}"]) for hour in range(24)))
+        print("Day of week:          " + " ".join(f"{day}={row[f'd_{day}']}" for day in WEEKDAYS))
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+
+    if args and args[0] == 'build':
+        db = DatabaseConnection()
+        if not db.test_connections():
+            print("Database connection failed!")
+            return
+        start = time.time()
+        features = ActivityFeatures.build(db)
+        path = features.save()
+        print(f"✅ Activity features built in {time.time() - start:.1f}s")
+        print(f"Saved to: {path}")
+        return
+
+    if args and args[0] == 'export':
+        path = args[1] if len(args) > 1 else os.path.join(CACHE_CONFIG['directory'], 'activity_features.csv')
+        table = load_or_build().to_frame()
+        table.to_csv(path, index=False)
+        print(f"✅ Exported {len(table):,} feature rows to {path}")
+        return
+
+    if args:
+        try:
+            user_id = int(args[0])
+        except ValueError:
+            print("Usage: python3 activity_features.py [build | export [csv_path] | user_id]")
+            return
+    else:
+        user_id = TARGET_ACCOUNT
+        print(f"No user ID provided, using default: {user_id}")
+
+    report_user(user_id)
+
+if __name__ == "__main__":
+    main()
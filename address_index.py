@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Shared Wallet Address Index
+Inverted index from normalized wallet address to the user_ids that use it,
+built from user_addresses and the withdrawal tables and refreshed incrementally
+Usage:
+    python3 address_index.py build
+    python3 address_index.py refresh
+    python3 address_index.py <address | user_id>
+"""
+
+import json
+import re
+import sys
+import os
+import threading
+from datetime import datetime
+from database_connection import DatabaseConnection
+from cli import lazy_import
+from config import CACHE_CONFIG, ADDRESS_INDEX_CONFIG, ROUTING_CONFIG
+
+pd = lazy_import('pandas')
+
+# Loaded index, so repeated profiles in one process skip the JSON parse
+_loaded = {}
+_load_lock = threading.Lock()
+
+ADDRESS_PATTERN = re.compile(r'^[A-Za-z0-9]{20,120}$')
+CASE_INSENSITIVE_PREFIXES = ('bc1', 'tb1', 'ltc1', '0x')
+
+def index_path():
+    """Location of the persisted index file"""
+    return os.path.join(CACHE_CONFIG['directory'], ADDRESS_INDEX_CONFIG['index_file'])
+
+def normalize_address(value):
+    """Canonical form of a wallet address, or None for placeholders/free text
+
+    Base58 addresses are case sensitive and kept as-is; bech32 and hex
+    (0x...) addresses are case insensitive and lowercased. Payment URIs
+    such as 'bitcoin:<address>?amount=1' are reduced to the address.
+    """
+    if value is None:
+        return None
+
+    address = str(value).strip()
+    if address in ADDRESS_INDEX_CONFIG['placeholder_values']:
+        return None
+
+    if ':' in address:
+        address = address.split(':', 1)[1]
+    address = address.split('?', 1)[0].strip()
+
+    if not ADDRESS_PATTERN.match(address):
+        return None
+
+    if address.lower().startswith(CASE_INSENSITIVE_PREFIXES):
+        address = address.lower()
+    return address
+
+class AddressIndex:
+    """Normalized address -> {user_id: [source columns]}"""
+
+    def __init__(self, postings=None, watermarks=None):
+        self.postings = postings or {}
+        self.watermarks = watermarks or {}
+        self._by_user = None
+        # Lookups from service threads wait while refresh() rewrites postings
+        self._lock = threading.RLock()
+
+    def users_for(self, address):
+        """Users that have used this address, with where it was seen"""
+        normalized = normalize_address(address)
+        if normalized is None:
+            return {}
+        with self._lock:
+            return {int(uid): list(roles) for uid, roles in self.postings.get(normalized, {}).items()}
+
+    def addresses_for(self, user_id):
+        """All indexed addresses belonging to one user"""
+        with self._lock:
+            if self._by_user is None:
+                self._by_user = {}
+                for address, users in self.postings.items():
+                    for uid in users:
+                        self._by_user.setdefault(uid, set()).add(address)
+            return sorted(self._by_user.get(str(user_id), set()))
+
+    def shared_with(self, user_id, addresses=None):
+        """Other users sharing any of this user's addresses
+
+        Returns {other_user_id: [(address, roles), ...]}.
+        """
+        with self._lock:
+            if addresses is None:
+                addresses = self.addresses_for(user_id)
+
+            linked = {}
+            for address in addresses:
+                normalized = normalize_address(address)
+                for uid, roles in self.users_for(normalized).items():
+                    if uid != int(user_id):
+                        linked.setdefault(uid, []).append((normalized, roles))
+            return linked
+
+    def _add(self, address, user_id, role):
+        roles = self.postings.setdefault(address, {}).setdefault(str(user_id), [])
+        if role not in roles:
+            roles.append(role)
+        if self._by_user is not None:
+            self._by_user.setdefault(str(user_id), set()).add(address)
+
+    def _add_rows(self, chunk, table, user_column, address_columns):
+        for col in address_columns:
+            role = f"{table}.{col}"
+            for uid, value in zip(chunk[user_column], chunk[col]):
+                address = normalize_address(value)
+                if address is None or pd.isna(uid):
+                    continue
+                self._add(address, int(uid), role)
+
+    def _remove_user_roles(self, user_id, roles_to_remove):
+        """Drop a user's postings for some roles (used when a row is edited)"""
+        uid = str(user_id)
+        for address in self.addresses_for(user_id):
+            roles = self.postings[address].get(uid, [])
+            roles[:] = [role for role in roles if role not in roles_to_remove]
+            if not roles:
+                del self.postings[address][uid]
+                self._by_user[uid].discard(address)
+            if not self.postings[address]:
+                del self.postings[address]
+
+    def _reindex_users(self, db, table, user_column, address_columns, key_column, user_ids, chunksize):
+        """Replace some users' postings from one table with all of their rows there
+
+        Every row is read before any posting is dropped, so postings from
+        rows that did not change survive. Returns the number of rows read.
+        """
+        chunks = []
+        batch_size = ADDRESS_INDEX_CONFIG['reindex_batch_users']
+        for start in range(0, len(user_ids), batch_size):
+            batch = ", ".join(str(uid) for uid in user_ids[start:start + batch_size])
+            chunks.extend(db.iter_table_chunks(table, db.raw_db, columns=[user_column] + address_columns,
+                                               key_column=key_column, chunksize=chunksize,
+                                               where=f"`{user_column}` IN ({batch})",
+                                               roles=ROUTING_CONFIG['read_roles']))
+
+        roles = {f"{table}.{col}" for col in address_columns}
+        for uid in user_ids:
+            self._remove_user_roles(uid, roles)
+        for chunk in chunks:
+            self._add_rows(chunk, table, user_column, address_columns)
+        return sum(len(chunk) for chunk in chunks)
+
+    def refresh(self, db, chunksize=None):
+        """Scan rows past each source's watermark and merge them in
+
+        The first call (empty watermarks) is a full build. For sources with
+        an edit watermark (a timestamp next to the id), the users of changed
+        rows have all of their rows in that table re-read, and their
+        postings from it are replaced. Returns the number of rows read.
+        """
+        chunksize = chunksize or CACHE_CONFIG['chunk_size']
+        rows_read = 0
+
+        with self._lock:
+            for table, source in ADDRESS_INDEX_CONFIG['sources'].items():
+                try:
+                    structure = db.get_table_structure(table, db.raw_db)
+                except Exception as e:
+                    print(f"✗ Skipping {table}: {str(e)}")
+                    continue
+
+                fields = {name.lower(): name for name in structure['Field']}
+                user_column = fields.get(source['user_column'].lower())
+                address_columns = [fields[col.lower()] for col in source['address_columns'] if col.lower() in fields]
+                watermark_columns = [fields[col.lower()] for col in source['watermark_columns'] if col.lower() in fields]
+                if not user_column or not address_columns or 'id' not in fields:
+                    print(f"✗ Skipping {table}: expected columns not found")
+                    continue
+
+                key_column = fields['id']
+                previous = self.watermarks.get(table, {})
+                conditions = []
+                for col in watermark_columns:
+                    if previous.get(col) is None:
+                        continue
+                    if col == key_column:
+                        conditions.append(f"`{col}` > {previous[col]}")
+                    else:
+                        conditions.append(f"`{col}` > '{previous[col]}'")
+                where = " OR ".join(conditions) if conditions else None
+                # Edited rows can replace addresses the index already holds
+                edits = bool(previous) and len(watermark_columns) > 1
+                # A catch-up must not read from a snapshot older than the rows already indexed
+                roles = ROUTING_CONFIG['read_roles'] if previous else None
+
+                latest = dict(previous)
+                changed_users = set()
+                for chunk in db.iter_table_chunks(table, db.raw_db,
+                                                  columns=[user_column] + address_columns + watermark_columns,
+                                                  key_column=key_column, chunksize=chunksize, where=where,
+                                                  roles=roles):
+                    rows_read += len(chunk)
+                    if edits:
+                        changed_users.update(int(uid) for uid in chunk[user_column].dropna().unique())
+                    else:
+                        self._add_rows(chunk, table, user_column, address_columns)
+
+                    for col in watermark_columns:
+                        chunk_max = chunk[col].max()
+                        if pd.isna(chunk_max):
+                            continue
+                        chunk_max = int(chunk_max) if col == key_column else str(chunk_max)
+                        if latest.get(col) is None or chunk_max > latest[col]:
+                            latest[col] = chunk_max
+
+                if changed_users:
+                    rows_read += self._reindex_users(db, table, user_column, address_columns, key_column,
+                                                     sorted(changed_users), chunksize)
+                self.watermarks[table] = latest
+
+        return rows_read
+
+    def save(self, path=None):
+        """Persist the index and watermarks as JSON"""
+        path = path or index_path()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        payload = {
+            'generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'watermarks': self.watermarks,
+            'postings': self.postings
+        }
+        # Per-process name: batch workers may save the same index at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with self._lock, open(tmp_path, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        """Load an index written by save()"""
+        with open(path or index_path()) as f:
+            payload = json.load(f)
+        return cls(payload['postings'], payload['watermarks'])
+
+def load_and_refresh(db):
+    """Load the persisted index, catch it up with new rows and save it"""
+    path = index_path()
+    with _load_lock:
+        index = _loaded.get(path)
+        if index is None:
+            index = AddressIndex.load(path) if os.path.exists(path) else AddressIndex()
+        if index.refresh(db):
+            index.save(path)
+        _loaded[path] = index
+        return index
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python3 address_index.py [build | refresh | <address> | <user_id>]")
+        return
+
+    if args[0] in ('build', 'refresh'):
+        db = DatabaseConnection()
+        if not db.test_connections():
+            print("Database connection failed!")
+            return
+
+        if args[0] == 'build' or not os.path.exists(index_path()):
+            index = AddressIndex()
+        else:
+            index = AddressIndex.load()
+
+        rows = index.refresh(db)
+        path = index.save()
+        shared = sum(1 for users in index.postings.values() if len(users) > 1)
+        print(f"✅ Indexed {rows:,} new row(s): {len(index.postings):,} addresses, {shared:,} shared by 2+ users")
+        print(f"Saved to: {path}")
+        return
+
+    if not os.path.exists(index_path()):
+        print("No address index found. Run: python3 address_index.py build")
+        return
+    index = AddressIndex.load()
+
+    if args[0].isdigit():
+        user_id = int(args[0])
+        print(f"Addresses for user {user_id}:")
+        for address in index.addresses_for(user_id):
+            print(f"  {address}")
+        linked = index.shared_with(user_id)
+        print(f"\nUsers sharing an address with {user_id}: {len(linked)}")
+        for uid, shared in sorted(linked.items()):
+            for address, roles in shared:
+                print(f"  User ID: {uid} | {address} | {', '.join(roles)}")
+    else:
+        users = index.users_for(args[0])
+        print(f"Users for address {args[0]}: {len(users)}")
+        for uid, roles in sorted(users.items()):
+            print(f"  User ID: {uid} | {', '.join(roles)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Analysis Service - Serve account summaries, wallet analyses and profiles over HTTP
+Keeps one warm DatabaseConnection (engine pools, schema catalog) and the
+prebuilt indexes in memory, runs a bounded number of analyses at once and
+rejects requests with 503 once its queue is full
+Usage:
+    python3 analysis_service.py [--host 127.0.0.1] [--port 8765] [--workers 4] [--queue-size 16]
+
+Endpoints (GET, JSON responses):
+    /summary?account=88295329   account_table_summary
+    /wallet?user_id=88295329    wallet_analysis
+    /profile?user_id=88295329   build_user_profile
+    /health                     database reachability
+    /stats                      queue, cache and query statistics
+Add refresh=1 to re-run an analysis instead of serving a cached result.
+Only schema lookups are cached on the connection, so a re-run reads the
+account's current rows.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from database_connection import DatabaseConnection
+from account_table_summary import summarize_account
+from wallet_analysis import run_wallet_analysis
+from build_user_profile import build_profile
+from logging_utils import get_logger
+from config import SERVICE_CONFIG
+
+ANALYSES = {
+    '/summary': ('summary', summarize_account),
+    '/wallet': ('wallet', run_wallet_analysis),
+    '/profile': ('profile', build_profile),
+}
+
+logger = get_logger('analysis_service')
+
+class ServiceBusy(Exception):
+    """Raised when every worker is busy and the queue is full"""
+
+class _ThreadOutput:
+    """sys.stdout stand-in: request threads write to their own buffer
+
+    The analyses print progress to the console; in the service that output
+    is per request and would otherwise interleave across threads.
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
+
+    def write(self, text):
+        target = getattr(self.local, 'buffer', None)
+        return (target or self.original).write(text)
+
+    def flush(self):
+        target = getattr(self.local, 'buffer', None)
+        (target or self.original).flush()
+
+class AnalysisService:
+    """Shared state behind the HTTP handler: connection, queue and result cache"""
+
+    def __init__(self, db=None, workers=None, queue_size=None):
+        self.db = db or DatabaseConnection()
+        self.workers = workers or SERVICE_CONFIG['workers']
+        self.queue_size = SERVICE_CONFIG['queue_size'] if queue_size is None else queue_size
+        self.reports_dir = SERVICE_CONFIG['reports_directory']
+        self.output = None  # _ThreadOutput installed by serve()
+        self.started = time.time()
+
+        # Admission covers running + waiting requests; workers covers running ones
+        self._admission = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._running = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self.stats = {'requests': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'cache_hits': 0,
+                      'in_flight': 0, 'waiting': 0, 'seconds': {}}
+
+    def warm(self, indexes=True):
+        """Load libraries, schema catalog and cached indexes before serving"""
+        print("Warming up...")
+        if not self.db.test_connections():
+            return False
+        for database_name in [self.db.raw_db, self.db.cleaned_db]:
+            for table_name in self.db.get_table_list(database_name):
+                self.db.get_table_structure(table_name, database_name)
+        if indexes:
+            from address_index import load_and_refresh
+            from ip_index import load_or_build as load_ip_index
+            from fuzzy_matching import load_or_build as load_fuzzy_matcher
+            from transaction_classifier import load_and_refresh as load_categories
+            for name, load in [('address index', load_and_refresh), ('IP index', load_ip_index),
+                               ('fuzzy blocking table', load_fuzzy_matcher),
+                               ('transaction categories', load_categories)]:
+                try:
+                    load(self.db)
+                    print(f"✓ {name} loaded")
+                except Exception as e:
+                    print(f"✗ {name}: {str(e)}")
+        # Lazy modules must finish importing before request threads share them
+        import numpy, pandas
+        _ = (numpy.__version__, pandas.__version__)
+        return True
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > SERVICE_CONFIG['result_ttl_seconds']:
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            return entry[1]
+
+    def _remember(self, key, payload):
+        with self._lock:
+            self._results[key] = (time.time(), payload)
+            self._results.move_to_end(key)
+            while len(self._results) > SERVICE_CONFIG['result_cache_entries']:
+                self._results.popitem(last=False)
+
+    def _count(self, field, delta=1):
+        with self._lock:
+            self.stats[field] += delta
+
+    def run(self, kind, runner, account, refresh=False):
+        """Result payload for one analysis, from cache or by running it
+
+        Only whole payloads are cached here; the analyses' data queries
+        always go to the database, so refresh=True sees new rows at once.
+        """
+        self._count('requests')
+        key = (kind, account)
+        if not refresh:
+            payload = self._cached(key)
+            if payload is not None:
+                self._count('cache_hits')
+                return dict(payload, cached=True)
+
+        if not self._admission.acquire(blocking=False):
+            self._count('rejected')
+            raise ServiceBusy()
+        try:
+            self._count('waiting')
+            with self._running:
+                self._count('waiting', -1)
+                self._count('in_flight')
+                try:
+                    payload = self._execute(kind, runner, account)
+                finally:
+                    self._count('in_flight', -1)
+        finally:
+            self._admission.release()
+
+        self._remember(key, payload)
+        self._maybe_write_profile()
+        return dict(payload, cached=False)
+
+    def _execute(self, kind, runner, account):
+        """Run an analysis with its console output captured"""
+        start = time.perf_counter()
+        if self.output:
+            self.output.local.buffer = io.StringIO()
+        try:
+            report_path = runner(account, self.db, self.reports_dir)
+        except Exception:
+            self._count('failed')
+            raise
+        finally:
+            if self.output:
+                self.output.local.buffer = None
+        seconds = round(time.perf_counter() - start, 3)
+
+        with self._lock:
+            self.stats['completed'] += 1
+            self.stats['seconds'].setdefault(kind, []).append(seconds)
+            self.stats['seconds'][kind] = self.stats['seconds'][kind][-100:]
+
+        payload = {'analysis': kind, 'account': account, 'seconds': seconds,
+                   'generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                   'report_path': report_path}
+        json_path = os.path.splitext(report_path)[0] + '.json'
+        if os.path.exists(json_path):
+            with open(json_path) as f:
+                payload['result'] = json.load(f)
+        else:
+            with open(report_path) as f:
+                payload['text'] = f.read()
+        return payload
+
+    def _maybe_write_profile(self):
+        """Keep the long-running query profile bounded"""
+        every = SERVICE_CONFIG['profile_every_requests']
+        if every and self.stats['completed'] % every == 0 and self.db.profiler:
+            self.db.write_query_profile('analysis_service')
+
+    def health(self):
+        """Database reachability, checked with a fresh round trip"""
+        status = {'uptime_seconds': round(time.time() - self.started, 1)}
+        try:
+            with self.db.engine(self.db.raw_db).connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+            status['status'] = 'ok'
+        except Exception as e:
+            status['status'] = 'unavailable'
+            status['error'] = str(e)
+        return status
+
+    def snapshot(self):
+        """Counters, per-analysis latency and the slowest query shapes"""
+        with self._lock:
+            stats = {k: v for k, v in self.stats.items() if k != 'seconds'}
+            latency = {kind: {'runs': len(values), 'mean': round(sum(values) / len(values), 3),
+                              'max': max(values)}
+                       for kind, values in self.stats['seconds'].items() if values}
+            cached_results = len(self._results)
+        stats.update({
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'cached_results': cached_results,
+            'latency_seconds': latency,
+            'query_cache_entries': len(self.db.result_cache),
+            'schema_cache_entries': len(self.db.schema_cache),
+            'endpoints': self.db.router.status(),
+            'governors': {name: governor.status() for name, governor in self.db.governors.items()},
+        })
+        if self.db.profiler:
+            stats['queries'] = self.db.profiler.summary(top_n=5)
+        return stats
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """GET-only JSON API over an AnalysisService"""
+
+    server_version = "AnalysisService/1.0"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        service = self.server.service
+
+        if url.path == '/health':
+            status = service.health()
+            return self._send_json(200 if status['status'] == 'ok' else 503, status)
+        if url.path == '/stats':
+            return self._send_json(200, service.snapshot())
+        if url.path not in ANALYSES:
+            return self._send_json(404, {'error': f"Unknown endpoint {url.path}",
+                                         'endpoints': list(ANALYSES) + ['/health', '/stats']})
+
+        value = (params.get('account') or params.get('user_id') or [None])[0]
+        try:
+            account = int(value)
+        except (TypeError, ValueError):
+            return self._send_json(400, {'error': "account (or user_id) must be an integer"})
+        refresh = (params.get('refresh') or ['0'])[0] in ('1', 'true', 'yes')
+
+        kind, runner = ANALYSES[url.path]
+        try:
+            payload = service.run(kind, runner, account, refresh)
+        except ServiceBusy:
+            return self._send_json(503, {'error': "Service busy, try again shortly"}, {'Retry-After': '5'})
+        except Exception as e:
+            logger.exception(f"{kind} {account} failed")
+            return self._send_json(500, {'error': f"{type(e).__name__}: {e}"})
+        self._send_json(200, payload)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+def serve(host=None, port=None, workers=None, queue_size=None, warm_indexes=True, db=None):
+    """Warm up and serve until interrupted"""
+    sys.stdout = _ThreadOutput(sys.stdout)
+    service = AnalysisService(db=db, workers=workers, queue_size=queue_size)
+    service.output = sys.stdout
+    if not service.warm(indexes=warm_indexes):
+        print("Database connection failed!")
+        return
+
+    server = ThreadingHTTPServer((host or SERVICE_CONFIG['host'], port or SERVICE_CONFIG['port']),
+                                 AnalysisRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+
+    address = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    print(f"🚀 Analysis service listening on {address} "
+          f"({service.workers} workers, queue {service.queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        if service.db.profiler:
+            service.db.write_query_profile('analysis_service')
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Serve analyses over a local HTTP API")
+    parser.add_argument('--host', default=SERVICE_CONFIG['host'])
+    parser.add_argument('--port', type=int, default=SERVICE_CONFIG['port'])
+    parser.add_argument('--workers', type=int, default=SERVICE_CONFIG['workers'])
+    parser.add_argument('--queue-size', type=int, default=SERVICE_CONFIG['queue_size'])
+    parser.add_argument('--no-warm-indexes', action='store_true',
+                        help="Skip loading the address/IP/fuzzy/category indexes at startup")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, args.queue_size, not args.no_warm_indexes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# arrow_fetch.py - Columnar fetch path: result sets decoded straight into Arrow
+import importlib.util
+from cli import lazy_import
+from config import QUERY_CONFIG
+
+pd = lazy_import('pandas')
+
+FETCH_MODES = ('pandas', 'arrow', 'pandas_arrow')
+
+_warned = set()
+
+def _skip_once(key, message):
+    """Print a fallback note once per process"""
+    if key not in _warned:
+        _warned.add(key)
+        print(f"✗ {message}")
+
+def arrow_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+def connectorx_available():
+    return importlib.util.find_spec('connectorx') is not None
+
+def resolve_fetch_mode(fetch_mode):
+    """Fetch mode to actually use, given what is installed
+
+    'arrow' cannot be honoured without pyarrow and raises; 'pandas_arrow'
+    falls back to plain pandas with a note so bulk jobs keep running.
+    """
+    fetch_mode = fetch_mode or QUERY_CONFIG['fetch_mode']
+    if fetch_mode not in FETCH_MODES:
+        raise ValueError(f"Unknown fetch mode '{fetch_mode}' (expected one of {', '.join(FETCH_MODES)})")
+    if fetch_mode != 'pandas' and not arrow_available():
+        if fetch_mode == 'arrow':
+            raise ImportError("fetch_mode='arrow' needs pyarrow (pip install pyarrow)")
+        _skip_once('pyarrow', "pyarrow is not installed, fetching pandas_arrow queries as plain pandas")
+        return 'pandas'
+    return fetch_mode
+
+def connectorx_url(url):
+    """connectorx connection string for a SQLAlchemy URL, or None if unsupported"""
+    scheme, rest = url.split('://', 1)
+    dialect = scheme.split('+', 1)[0]
+    if dialect not in ('mysql', 'sqlite', 'postgresql'):
+        return None
+    return f"{dialect}://{rest}"
+
+def _column_array(values):
+    """Arrow array for one column of Python values; mixed types become text"""
+    import pyarrow as pa
+    try:
+        return pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+def _common_type(types):
+    """Type every batch of a column can be cast to"""
+    import pyarrow as pa
+    types = {t for t in types if t != pa.null()}
+    if not types:
+        return pa.null()
+    if len(types) == 1:
+        return types.pop()
+    if all(pa.types.is_decimal(t) for t in types):
+        return pa.decimal128(38, max(t.scale for t in types))
+    if all(pa.types.is_integer(t) for t in types):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.string()
+
+def _combine(chunks):
+    """One chunked array from per-batch arrays whose inferred types may differ"""
+    import pyarrow as pa
+    target = _common_type(chunk.type for chunk in chunks)
+    combined = []
+    for chunk in chunks:
+        if chunk.type == target:
+            combined.append(chunk)
+        elif chunk.type == pa.null():
+            combined.append(pa.nulls(len(chunk), target))
+        elif target == pa.string():
+            combined.append(pa.array([None if v is None else str(v) for v in chunk.to_pylist()], type=target))
+        else:
+            combined.append(chunk.cast(target))
+    return pa.chunked_array(combined, type=target)
+
+def read_columnar(result, batch_rows=None):
+    """Arrow table built batch by batch from an open SQLAlchemy cursor result
+
+    Rows are transposed per batch and each column becomes one Arrow array,
+    so no per-row Python objects outlive their batch.
+    """
+    import pyarrow as pa
+    batch_rows = batch_rows or QUERY_CONFIG['arrow_batch_rows']
+    columns = list(result.keys())
+    chunks = [[] for _ in columns]
+    while True:
+        rows = result.fetchmany(batch_rows)
+        if not rows:
+            break
+        for position, values in enumerate(zip(*rows)):
+            chunks[position].append(_column_array(values))
+
+    if not chunks or not chunks[0]:
+        return pa.table({name: pa.array([], type=pa.null()) for name in columns})
+    return pa.table({name: _combine(column_chunks) for name, column_chunks in zip(columns, chunks)})
+
+def fetch_columnar(engine, query, batch_rows=None):
+    """Arrow table for a query over a fresh engine connection"""
+    with engine.connect() as conn:
+        return read_columnar(conn.exec_driver_sql(query), batch_rows)
+
+def read_connectorx(url, query):
+    """Arrow table via connectorx, or None when it is unavailable or fails"""
+    cx_url = connectorx_url(url) if connectorx_available() else None
+    if not cx_url:
+        return None
+    import connectorx
+    try:
+        return connectorx.read_sql(cx_url, query, return_type='arrow')
+    except Exception as e:
+        if 'interrupted' in str(e).lower():
+            raise  # Hit the server-side time limit; the cursor path would too
+        _skip_once(('connectorx', cx_url), f"connectorx could not run a query ({str(e)}), "
+                                           f"using the cursor fetch path")
+        return None
+
+def to_pandas_arrow(table):
+    """DataFrame whose columns keep their Arrow types (pd.ArrowDtype)"""
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+def result_bytes(result):
+    """Memory held by a DataFrame or Arrow table"""
+    if hasattr(result, 'nbytes') and not hasattr(result, 'memory_usage'):
+        return int(result.nbytes)
+    return int(result.memory_usage(deep=True, index=False).sum())
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Batch Runner - Run wallet analyses and user profiles for many accounts
+Fans accounts out over a process pool; each worker keeps one warm
+DatabaseConnection and all workers share a cap on in-flight queries
+Usage:
+    python3 batch_runner.py 88295329 25907866
+    python3 batch_runner.py --priority --linked
+    python3 batch_runner.py --file accounts.txt --analyses wallet
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from config import PRIORITY_ACCOUNTS, BATCH_CONFIG
+
+ANALYSES = ['wallet', 'profile']
+
+# Per-worker state, set up once by _init_worker
+_worker_db = None
+
+def _init_worker(query_slots):
+    """Create the worker's DatabaseConnection once, sharing the global query cap"""
+    global _worker_db
+    from database_connection import DatabaseConnection
+    _worker_db = DatabaseConnection(query_slots=query_slots,
+                                    query_timeout=BATCH_CONFIG['query_timeout_seconds'])
+
+def _run_analysis(name, user_id, reports_dir):
+    """Run one analysis for one account and return its report path
+
+    Raises IncompleteReportError when the report was written with failed
+    sections, so those count as errors rather than a clean run.
+    """
+    if name == 'wallet':
+        from wallet_analysis import run_wallet_analysis
+        return run_wallet_analysis(user_id, _worker_db, reports_dir, strict=True)
+    from build_user_profile import build_profile
+    return build_profile(user_id, _worker_db, reports_dir, strict=True)
+
+def prepare_caches(analyses):
+    """Build or catch up every cache the analyses read, once, in this process
+
+    Run before the pool starts, so workers find the indexes current and
+    only load them instead of all building the same files on a cold cache.
+    """
+    from database_connection import DatabaseConnection
+    steps = []
+    if 'wallet' in analyses:
+        from transaction_classifier import load_and_refresh as load_categories
+        steps.append(('transaction categories', load_categories))
+    if 'profile' in analyses:
+        from address_index import load_and_refresh as load_address_index
+        from ip_index import load_or_build as load_ip_index
+        from fuzzy_matching import load_or_build as load_fuzzy_matcher
+        steps += [('address index', load_address_index), ('IP index', load_ip_index),
+                  ('fuzzy matching table', load_fuzzy_matcher)]
+
+    db = DatabaseConnection()
+    for label, load in steps:
+        started = time.time()
+        try:
+            load(db)
+            print(f"✓ {label} ready ({time.time() - started:.1f}s)")
+        except Exception as e:
+            print(f"⚠️  Could not prepare {label}: {e}")
+
+def run_account(user_id, analyses, reports_dir, log_dir):
+    """Worker task: every requested analysis for one account, with retries
+
+    Console output of the analyses goes to a per-account log file so
+    parallel workers do not interleave on the terminal. Queries past
+    BATCH_CONFIG['query_timeout_seconds'] are cancelled; an account with
+    timed-out queries is reported as partial and is not retried. A report
+    written with failed sections is retried, and kept as partial if the
+    sections still fail.
+    """
+    from database_connection import QueryTimeoutError
+    from report_model import IncompleteReportError
+    result = {'user_id': user_id, 'status': 'ok', 'reports': {}, 'errors': {}, 'attempts': {}}
+    started = time.time()
+    timeouts_before = _worker_db.timeouts
+
+    with open(os.path.join(log_dir, f"{user_id}.log"), 'w') as log_file, \
+            contextlib.redirect_stdout(log_file):
+        for name in analyses:
+            backoff = BATCH_CONFIG['retry_backoff_seconds']
+            for attempt in range(1, BATCH_CONFIG['max_retries'] + 2):
+                result['attempts'][name] = attempt
+                try:
+                    result['reports'][name] = _run_analysis(name, user_id, reports_dir)
+                    result['errors'].pop(name, None)
+                    break
+                except Exception as e:
+                    if isinstance(e, IncompleteReportError):
+                        result['reports'][name] = e.path
+                    result['errors'][name] = f"{type(e).__name__}: {e}"
+                    print(f"✗ {name} attempt {attempt} failed: {e}")
+                    if isinstance(e, QueryTimeoutError):
+                        break  # The same query would time out again
+                    if attempt <= BATCH_CONFIG['max_retries']:
+                        time.sleep(backoff)
+                        backoff *= 2
+
+    profile_dir = os.path.join(os.path.dirname(log_dir), 'query_profiles')
+    result['query_profile'] = _worker_db.write_query_profile(f"account_{user_id}", profile_dir)
+
+    result['query_timeouts'] = _worker_db.timeouts - timeouts_before
+    if result['errors']:
+        result['status'] = 'failed' if not result['reports'] else 'partial'
+    elif result['query_timeouts']:
+        result['status'] = 'partial'
+    result['seconds'] = round(time.time() - started, 2)
+    return result
+
+def read_account_file(path):
+    """One account per line; blank lines and # comments are ignored"""
+    accounts = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                accounts.append(int(line))
+    return accounts
+
+def expand_linked(accounts):
+    """Add accounts linked by shared wallet addresses or direct fund flows
+
+    Uses the address index and fund flow graph when they exist in the
+    cache, caught up with rows added since they were saved; missing ones
+    are not built here.
+    """
+    from address_index import load_and_refresh, index_path
+    from fund_flow_graph import load_or_build, graph_path
+    from database_connection import DatabaseConnection
+
+    db = DatabaseConnection()
+    linked = set(accounts)
+    if os.path.exists(index_path()):
+        index = load_and_refresh(db)
+        for user_id in accounts:
+            linked.update(index.shared_with(user_id))
+    else:
+        print("⚠️  No address index in cache - run address_index.py build to include shared-address links")
+
+    if os.path.exists(graph_path()):
+        graph = load_or_build(db)
+        for user_id in accounts:
+            linked.update(graph.neighborhood(user_id, 1, 'both'))
+    else:
+        print("⚠️  No fund flow graph in cache - run fund_flow_graph.py build to include fund-flow links")
+
+    return sorted(linked)
+
+def write_manifest(path, manifest):
+    """Atomically rewrite the batch manifest"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def run_batch(accounts, analyses, max_workers=None, max_queries=None):
+    """Run the analyses for every account and return the manifest"""
+    max_workers = max_workers or BATCH_CONFIG['max_workers']
+    max_queries = max_queries or BATCH_CONFIG['max_concurrent_queries']
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    batch_dir = os.path.join(BATCH_CONFIG['output_directory'], f"batch_{timestamp}")
+    reports_dir = os.path.join(batch_dir, 'reports')
+    log_dir = os.path.join(batch_dir, 'logs')
+    os.makedirs(reports_dir, exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+    manifest_path = os.path.join(batch_dir, 'manifest.json')
+
+    manifest = {
+        'started': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'finished': None,
+        'analyses': analyses,
+        'max_workers': max_workers,
+        'max_concurrent_queries': max_queries,
+        'total_accounts': len(accounts),
+        'accounts': {}
+    }
+    write_manifest(manifest_path, manifest)
+
+    print(f"Running {', '.join(analyses)} for {len(accounts)} account(s)")
+    print(f"Workers: {max_workers} | Max concurrent queries: {max_queries}")
+    print(f"Output: {batch_dir}")
+    print("-" * 80)
+
+    started = time.time()
+    prepare_caches(analyses)
+    print("-" * 80)
+
+    query_slots = multiprocessing.BoundedSemaphore(max_queries)
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(query_slots,)) as pool:
+        futures = {pool.submit(run_account, user_id, analyses, reports_dir, log_dir): user_id
+                   for user_id in accounts}
+
+        for done, future in enumerate(as_completed(futures), 1):
+            user_id = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'user_id': user_id, 'status': 'failed', 'reports': {},
+                          'errors': {'worker': f"{type(e).__name__}: {e}"}, 'attempts': {}}
+
+            manifest['accounts'][str(user_id)] = result
+            write_manifest(manifest_path, manifest)
+
+            icon = {'ok': '✅', 'partial': '🟡'}.get(result['status'], '❌')
+            print(f"[{done}/{len(accounts)}] {icon} {user_id} {result['status']} ({result.get('seconds', 0)}s)")
+            for name, error in result['errors'].items():
+                print(f"      {name}: {error}")
+            if result.get('query_timeouts'):
+                print(f"      {result['query_timeouts']} query timeout(s), see logs/{user_id}.log")
+
+    results = manifest['accounts'].values()
+    manifest['finished'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    manifest['summary'] = {
+        status: sum(1 for r in results if r['status'] == status) for status in ['ok', 'partial', 'failed']
+    }
+    manifest['summary']['elapsed_seconds'] = round(time.time() - started, 2)
+    write_manifest(manifest_path, manifest)
+
+    print("\n" + "="*80)
+    print("BATCH SUMMARY")
+    print("="*80)
+    print(f"Accounts: {len(accounts)} | OK: {manifest['summary']['ok']} | "
+          f"Partial: {manifest['summary']['partial']} | Failed: {manifest['summary']['failed']}")
+    print(f"Elapsed: {manifest['summary']['elapsed_seconds']}s")
+    print(f"Manifest saved to: {manifest_path}")
+    return manifest
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Run wallet analyses and user profiles for many accounts")
+    parser.add_argument('accounts', nargs='*', type=int, help="Account/user IDs")
+    parser.add_argument('--file', help="File with one account ID per line")
+    parser.add_argument('--priority', action='store_true', help="Include config.PRIORITY_ACCOUNTS")
+    parser.add_argument('--linked', action='store_true',
+                        help="Add accounts linked by shared addresses or direct fund flows")
+    parser.add_argument('--analyses', nargs='+', choices=ANALYSES, default=ANALYSES)
+    parser.add_argument('--workers', type=int, help=f"Worker processes (default {BATCH_CONFIG['max_workers']})")
+    parser.add_argument('--max-queries', type=int,
+                        help=f"Global in-flight query cap (default {BATCH_CONFIG['max_concurrent_queries']})")
+    args = parser.parse_args()
+
+    accounts = list(args.accounts)
+    if args.file:
+        try:
+            accounts += read_account_file(args.file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading account file: {e}")
+            return
+    if args.priority:
+        accounts += PRIORITY_ACCOUNTS
+    accounts = sorted(set(accounts))
+
+    if args.linked:
+        accounts = expand_linked(accounts)
+
+    if not accounts:
+        parser.print_usage()
+        print("Error: no accounts given")
+        return
+
+    run_batch(accounts, args.analyses, args.workers, args.max_queries)
+
+if __name__ == "__main__":
+    main()
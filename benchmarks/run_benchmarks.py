@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Benchmark Harness
+Times account_table_summary, wallet_analysis and build_user_profile end to
+end and per section against a synthetic dataset
+Usage:
+    python3 -m benchmarks.run_benchmarks [scale] [--accounts N] [--repeat N]
+    python3 -m benchmarks.run_benchmarks small --url-template "mysql+mysqlconnector://u:p@localhost/{database}"
+"""
+
+import argparse
+import contextlib
+import json
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import pandas as pd
+import account_table_summary
+import build_user_profile
+import wallet_analysis
+from benchmarks.synthetic_data import generate_dataset
+from database_connection import DatabaseConnection
+from config import BENCHMARK_CONFIG, CACHE_CONFIG, CLI_CONFIG
+
+# Script -> (module, entry point, functions timed as sections)
+SCRIPTS = {
+    'account_table_summary': (account_table_summary, 'summarize_account',
+                              ['scan_database', 'write_summary']),
+    'wallet_analysis': (wallet_analysis, 'run_wallet_analysis',
+                        ['analyze_wallet_addresses', 'analyze_ewallets', 'analyze_ewallet_usage',
+                         'analyze_deposits', 'analyze_withdrawals']),
+    'build_user_profile': (build_user_profile, 'build_profile',
+                           ['extract_profile', 'detect_duplicates', 'write_profile_report']),
+}
+
+@contextlib.contextmanager
+def timed_sections(module, names, timings):
+    """Temporarily wrap module functions so each call appends its duration"""
+    originals = {name: getattr(module, name) for name in names}
+
+    def wrap(name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.setdefault(name, []).append(time.perf_counter() - start)
+        return timed
+
+    for name, func in originals.items():
+        setattr(module, name, wrap(name, func))
+    try:
+        yield
+    finally:
+        for name, func in originals.items():
+            setattr(module, name, func)
+
+def stats(samples):
+    """min / median / p95 / mean of a list of seconds"""
+    values = np.array(samples, dtype=float)
+    if not len(values):
+        return {}
+    return {
+        'n': int(len(values)),
+        'min': round(float(values.min()), 4),
+        'median': round(float(np.median(values)), 4),
+        'p95': round(float(np.percentile(values, 95)), 4),
+        'mean': round(float(values.mean()), 4),
+    }
+
+def sample_accounts(db, count):
+    """Evenly spread user_ids from user_registration"""
+    ids = db.execute_query("SELECT user_id FROM user_registration ORDER BY user_id", db.raw_db)['user_id']
+    if ids.empty:
+        return []
+    positions = np.linspace(0, len(ids) - 1, min(count, len(ids))).astype(int)
+    return [int(ids.iloc[pos]) for pos in positions]
+
+def warm_indexes(db):
+    """Build the cached indexes the scripts rely on, timed once"""
+    from address_index import load_and_refresh
+    from ip_index import load_or_build as load_ip_index
+    from fuzzy_matching import load_or_build as load_fuzzy_matcher
+    from transaction_classifier import load_and_refresh as load_categories
+
+    timings = {}
+    for name, build in [('address_index', load_and_refresh), ('ip_index', load_ip_index),
+                        ('fuzzy_blocking', load_fuzzy_matcher), ('transaction_categories', load_categories)]:
+        start = time.perf_counter()
+        build(db)
+        timings[name] = round(time.perf_counter() - start, 4)
+    return timings
+
+def run_script(db, script, accounts, repeat, reports_dir):
+    """Time one script over every sampled account, repeat times each"""
+    module, entry, sections = SCRIPTS[script]
+    end_to_end, section_timings = [], {}
+    queries = []
+
+    with timed_sections(module, sections, section_timings), \
+            open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            for user_id in accounts:
+                db.clear_cache()  # Measure cold fetches every run
+                if db.profiler:
+                    db.profiler.reset()
+                start = time.perf_counter()
+                getattr(module, entry)(user_id, db, reports_dir)
+                end_to_end.append(time.perf_counter() - start)
+                if db.profiler:
+                    queries.append(db.profiler.summary()['round_trips'])
+
+    return {
+        'end_to_end': stats(end_to_end),
+        'sections': {name: stats(values) for name, values in section_timings.items()},
+        'queries_per_run': stats(queries)
+    }
+
+def measure_startup(scripts, repeat):
+    """Wall time of fresh interpreter runs that exit before any database work
+
+    Covers `--help` and a bad account argument, the cost every short
+    per-account invocation pays before its first query.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    budget = CLI_CONFIG['startup_budget_seconds']
+    results = {}
+    for script in scripts:
+        for label, args in [('help', ['--help']), ('bad_argument', ['not-a-number'])]:
+            samples = []
+            for _ in range(max(repeat, 3)):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, f"{script}.py"] + args, cwd=root,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                samples.append(time.perf_counter() - start)
+            result = stats(samples)
+            result['within_budget'] = result['median'] <= budget
+            results[f"{script} {label}"] = result
+    return {'budget_seconds': budget, 'runs': results}
+
+def print_results(results):
+    """Console table of the end-to-end and section medians"""
+    print("\n" + "="*80)
+    print(f"BENCHMARK RESULTS - scale: {results['scale']} ({results['dialect']})")
+    print("="*80)
+    print(f"{'Script / section':<45} | {'median s':>10} | {'p95 s':>10} | {'runs':>5}")
+    print("-" * 80)
+    for script, result in results['scripts'].items():
+        e2e = result['end_to_end']
+        print(f"{script:<45} | {e2e['median']:>10.4f} | {e2e['p95']:>10.4f} | {e2e['n']:>5}")
+        for section, s in result['sections'].items():
+            print(f"  {section:<43} | {s['median']:>10.4f} | {s['p95']:>10.4f} | {s['n']:>5}")
+        if result['queries_per_run']:
+            print(f"  {'queries per run':<43} | {result['queries_per_run']['median']:>10.0f} |")
+    print("-" * 80)
+    for name, seconds in results['index_build_seconds'].items():
+        print(f"{'index build: ' + name:<45} | {seconds:>10.4f} |")
+    print("-" * 80)
+    startup = results['startup']
+    for name, s in startup['runs'].items():
+        flag = '✓' if s['within_budget'] else '✗ over budget'
+        print(f"{'startup: ' + name:<45} | {s['median']:>10.4f} | {s['p95']:>10.4f} | {s['n']:>5} {flag}")
+    print(f"  (startup budget {startup['budget_seconds']}s)")
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the analysis scripts on synthetic data")
+    parser.add_argument('scale', nargs='?', default='tiny', choices=list(BENCHMARK_CONFIG['scales']))
+    parser.add_argument('--url-template', help="SQLAlchemy URL with a {database} placeholder (default: SQLite)")
+    parser.add_argument('--with-indexes', action='store_true', help="Create indexes when generating data")
+    parser.add_argument('--accounts', type=int, default=BENCHMARK_CONFIG['sample_accounts'])
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_CONFIG['repeat'])
+    parser.add_argument('--scripts', nargs='+', choices=list(SCRIPTS), default=list(SCRIPTS))
+    args = parser.parse_args()
+
+    urls = generate_dataset(args.scale, args.url_template, args.with_indexes)
+
+    # Keep benchmark indexes away from the production cache
+    CACHE_CONFIG['directory'] = os.path.join(BENCHMARK_CONFIG['data_directory'], args.scale, 'cache')
+
+    db = DatabaseConnection(urls=urls)
+    if not db.test_connections():
+        print("Database connection failed!")
+        return
+
+    accounts = sample_accounts(db, args.accounts)
+    print(f"Benchmarking {len(accounts)} account(s) x {args.repeat} repeat(s)")
+
+    results = {
+        'generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'scale': args.scale,
+        'scale_params': BENCHMARK_CONFIG['scales'][args.scale],
+        'dialect': db.dialect,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'accounts': accounts,
+        'repeat': args.repeat,
+        'index_build_seconds': warm_indexes(db),
+        'startup': measure_startup(args.scripts, args.repeat),
+        'scripts': {}
+    }
+
+    with tempfile.TemporaryDirectory() as reports_dir:
+        for script in args.scripts:
+            print(f"  Running {script}...")
+            results['scripts'][script] = run_script(db, script, accounts, args.repeat, reports_dir)
+
+    os.makedirs(BENCHMARK_CONFIG['results_directory'], exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_path = os.path.join(BENCHMARK_CONFIG['results_directory'], f"benchmark_{args.scale}_{timestamp}.json")
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print_results(results)
+    print(f"\nResults saved to: {results_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Account Bloom Filters - Which tables could hold rows for an account
+One Bloom filter of account numbers per account-keyed table in both
+databases, persisted and caught up from an `id` watermark, so per-account
+table summaries only count the tables that might contain the account
+Usage:
+    python3 bloom_filters.py build
+    python3 bloom_filters.py refresh
+    python3 bloom_filters.py [account_number]
+"""
+
+import json
+import math
+import numpy as np
+import sys
+import os
+import threading
+import time
+from datetime import datetime
+from database_connection import DatabaseConnection
+from account_table_summary import find_account_column
+from column_profiler import load_profiles
+from cli import lazy_import
+from config import TARGET_ACCOUNT, CACHE_CONFIG, BLOOM_CONFIG
+
+pd = lazy_import('pandas')
+
+# Loaded filters, so repeated summaries in one process skip the npz read
+_loaded = {}
+_load_lock = threading.Lock()
+
+def filter_paths():
+    """Locations of the persisted bit arrays and their table labels"""
+    return (os.path.join(CACHE_CONFIG['directory'], BLOOM_CONFIG['filters_file']),
+            os.path.join(CACHE_CONFIG['directory'], BLOOM_CONFIG['labels_file']))
+
+def _mix(values):
+    """splitmix64 finalizer over a uint64 array"""
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def account_numbers(values):
+    """Integer account numbers from a column, dropping blanks and non-numbers"""
+    numbers = pd.to_numeric(pd.Series(values), errors='coerce').dropna()
+    return np.unique(numbers.to_numpy(dtype=np.int64))
+
+class BloomFilter:
+    """Bit array answering "possibly present" or "definitely absent"
+
+    Uses num_hashes positions per account from double hashing of two
+    splitmix64 mixes. Sized for `capacity` accounts at the configured
+    false-positive rate; `count` tracks how many were added.
+    """
+
+    def __init__(self, num_bits, num_hashes, bits=None, count=0, capacity=0):
+        self.num_bits = int(num_bits)
+        self.num_hashes = int(num_hashes)
+        self.bits = bits if bits is not None else np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = int(count)
+        self.capacity = int(capacity)
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=None):
+        false_positive_rate = false_positive_rate or BLOOM_CONFIG['false_positive_rate']
+        capacity = max(int(capacity), BLOOM_CONFIG['min_capacity'])
+        num_bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes, capacity=capacity)
+
+    def _positions(self, accounts):
+        """(len(accounts), num_hashes) bit positions"""
+        keys = np.asarray(accounts, dtype=np.int64).view(np.uint64)
+        first = _mix(keys)
+        second = _mix(keys ^ np.uint64(0x5851F42D4C957F2D)) | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (first[:, None] + steps[None, :] * second[:, None]) % np.uint64(self.num_bits)
+
+    def _present(self, accounts):
+        """Boolean array: which accounts might already be in the filter"""
+        positions = self._positions(accounts)
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        return (self.bits[positions >> np.uint64(3)] & masks).all(axis=1)
+
+    def add(self, accounts):
+        """Add distinct account numbers; ones already present are not recounted"""
+        accounts = np.asarray(accounts, dtype=np.int64)
+        if len(accounts) == 0:
+            return
+        accounts = accounts[~self._present(accounts)]
+        positions = self._positions(accounts).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(accounts)
+
+    def might_contain(self, account_number):
+        return bool(self._present([account_number])[0])
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+    @property
+    def false_positive_rate(self):
+        """Expected false-positive rate at the current fill"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+class AccountFilters:
+    """One BloomFilter per account-keyed table of both databases
+
+    `tables` is a list of {database, table, column, key_column, watermark}
+    dicts; `filters` holds the matching BloomFilter for each entry. Tables
+    with an integer `id` column are caught up incrementally from the
+    highest id seen; tables without one are re-read on every refresh.
+    """
+
+    def __init__(self, tables=None, filters=None, refreshed_at=None):
+        self.tables = list(tables or [])
+        self.filters = list(filters or [])
+        self.refreshed_at = refreshed_at or 0.0
+        self.changed = False
+        self._positions = {(t['database'], t['table']): i for i, t in enumerate(self.tables)}
+
+    def _read_accounts(self, db, database_name, table_name, column, key_column, watermark):
+        """Distinct account numbers past the watermark, and the new watermark"""
+        if key_column is None:
+            query = f"SELECT DISTINCT `{column}` AS account FROM `{table_name}` WHERE `{column}` IS NOT NULL"
+            return account_numbers(db.execute_query(query, database_name)['account']), None
+
+        parts = []
+        for chunk in db.iter_table_chunks(table_name, database_name, columns=[column],
+                                          key_column=key_column, chunksize=BLOOM_CONFIG['chunksize'],
+                                          start_after=watermark, where=f"`{column}` IS NOT NULL"):
+            parts.append(account_numbers(chunk[column]))
+            watermark = int(chunk[key_column].max())
+        accounts = np.unique(np.concatenate(parts)) if parts else np.array([], dtype=np.int64)
+        return accounts, watermark
+
+    def _refresh_table(self, db, database_name, table_name, rebuild):
+        """Create or catch up one table's filter; returns the accounts read"""
+        column = find_account_column(db, table_name, database_name)
+        if not column:
+            self._drop(database_name, table_name)
+            return 0
+        structure = db.get_table_structure(table_name, database_name)
+        # Only an integer id can serve as the watermark
+        key_column = next((field for field, kind in zip(structure['Field'], structure['Type'])
+                           if field.lower() == 'id' and 'int' in str(kind).lower()), None)
+
+        position = self._positions.get((database_name, table_name))
+        entry = self.tables[position] if position is not None else None
+        incremental = (not rebuild and entry is not None and key_column is not None
+                       and entry['column'] == column and entry['key_column'] == key_column)
+
+        if incremental:
+            accounts, watermark = self._read_accounts(db, database_name, table_name, column,
+                                                      key_column, entry['watermark'])
+            bloom = self.filters[position]
+            bloom.add(accounts)
+            if not bloom.full:
+                entry['watermark'] = watermark if watermark is not None else entry['watermark']
+                return len(accounts)
+            # Grown past its sizing: rebuild below with more room
+
+        accounts, watermark = self._read_accounts(db, database_name, table_name, column, key_column, None)
+        bloom = BloomFilter.for_capacity(len(accounts) * BLOOM_CONFIG['headroom'])
+        bloom.add(accounts)
+        entry = {'database': database_name, 'table': table_name, 'column': column,
+                 'key_column': key_column, 'watermark': watermark}
+        if position is None:
+            self._positions[(database_name, table_name)] = len(self.tables)
+            self.tables.append(entry)
+            self.filters.append(bloom)
+        else:
+            self.tables[position] = entry
+            self.filters[position] = bloom
+        return len(accounts)
+
+    def _drop(self, database_name, table_name):
+        """Forget a table that no longer has an account column"""
+        position = self._positions.pop((database_name, table_name), None)
+        if position is None:
+            return
+        del self.tables[position], self.filters[position]
+        self._positions = {(t['database'], t['table']): i for i, t in enumerate(self.tables)}
+
+    def refresh(self, db, rebuild=False):
+        """Build filters for new tables and catch up existing ones
+
+        With rebuild=True every filter is rebuilt from a full read. Returns
+        the number of account numbers read.
+        """
+        accounts_read = 0
+        for database_name in [db.raw_db, db.cleaned_db]:
+            for table_name in db.get_table_list(database_name):
+                try:
+                    accounts_read += self._refresh_table(db, database_name, table_name, rebuild)
+                except Exception as e:
+                    print(f"  ✗ Skipping {table_name}: {str(e)}")
+        self.refreshed_at = time.time()
+        load_profiles().save()
+        return accounts_read
+
+    def covers(self, database_name, table_name):
+        return (database_name, table_name) in self._positions
+
+    def key_columns(self, database_name):
+        """{table: id column} of the filtered tables of one database that have one
+
+        Read their watermarks once per summary with
+        db.get_table_watermarks and pass them to might_contain, so checking
+        negatives costs no round trip per table.
+        """
+        return {table['table']: table['key_column'] for table in self.tables
+                if table['database'] == database_name and table['key_column'] is not None}
+
+    def might_contain(self, database_name, table_name, account_number, db=None, watermarks=None):
+        """False only when the table has no row for the account
+
+        Tables without a filter (new since the last refresh) answer True.
+        Given db, a negative is first checked against the table's highest
+        id (from watermarks, see key_columns(), or read here): a table that
+        grew since its filter was built is caught up and asked again, and
+        a table whose id cannot be checked, or whose catch-up fell short of
+        that id, answers True. Without db the filter alone answers, so rows
+        added since the last refresh can be missed.
+        """
+        position = self._positions.get((database_name, table_name))
+        if position is None:
+            return True
+        if self.filters[position].might_contain(account_number):
+            return True
+        if db is None:
+            return False
+
+        entry = self.tables[position]
+        if entry['key_column'] is None:
+            return True
+        if watermarks is None:
+            watermarks = db.get_table_watermarks(database_name, {table_name: entry['key_column']})
+        if table_name not in watermarks:
+            return True
+        latest = watermarks[table_name]
+        if latest is None or (entry['watermark'] is not None and latest <= entry['watermark']):
+            return False
+
+        with _load_lock:
+            self._refresh_table(db, database_name, table_name, rebuild=False)
+            self.changed = True
+            position = self._positions.get((database_name, table_name))
+            if position is None:
+                return True
+            entry = self.tables[position]
+            if entry['watermark'] is None or entry['watermark'] < latest:
+                return True
+            return self.filters[position].might_contain(account_number)
+
+    @property
+    def age_seconds(self):
+        return time.time() - self.refreshed_at
+
+    def save(self):
+        """Persist the bit arrays (.npz) and table labels (.json)"""
+        self.changed = False
+        filters_path, labels_path = filter_paths()
+        os.makedirs(os.path.dirname(filters_path) or '.', exist_ok=True)
+        # Write both files aside and swap them in, so a reader never sees a partial file
+        tmp_filters = f"{filters_path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_filters, **{f"f{i}": bloom.bits for i, bloom in enumerate(self.filters)})
+        tables = [dict(table, num_bits=bloom.num_bits, num_hashes=bloom.num_hashes,
+                       count=bloom.count, capacity=bloom.capacity)
+                  for table, bloom in zip(self.tables, self.filters)]
+        tmp_labels = f"{labels_path}.{os.getpid()}.tmp"
+        with open(tmp_labels, 'w') as f:
+            json.dump({'refreshed_at': self.refreshed_at, 'tables': tables}, f, indent=2)
+        os.replace(tmp_filters, filters_path)
+        os.replace(tmp_labels, labels_path)
+        return filters_path
+
+    @classmethod
+    def load(cls):
+        """Load filters written by save()"""
+        filters_path, labels_path = filter_paths()
+        with open(labels_path) as f:
+            labels = json.load(f)
+        tables, filters = [], []
+        with np.load(filters_path) as data:
+            for i, table in enumerate(labels['tables']):
+                table = dict(table)
+                filters.append(BloomFilter(table.pop('num_bits'), table.pop('num_hashes'), data[f"f{i}"],
+                                           table.pop('count'), table.pop('capacity')))
+                tables.append(table)
+        return cls(tables, filters, labels['refreshed_at'])
+
+def load_and_refresh(db, max_age_seconds=None):
+    """Persisted filters, caught up when older than refresh_interval_seconds"""
+    max_age_seconds = max_age_seconds or BLOOM_CONFIG['refresh_interval_seconds']
+    with _load_lock:
+        filters = _loaded.get('filters')
+        if filters is None and all(os.path.exists(path) for path in filter_paths()):
+            filters = AccountFilters.load()
+        if filters is None or filters.age_seconds > max_age_seconds:
+            filters = filters or AccountFilters()
+            filters.refresh(db)
+            filters.save()
+        _loaded['filters'] = filters
+        return filters
+
+def report_account(account_number):
+    """Print the tables whose filters might contain the account"""
+    with _load_lock:
+        filters = AccountFilters.load()
+    refreshed = datetime.fromtimestamp(filters.refreshed_at).strftime('%Y-%m-%d %H:%M:%S')
+    print(f"\nBLOOM FILTER LOOKUP - Account: {account_number} (filters refreshed {refreshed})")
+    print("="*80)
+
+    for database_name in dict.fromkeys(table['database'] for table in filters.tables):
+        tables = [table for table in filters.tables if table['database'] == database_name]
+        possible = [table for table in tables
+                    if filters.might_contain(database_name, table['table'], account_number)]
+        print(f"\n{database_name}: {len(possible)} of {len(tables)} tables might hold the account")
+        for table in possible:
+            print(f"  {table['table']:<30} | {table['column']}")
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+
+    if args and args[0] in ('build', 'refresh'):
+        db = DatabaseConnection()
+        if not db.test_connections():
+            print("Database connection failed!")
+            return
+
+        rebuild = args[0] == 'build' or not all(os.path.exists(path) for path in filter_paths())
+        filters = AccountFilters() if rebuild else AccountFilters.load()
+
+        start = time.time()
+        accounts = filters.refresh(db, rebuild=rebuild)
+        path = filters.save()
+        size = sum(bloom.bits.nbytes for bloom in filters.filters)
+        print(f"✅ {'Built' if rebuild else 'Refreshed'} {len(filters.tables)} filters in "
+              f"{time.time() - start:.1f}s ({accounts:,} account numbers read, {size / 1024:.0f} KB of bits)")
+        print(f"Saved to: {path}")
+        return
+
+    if not all(os.path.exists(path) for path in filter_paths()):
+        print("No Bloom filters yet, run: python3 bloom_filters.py build")
+        return
+    report_account(int(args[0]) if args else TARGET_ACCOUNT)
+
+if __name__ == "__main__":
+    main()
@@ -2,43 +2,72 @@
 """
 User Profile Builder
 Extracts and consolidates user information from multiple tables
-Usage: python3 build_user_profile.py [user_id]
+Usage: python3 build_user_profile.py [user_id] [--check | --no-check]
 """
 
-import pandas as pd
-import sys
+import argparse
+import gzip
 import os
 from datetime import datetime
 from database_connection import DatabaseConnection
-from config import TARGET_ACCOUNT
-
-def main():
-    """Build comprehensive user profile"""
-
-    # Get user ID from command line or use default
-    if len(sys.argv) > 1:
-        try:
-            user_id = int(sys.argv[1])
-        except ValueError:
-            print("Error: User ID must be a valid integer")
-            print("Usage: python3 build_user_profile.py [user_id]")
+from address_index import load_and_refresh, normalize_address
+from ip_index import load_or_build as load_ip_index
+from fuzzy_matching import load_or_build as load_fuzzy_matcher
+from report_model import Report, IncompleteReportError
+from cli import lazy_import, add_connection_arguments, connections_ready
+from config import TARGET_ACCOUNT, IP_INDEX_CONFIG, FUZZY_MATCH_CONFIG, REPORTING_CONFIG
+
+pd = lazy_import('pandas')
+
+class RawDataAppendix:
+    """Gzipped appendix the profile tables are streamed into as they are fetched
+
+    REPORTING_CONFIG['raw_appendix_format'] 'jsonl' writes one JSON object
+    per record with the source table in "_table"; 'text' writes the
+    "column: value" listing of each record's non-null fields.
+    """
+
+    def __init__(self, stem, fmt=None):
+        self.format = fmt or REPORTING_CONFIG['raw_appendix_format']
+        self.path = f"{stem}_raw.{'jsonl' if self.format == 'jsonl' else 'txt'}.gz"
+        # Level 6 is several times faster than gzip's default 9 for about the same size
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8', compresslevel=6)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def write_table(self, table, df):
+        if self.format == 'jsonl':
+            records = df.assign(_table=table)[['_table', *df.columns]]
+            lines = records.to_json(orient='records', lines=True, date_format='iso', default_handler=str)
+            # Older pandas leaves off the final newline
+            self._file.write(lines if not lines or lines.endswith('\n') else lines + '\n')
             return
-    else:
-        user_id = TARGET_ACCOUNT
-        print(f"No user ID provided, using default: {user_id}")
 
-    print(f"\n{'='*80}")
-    print(f"USER PROFILE BUILDER")
-    print(f"User ID: {user_id}")
-    print(f"{'='*80}\n")
+        self._file.write(f"\n--- {table} ---\n")
+        for number, row in enumerate(df.itertuples(index=False), 1):
+            fields = [f"  {col}: {val}\n" for col, val in zip(df.columns, row) if pd.notna(val)]
+            self._file.write(f"\nRecord #{number}:\n{''.join(fields)}")
 
-    db = DatabaseConnection()
+    def close(self):
+        self._file.close()
 
-    # Test connection
-    if not db.test_connections():
-        print("Database connection failed!")
-        return
+def _record_error(errors, section, message):
+    """Add a failed step to the caller's errors list, if one was given"""
+    if errors is not None:
+        errors.append((section, message))
 
+def extract_profile(user_id, db, appendix=None, errors=None):
+    """Collect identity fields, IPs and wallets for one user from the profile tables
+
+    Each table's rows are written to the RawDataAppendix as soon as they
+    are read and then released; the returned raw_data maps table to
+    record count. Tables that cannot be read are added to errors.
+    """
     # Storage for profile data
     profile = {
         'user_id': user_id,
@@ -55,7 +84,7 @@ def main():
         'wallet_addresses': []
     }
 
-    # Track all raw data from tables
+    # Record counts per table (the rows themselves go to the appendix)
     raw_data = {}
 
     # Tables to check for user information
@@ -90,11 +119,13 @@ def main():
                 continue
 
             query = f"SELECT * FROM `{table}` WHERE `{user_column}` = {user_id}"
-            df = db.execute_query(query, db.raw_db)
+            df = db.execute_query(query, db.raw_db, schema=table)
 
             if not df.empty:
                 print(f"\n✓ Found data in {table} ({len(df)} record(s))")
-                raw_data[table] = df
+                raw_data[table] = len(df)
+                if appendix is not None:
+                    appendix.write_table(table, df)
 
                 # Extract relevant fields from each table
                 for idx, row in df.iterrows():
@@ -188,7 +219,15 @@ def main():
 
         except Exception as e:
             print(f"✗ Error reading {table}: {str(e)}")
+            _record_error(errors, 'profile', f"{table}: {str(e)}")
+
+    return profile, raw_data
 
+def detect_duplicates(user_id, profile, db, errors=None):
+    """Score other accounts against the profile and classify likely duplicates
+
+    Searches that fail are skipped and added to errors.
+    """
     # Smart Duplicate Account Detection
     print("\n" + "="*80)
     print("SMART DUPLICATE ACCOUNT DETECTION")
@@ -222,8 +261,8 @@ def main():
                         candidates[uid] = {'data': row, 'score': 0, 'matches': []}
                     candidates[uid]['score'] += 40
                     candidates[uid]['matches'].append('Email (exact)')
-            except:
-                pass
+            except Exception as e:
+                _record_error(errors, 'duplicates', f"exact email search: {str(e)}")
 
         # Search 2: Exact telephone match (high confidence - 35 points)
         if profile['telephone']:
@@ -241,8 +280,8 @@ def main():
                         candidates[uid] = {'data': row, 'score': 0, 'matches': []}
                     candidates[uid]['score'] += 35
                     candidates[uid]['matches'].append('Telephone (exact)')
-            except:
-                pass
+            except Exception as e:
+                _record_error(errors, 'duplicates', f"exact telephone search: {str(e)}")
 
         # Search 3: First name + Last name match (medium confidence - 20 points)
         if profile['first_name'] and profile['last_name']:
@@ -261,29 +300,73 @@ def main():
                         candidates[uid] = {'data': row, 'score': 0, 'matches': []}
                     candidates[uid]['score'] += 20
                     candidates[uid]['matches'].append('Full Name (exact)')
-            except:
-                pass
+            except Exception as e:
+                _record_error(errors, 'duplicates', f"exact name search: {str(e)}")
 
-        # Check IP address matches (15 points per IP match)
+        # Search 4: Fuzzy email/telephone/name variants (blocked, see fuzzy_matching.py)
+        if profile['email'] or profile['telephone'] or (profile['first_name'] and profile['last_name']):
+            try:
+                matcher = load_fuzzy_matcher(db)
+                for uid, record, points, matches in matcher.candidates_for(profile, exclude_user=user_id):
+                    if uid not in candidates:
+                        candidates[uid] = {'data': record, 'score': 0, 'matches': []}
+                    candidates[uid]['score'] += points
+                    candidates[uid]['matches'].extend(matches)
+            except Exception as e:
+                print(f"✗ Fuzzy matching failed: {str(e)}")
+                _record_error(errors, 'duplicates', f"fuzzy matching: {str(e)}")
+
+        # Search 5: Shared wallet address (strongest collusion signal - 50 points per address)
+        try:
+            address_index = load_and_refresh(db)
+            own_addresses = {normalize_address(wallet.split(': ', 1)[-1]) for wallet in profile['wallet_addresses']}
+            own_addresses.update(address_index.addresses_for(user_id))
+            own_addresses.discard(None)
+
+            linked = address_index.shared_with(user_id, sorted(own_addresses))
+            new_uids = [uid for uid in linked if uid not in candidates]
+            if new_uids:
+                query = f"""
+                    SELECT DISTINCT user_id, username, first_name, last_name, email, telephone, country, city
+                    FROM user_registration
+                    WHERE user_id IN ({', '.join(str(uid) for uid in new_uids)})
+                """
+                df = db.execute_query(query, db.raw_db)
+                for idx, row in df.iterrows():
+                    candidates[int(row['user_id'])] = {'data': row, 'score': 0, 'matches': []}
+                for uid in new_uids:
+                    if uid not in candidates:
+                        candidates[uid] = {'data': pd.Series({'user_id': uid}), 'score': 0, 'matches': []}
+
+            for uid, shared in linked.items():
+                for address, roles in shared:
+                    candidates[uid]['score'] += 50
+                    candidates[uid]['matches'].append(f"Shared wallet address ({address}: {', '.join(roles)})")
+        except Exception as e:
+            print(f"✗ Shared wallet address check failed: {str(e)}")
+            _record_error(errors, 'duplicates', f"shared wallet addresses: {str(e)}")
+
+        # Check IP address matches (15 points per IP match, 5 for the same /24 subnet)
         if profile['ip_addresses']:
-            for ip in profile['ip_addresses']:
-                try:
-                    # Check visitor table
-                    query = f"""
-                        SELECT DISTINCT user_id
-                        FROM visitor
-                        WHERE user_id != {user_id}
-                        AND (ip = '{ip}' OR ipadd = '{ip}')
-                    """
-                    df = db.execute_query(query, db.raw_db)
-                    for idx, row in df.iterrows():
-                        uid = int(row['user_id'])
+            try:
+                visitor_index = load_ip_index(db)
+                for ip in profile['ip_addresses']:
+                    for uid in visitor_index.colocated_users([ip], exclude_user=user_id)['user_id']:
                         if uid in candidates:
                             candidates[uid]['score'] += 15
-                            if 'IP Address match' not in candidates[uid]['matches']:
-                                candidates[uid]['matches'].append(f'IP Address match ({ip})')
-                except:
-                    pass
+                            candidates[uid]['matches'].append(f'IP Address match ({ip})')
+
+                subnet_users = visitor_index.colocated_users(profile['ip_addresses'],
+                                                             prefix=IP_INDEX_CONFIG['subnet_prefix'],
+                                                             exclude_user=user_id)
+                for row in subnet_users.itertuples(index=False):
+                    uid = int(row.user_id)
+                    if uid in candidates and not any(m.startswith('IP Address match') for m in candidates[uid]['matches']):
+                        candidates[uid]['score'] += 5
+                        candidates[uid]['matches'].append(f"Same /{IP_INDEX_CONFIG['subnet_prefix']} subnet ({', '.join(row.ips)})")
+            except Exception as e:
+                print(f"✗ IP address check failed: {str(e)}")
+                _record_error(errors, 'duplicates', f"IP addresses: {str(e)}")
 
         # Bonus scoring for supporting matches
         for uid, info in candidates.items():
@@ -335,10 +418,17 @@ def main():
             print("\n" + "-"*80)
             print("SCORING EXPLANATION:")
             print("-"*80)
+            print("Shared wallet:      50 points per address (collusion signal)")
             print("Email match:        40 points (unique identifier)")
             print("Telephone match:    35 points (unique identifier)")
             print("Full name match:    20 points (common but significant)")
+            fuzzy_points = FUZZY_MATCH_CONFIG['points']
+            print(f"Email alias:        {fuzzy_points['email_alias']} points (gmail dots / plus-addressing)")
+            print(f"Email fuzzy:        {fuzzy_points['email_fuzzy']} points (typo in local part)")
+            print(f"Telephone suffix:   {fuzzy_points['phone_suffix']} points (same number, different format)")
+            print(f"Full name fuzzy:    {fuzzy_points['name_fuzzy']} points (typo or transposed names)")
             print("IP address match:   15 points per IP (behavioral)")
+            print("Same /24 subnet:     5 points (behavioral, no exact IP match)")
             print("City match:         10 points (supporting)")
             print("Country match:       5 points (supporting)")
             print()
@@ -357,7 +447,18 @@ def main():
 
     except Exception as e:
         print(f"\nError during duplicate detection: {str(e)}")
+        _record_error(errors, 'duplicates', str(e))
+
+    return duplicate_accounts, potential_duplicates
+
+def write_profile_report(user_id, profile, raw_data, duplicate_accounts, potential_duplicates,
+                         reports_dir="forensic_reports", profile_file=None, appendix_path=None, errors=()):
+    """Print the unified profile and save the profile report
 
+    raw_data maps table to record count; the records themselves are in the
+    appendix file written during extract_profile. errors are the (section,
+    message) pairs of steps that failed while building the profile.
+    """
     # Display unified profile
     print("\n" + "="*80)
     print("UNIFIED USER PROFILE")
@@ -391,13 +492,23 @@ def main():
         print("None found")
 
     # Save to file
-    reports_dir = "forensic_reports"
     os.makedirs(reports_dir, exist_ok=True)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    profile_file = os.path.join(reports_dir, f"user_profile_{user_id}_{timestamp}.txt")
+    if profile_file is None:
+        profile_file = profile_stem(user_id, reports_dir) + ".txt"
+
+    with Report('user_profile', user_id, profile_file) as f:
+        for field, value in profile.items():
+            f.add_value(field, value)
+        f.add_value('raw_data_file', appendix_path)
+        for section, message in errors:
+            f.add_error(section, message)
+        f.add_table('raw_tables', pd.DataFrame(list(raw_data.items()), columns=['table', 'records']))
+        f.add_table('duplicates', pd.DataFrame(
+            [(uid, 'high') for uid in duplicate_accounts] + [(uid, 'medium') for uid in potential_duplicates],
+            columns=['user_id', 'confidence']
+        ))
 
-    with open(profile_file, 'w') as f:
         f.write(f"USER PROFILE REPORT\n")
         f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write(f"{'='*80}\n\n")
@@ -454,17 +565,68 @@ def main():
         f.write(f"RAW DATA FROM TABLES\n")
         f.write(f"{'='*80}\n\n")
 
-        for table, df in raw_data.items():
-            f.write(f"\n--- {table} ---\n")
-            for idx, row in df.iterrows():
-                f.write(f"\nRecord #{idx + 1}:\n")
-                for col, val in row.items():
-                    if pd.notna(val):
-                        f.write(f"  {col}: {val}\n")
+        if appendix_path:
+            f.write(f"Full records: {os.path.basename(appendix_path)}\n\n")
+        for table, records in raw_data.items():
+            f.write(f"  {table:<30} {records:>8,} record(s)\n")
 
     print(f"\n{'='*80}")
     print(f"Profile saved to: {profile_file}")
     print(f"{'='*80}\n")
 
+    return profile_file
+
+def profile_stem(user_id, reports_dir):
+    """Report path without extension, shared by the .txt report and its appendix"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(reports_dir, f"user_profile_{user_id}_{timestamp}")
+
+def build_profile(user_id, db, reports_dir="forensic_reports", strict=False):
+    """Build the profile for one user and return the report path
+
+    Failed table reads and duplicate searches are skipped; with strict=True
+    they also raise IncompleteReportError once the report is written.
+    """
+    os.makedirs(reports_dir, exist_ok=True)
+    stem = profile_stem(user_id, reports_dir)
+    errors = []
+    with RawDataAppendix(stem) as appendix:
+        profile, raw_data = extract_profile(user_id, db, appendix, errors)
+    duplicate_accounts, potential_duplicates = detect_duplicates(user_id, profile, db, errors)
+    report_path = write_profile_report(user_id, profile, raw_data, duplicate_accounts, potential_duplicates,
+                                       reports_dir, stem + ".txt", appendix.path, errors)
+    if strict and errors:
+        raise IncompleteReportError(report_path, errors)
+    return report_path
+
+def main():
+    """Build comprehensive user profile"""
+
+    parser = argparse.ArgumentParser(description="Unified profile and duplicate-account scoring for one user")
+    parser.add_argument('user_id', nargs='?', type=int, help=f"User ID (default: {TARGET_ACCOUNT})")
+    add_connection_arguments(parser)
+    args = parser.parse_args()
+
+    # Get user ID from command line or use default
+    user_id = args.user_id
+    if user_id is None:
+        user_id = TARGET_ACCOUNT
+        print(f"No user ID provided, using default: {user_id}")
+
+    print(f"\n{'='*80}")
+    print(f"USER PROFILE BUILDER")
+    print(f"User ID: {user_id}")
+    print(f"{'='*80}\n")
+
+    db = DatabaseConnection()
+
+    # Test connection (skipped if a recent check passed)
+    if not connections_ready(db, args.connection_check):
+        print("Database connection failed!")
+        return
+
+    build_profile(user_id, db)
+    db.write_query_profile(f"user_profile_{user_id}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,79 @@
+# cli.py - Shared command-line plumbing: lazy heavy imports and connection checks
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+from config import CACHE_CONFIG, CLI_CONFIG
+
+def lazy_import(name):
+    """Module object that is only really imported on first attribute access
+
+    Lets scripts parse arguments (and exit on --help or a bad argument)
+    before paying for pandas / SQLAlchemy. Touch the module once from the
+    main thread before sharing it between threads.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def add_connection_arguments(parser):
+    """--check / --no-check options shared by the analysis scripts"""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--check', dest='connection_check', action='store_const', const='force',
+                       default='cached', help="Always test database connections before running")
+    group.add_argument('--no-check', dest='connection_check', action='store_const', const='skip',
+                       help="Skip the database connection test")
+    return parser
+
+def _check_path():
+    return os.path.join(CACHE_CONFIG['directory'], CLI_CONFIG['connection_check_file'])
+
+def _target_key(db):
+    """Identifies the servers and databases a check result applies to"""
+    return hashlib.sha1(json.dumps(db.target_description(), sort_keys=True).encode()).hexdigest()
+
+def connections_ready(db, mode='cached'):
+    """Test connections unless skipped or a recent check for the same target passed
+
+    mode is 'force', 'cached' (default) or 'skip'. Returns True when the
+    script may go ahead.
+    """
+    if mode == 'skip':
+        return True
+
+    path = _check_path()
+    key = _target_key(db)
+    if mode == 'cached' and os.path.exists(path):
+        try:
+            with open(path) as f:
+                checks = json.load(f)
+            if time.time() - checks.get(key, 0) < CLI_CONFIG['connection_check_ttl_seconds']:
+                return True
+        except (OSError, ValueError):
+            pass
+
+    if not db.test_connections():
+        return False
+
+    try:
+        checks = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                checks = json.load(f)
+        checks[key] = time.time()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(checks, f)
+    except (OSError, ValueError):
+        pass
+    return True
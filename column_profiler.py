@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Column Profiler - Cardinality, null count and min/max per column
+One aggregate pass per table, cached with the table's highest id. The
+profiles decide whether a row-key column such as `id` really holds
+account numbers, and estimate how many rows a filter on a column will
+return before it is fetched
+Usage:
+    python3 column_profiler.py build
+    python3 column_profiler.py <table> [database]
+"""
+
+import json
+import sys
+import os
+import threading
+import time
+from datetime import datetime
+from database_connection import DatabaseConnection
+from cli import lazy_import
+from config import CACHE_CONFIG, COLUMN_PROFILE_CONFIG
+
+pd = lazy_import('pandas')
+
+NUMERIC_TYPES = ('int', 'decimal', 'numeric', 'float', 'double', 'real')
+# COUNT(DISTINCT) on these is too costly; they get nulls and min/max only
+BLOB_TYPES = ('blob', 'text', 'json')
+INDEXED_KEYS = ('PRI', 'UNI', 'MUL')
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+def profiles_path():
+    return os.path.join(CACHE_CONFIG['directory'], COLUMN_PROFILE_CONFIG['cache_file'])
+
+def _kind(structure, column):
+    row = structure[structure['Field'] == column].iloc[0]
+    return str(row['Type']).lower(), str(row.get('Key') or ''), str(row.get('Extra') or '').lower()
+
+def _number(value):
+    """Float for a numeric min/max, None for blanks"""
+    if value is None or pd.isna(value):
+        return None
+    return float(value)
+
+class ColumnProfiles:
+    """Cached per-table column statistics
+
+    Each entry ("database.table") holds the table's row count, its highest
+    `id` (the watermark), when it was profiled and, per profiled column,
+    {distinct, nulls, min, max, numeric, indexed, row_key}. Columns are
+    profiled on first use; entries older than max_age_hours are redone.
+    """
+
+    def __init__(self, tables=None):
+        self.tables = tables or {}
+        self.changed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        if not os.path.exists(profiles_path()):
+            return cls()
+        with open(profiles_path()) as f:
+            return cls(json.load(f))
+
+    def save(self):
+        """Write the cache if any table was profiled since the last save"""
+        with self._lock:
+            if not self.changed:
+                return
+            payload = json.dumps(self.tables, indent=2)
+            self.changed = False
+        os.makedirs(os.path.dirname(profiles_path()) or '.', exist_ok=True)
+        tmp_path = profiles_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+        os.replace(tmp_path, profiles_path())
+
+    def _profile(self, db, database_name, table_name, columns):
+        """One aggregate query over the given columns"""
+        structure = db.get_table_structure(table_name, database_name)
+        has_id = 'id' in set(structure['Field'])
+        parts = ["COUNT(*) AS row_count"] + (["MAX(`id`) AS watermark"] if has_id else [])
+        kinds = {col: _kind(structure, col) for col in columns}
+        for i, col in enumerate(columns):
+            kind = kinds[col][0]
+            if not any(name in kind for name in BLOB_TYPES):
+                parts.append(f"COUNT(DISTINCT `{col}`) AS d{i}")
+            parts += [f"SUM(CASE WHEN `{col}` IS NULL THEN 1 ELSE 0 END) AS n{i}",
+                      f"MIN(`{col}`) AS lo{i}", f"MAX(`{col}`) AS hi{i}"]
+        row = db.execute_query(f"SELECT {', '.join(parts)} FROM `{table_name}`", database_name).iloc[0]
+
+        stats = {}
+        for i, col in enumerate(columns):
+            kind, key, extra = kinds[col]
+            numeric = any(name in kind for name in NUMERIC_TYPES)
+            lo, hi = row[f"lo{i}"], row[f"hi{i}"]
+            stats[col] = {
+                'distinct': int(row[f"d{i}"]) if f"d{i}" in row.index else None,
+                'nulls': int(row[f"n{i}"] or 0),
+                'min': _number(lo) if numeric else (None if pd.isna(lo) else str(lo)),
+                'max': _number(hi) if numeric else (None if pd.isna(hi) else str(hi)),
+                'numeric': numeric,
+                'indexed': key in INDEXED_KEYS,
+                'row_key': key == 'PRI' or 'auto_increment' in extra,
+            }
+        return {'rows': int(row['row_count']), 'watermark': _number(row['watermark']) if has_id else None,
+                'profiled_at': time.time(), 'columns': stats}
+
+    def table(self, db, database_name, table_name, columns=None):
+        """Profile of a table covering `columns` (default: every column)"""
+        structure = db.get_table_structure(table_name, database_name)
+        columns = list(structure['Field']) if columns is None else list(columns)
+        key = f"{database_name}.{table_name}"
+        with self._lock:
+            entry = self.tables.get(key)
+
+        stale = entry is None or time.time() - entry['profiled_at'] > COLUMN_PROFILE_CONFIG['max_age_hours'] * 3600
+        missing = columns if stale else [col for col in columns if col not in entry['columns']]
+        if not missing:
+            return entry
+
+        profiled = self._profile(db, database_name, table_name, missing)
+        if not stale and (profiled['rows'], profiled['watermark']) == (entry['rows'], entry['watermark']):
+            profiled['columns'] = dict(entry['columns'], **profiled['columns'])
+            profiled['profiled_at'] = entry['profiled_at']
+        with self._lock:
+            self.tables[key] = profiled
+            self.changed = True
+        return profiled
+
+    def account_range(self, db):
+        """(min, max) of known account numbers, from COLUMN_PROFILE_CONFIG['account_reference']"""
+        database_name, table_name, column = COLUMN_PROFILE_CONFIG['account_reference']
+        try:
+            stats = self.table(db, database_name, table_name, [column])['columns'][column]
+        except Exception:
+            return None
+        if not stats['numeric'] or stats['min'] is None:
+            return None
+        return stats['min'], stats['max']
+
+    def account_column(self, db, table_name, database_name, candidates):
+        """First candidate column that holds account numbers
+
+        Candidates are taken by name, except row keys (a bare `id`, the
+        primary key or an auto-increment column): those only count when
+        their profiled values lie inside the known account range without
+        forming a dense 1, 2, 3, ... sequence.
+        """
+        structure = db.get_table_structure(table_name, database_name)
+        by_name = {field.lower(): field for field in structure['Field']}
+        for column in [by_name[name] for name in candidates if name in by_name]:
+            kind, key, extra = _kind(structure, column)
+            if column.lower() != 'id' and key != 'PRI' and 'auto_increment' not in extra:
+                return column
+            profile = self.table(db, database_name, table_name, [column])
+            if self._looks_like_accounts(db, profile['rows'], profile['columns'][column]):
+                return column
+        return None
+
+    def _looks_like_accounts(self, db, rows, stats):
+        if not stats['numeric'] or stats['min'] is None:
+            return False
+        values = rows - stats['nulls']
+        span = stats['max'] - stats['min'] + 1
+        if values >= COLUMN_PROFILE_CONFIG['sequence_min_rows'] and span <= values * COLUMN_PROFILE_CONFIG['sequence_span_ratio']:
+            return False  # 1, 2, 3, ... is a row counter
+        account_range = self.account_range(db)
+        if account_range is None:
+            return True
+        return account_range[0] <= stats['min'] and stats['max'] <= account_range[1]
+
+    def id_columns(self, database_name):
+        """{table: 'id'} for the cached profiles of one database that have an id watermark"""
+        prefix = f"{database_name}."
+        with self._lock:
+            return {key[len(prefix):]: 'id' for key, entry in self.tables.items()
+                    if key.startswith(prefix) and entry['watermark'] is not None}
+
+    def current_estimate(self, database_name, table_name, column, value, watermark):
+        """estimate_rows from the cached profile alone, or None when it may be out of date
+
+        The profile only counts when it already covers the column and its
+        id watermark equals `watermark`, the table's highest id now (see
+        id_columns). Nothing is queried or re-profiled here.
+        """
+        with self._lock:
+            profile = self.tables.get(f"{database_name}.{table_name}")
+        if (profile is None or column not in profile['columns'] or watermark is None
+                or profile['watermark'] != watermark):
+            return None
+        return self._estimate(profile, column, value)
+
+    def estimate_rows(self, db, database_name, table_name, column, value=None):
+        """Expected rows for `column = value` (or for the whole table without a value)
+
+        0 when the value is outside the column's min/max or the column has
+        no values; otherwise the average rows per distinct value.
+        """
+        return self._estimate(self.table(db, database_name, table_name, [column]), column, value)
+
+    def _estimate(self, profile, column, value):
+        if value is None:
+            return profile['rows']
+        stats = profile['columns'][column]
+        values = profile['rows'] - stats['nulls']
+        if values == 0:
+            return 0
+        if stats['numeric'] and not stats['min'] <= float(value) <= stats['max']:
+            return 0
+        return values / stats['distinct'] if stats['distinct'] else values
+
+def load_profiles():
+    """Process-wide ColumnProfiles, loaded from the cache once"""
+    with _profiles_lock:
+        if 'profiles' not in _profiles:
+            _profiles['profiles'] = ColumnProfiles.load()
+        return _profiles['profiles']
+
+def build_profiles(db):
+    """Profile every column of every table in both databases"""
+    profiles = ColumnProfiles()
+    for database_name in [db.raw_db, db.cleaned_db]:
+        table_names = db.get_table_list(database_name)
+        print(f"Profiling {len(table_names)} tables in {database_name}...")
+        for table_name in table_names:
+            try:
+                profiles.table(db, database_name, table_name)
+            except Exception as e:
+                print(f"  ✗ Skipping {table_name}: {str(e)}")
+    profiles.save()
+    with _profiles_lock:
+        _profiles['profiles'] = profiles
+    return profiles
+
+def report_table(db, table_name, database_name):
+    """Print one table's column statistics"""
+    profiles = load_profiles()
+    profile = profiles.table(db, database_name, table_name)
+    profiles.save()
+    profiled = datetime.fromtimestamp(profile['profiled_at']).strftime('%Y-%m-%d %H:%M:%S')
+    print(f"\nCOLUMN PROFILE - {database_name}.{table_name} ({profile['rows']:,} rows, profiled {profiled})")
+    print("="*80)
+    for column, stats in profile['columns'].items():
+        null_rate = stats['nulls'] / profile['rows'] if profile['rows'] else 0
+        distinct = '-' if stats['distinct'] is None else f"{stats['distinct']:,}"
+        flags = " ".join(flag for flag in ('indexed', 'row_key') if stats[flag])
+        print(f"  {column:<25} | {distinct:>9} distinct | {null_rate:>6.1%} null | "
+              f"{str(stats['min'])[:20]:>20} .. {str(stats['max'])[:20]:<20} {flags}")
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python3 column_profiler.py [build | <table> [database]]")
+        return
+
+    db = DatabaseConnection()
+    if not db.test_connections():
+        print("Database connection failed!")
+        return
+
+    if args[0] == 'build':
+        start = time.time()
+        profiles = build_profiles(db)
+        columns = sum(len(entry['columns']) for entry in profiles.tables.values())
+        print(f"✅ Profiled {columns:,} columns in {len(profiles.tables)} tables in {time.time() - start:.1f}s")
+        print(f"Saved to: {profiles_path()}")
+        return
+
+    report_table(db, args[0], args[1] if len(args) > 1 else db.raw_db)
+
+if __name__ == "__main__":
+    main()
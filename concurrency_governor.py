@@ -0,0 +1,106 @@
+# concurrency_governor.py - AIMD limit on in-flight queries, driven by server load
+import threading
+import time
+from collections import deque
+from config import GOVERNOR_CONFIG
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+class ConcurrencyGovernor:
+    """Caps in-flight queries to one server and adapts the cap to its load
+
+    Every adjust_interval_seconds the limit is cut multiplicatively
+    (decrease_factor) when the server reports more than
+    target_threads_running running threads or the recent query latency
+    percentile exceeds target_latency_seconds; otherwise, if the limit was
+    actually reached in that interval, it grows by increase_step. The limit
+    stays within min_concurrency..max_concurrency.
+    """
+
+    def __init__(self, sampler=None, config=None):
+        self.config = dict(GOVERNOR_CONFIG, **(config or {}))
+        self.sampler = sampler
+        self.limit = float(self.config['initial_concurrency'])
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.latencies = deque(maxlen=self.config['latency_window'])
+        self.threads_running = None
+        self.last_latency = None
+        self.adjusted_at = time.time()
+        self.increases = 0
+        self.decreases = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Wait for a free slot; False if none opened up within timeout seconds"""
+        deadline = time.time() + timeout if timeout else None
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def release(self, seconds=None):
+        """Free a slot, recording how long the query took"""
+        with self._cond:
+            self.in_flight -= 1
+            if seconds is not None:
+                self.latencies.append(seconds)
+            self._cond.notify()
+        self._maybe_adjust()
+
+    def _maybe_adjust(self):
+        with self._cond:
+            if time.time() - self.adjusted_at < self.config['adjust_interval_seconds']:
+                return
+            # Claim this interval so only one thread samples the server
+            self.adjusted_at = time.time()
+
+        threads_running = None
+        if self.sampler is not None:
+            try:
+                threads_running = self.sampler()
+            except Exception:
+                threads_running = None  # Keep governing on latency alone
+
+        with self._cond:
+            self.threads_running = threads_running
+            samples = list(self.latencies)
+            latency = (percentile(samples, self.config['latency_percentile'])
+                       if len(samples) >= self.config['min_latency_samples'] else None)
+            self.last_latency = latency
+
+            overloaded = (
+                (threads_running is not None and threads_running > self.config['target_threads_running'])
+                or (latency is not None and latency > self.config['target_latency_seconds'])
+            )
+            if overloaded:
+                self.limit = max(self.config['min_concurrency'], self.limit * self.config['decrease_factor'])
+                self.decreases += 1
+            elif self.peak_in_flight >= int(self.limit):
+                self.limit = min(self.config['max_concurrency'], self.limit + self.config['increase_step'])
+                self.increases += 1
+
+            # Each interval is judged on its own queries
+            self.latencies.clear()
+            self.peak_in_flight = self.in_flight
+            self._cond.notify_all()
+
+    def status(self):
+        """Current limit, load and adjustment counts"""
+        with self._cond:
+            return {'limit': int(self.limit), 'in_flight': self.in_flight,
+                    'threads_running': self.threads_running,
+                    f"p{self.config['latency_percentile']}_seconds":
+                        None if self.last_latency is None else round(self.last_latency, 3),
+                    'increases': self.increases, 'decreases': self.decreases}
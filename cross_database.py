@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Cross-Database Analytics - Raw and cleaned data joined in one local engine
+Attaches crypto_transactions_raw and crypto_transactions_cleaned to an
+in-process DuckDB as the catalogs `raw` and `cleaned`, either straight from
+the database server (DuckDB's MySQL/SQLite scanners) or from local snapshot
+files, so raw-vs-cleaned comparisons run as one vectorized SQL join
+Usage:
+    python3 cross_database.py snapshot [table ...]
+    python3 cross_database.py list
+    python3 cross_database.py <comparison> [limit]
+    python3 cross_database.py sql "SELECT ... FROM raw.credit_debit JOIN cleaned.mtitransactions ..."
+"""
+
+import json
+import sys
+import os
+import time
+from datetime import datetime
+from database_connection import DatabaseConnection
+from cli import lazy_import
+from config import CACHE_CONFIG, ROUTING_CONFIG, LOCAL_ENGINE_CONFIG
+
+pd = lazy_import('pandas')
+
+# Ready-made comparisons; {limit} is filled in from the command line
+COMPARISONS = {
+    'users_missing_from_cleaned': (
+        "Registered users with no mtiusers row",
+        """
+        SELECT r.user_id, r.username, r.email, r.country, r.registration_date
+        FROM raw.user_registration r
+        ANTI JOIN cleaned.mtiusers c ON c.id = r.user_id
+        ORDER BY r.user_id
+        LIMIT {limit}
+        """
+    ),
+    'users_only_in_cleaned': (
+        "mtiusers rows with no user_registration row",
+        """
+        SELECT c.id AS user_id, c.username, c.email, c.country
+        FROM cleaned.mtiusers c
+        ANTI JOIN raw.user_registration r ON r.user_id = c.id
+        ORDER BY c.id
+        LIMIT {limit}
+        """
+    ),
+    'profile_mismatches': (
+        "Users whose username, email or country differ between user_registration and mtiusers",
+        """
+        SELECT r.user_id,
+               r.username AS raw_username, c.username AS cleaned_username,
+               r.email AS raw_email, c.email AS cleaned_email,
+               r.country AS raw_country, c.country AS cleaned_country
+        FROM raw.user_registration r
+        JOIN cleaned.mtiusers c ON c.id = r.user_id
+        WHERE lower(trim(r.username)) IS DISTINCT FROM lower(trim(c.username))
+           OR lower(trim(r.email)) IS DISTINCT FROM lower(trim(c.email))
+           OR trim(r.country) IS DISTINCT FROM trim(c.country)
+        ORDER BY r.user_id
+        LIMIT {limit}
+        """
+    ),
+    'ledger_vs_transactions': (
+        "Per-user credit_debit rows and volume against mtitransactions, largest gaps first",
+        """
+        WITH ledger AS (
+            SELECT user_id, COUNT(*) AS raw_rows,
+                   SUM(coalesce(credit_amt, 0) + coalesce(debit_amt, 0)) AS raw_volume
+            FROM raw.credit_debit
+            GROUP BY user_id
+        ), cleaned_ledger AS (
+            SELECT userid AS user_id, COUNT(*) AS cleaned_rows,
+                   SUM(coalesce(amount, 0)) AS cleaned_volume
+            FROM cleaned.mtitransactions
+            GROUP BY userid
+        )
+        SELECT coalesce(l.user_id, c.user_id) AS user_id,
+               coalesce(l.raw_rows, 0) AS raw_rows,
+               coalesce(c.cleaned_rows, 0) AS cleaned_rows,
+               round(coalesce(l.raw_volume, 0), 8) AS raw_volume,
+               round(coalesce(c.cleaned_volume, 0), 8) AS cleaned_volume,
+               round(coalesce(l.raw_volume, 0) - coalesce(c.cleaned_volume, 0), 8) AS volume_gap
+        FROM ledger l
+        FULL OUTER JOIN cleaned_ledger c ON c.user_id = l.user_id
+        WHERE coalesce(l.raw_rows, 0) != coalesce(c.cleaned_rows, 0)
+           OR abs(coalesce(l.raw_volume, 0) - coalesce(c.cleaned_volume, 0)) > 1e-8
+        ORDER BY abs(volume_gap) DESC, user_id
+        LIMIT {limit}
+        """
+    ),
+}
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("cross_database.py needs duckdb (pip install duckdb)") from None
+    return duckdb
+
+def snapshot_directory():
+    return os.path.join(CACHE_CONFIG['directory'], LOCAL_ENGINE_CONFIG['snapshot_directory'])
+
+def snapshot_path(database_name):
+    return os.path.join(snapshot_directory(), f"{database_name}.duckdb")
+
+def manifest_path():
+    return os.path.join(snapshot_directory(), 'manifest.json')
+
+def load_manifest():
+    """{database: {table: {rows, taken_at}}} for the snapshot files on disk"""
+    if not os.path.exists(manifest_path()):
+        return {}
+    with open(manifest_path()) as f:
+        return json.load(f)
+
+def scanner_attach(url, alias):
+    """ATTACH statement letting DuckDB read a database in place, or None if unsupported"""
+    from sqlalchemy.engine import make_url
+    url = make_url(url)
+    dialect = url.get_backend_name()
+    if dialect == 'sqlite':
+        return f"ATTACH '{url.database}' AS {alias} (TYPE sqlite, READ_ONLY)"
+    if dialect == 'mysql':
+        settings = {'host': url.host, 'port': url.port, 'user': url.username,
+                    'password': url.password, 'database': url.database}
+        dsn = " ".join(f"{key}={value}" for key, value in settings.items() if value is not None)
+        return f"ATTACH '{dsn}' AS {alias} (TYPE mysql, READ_ONLY)"
+    return None
+
+def take_snapshot(db, tables=None):
+    """Copy tables of both databases into local DuckDB files, chunk by chunk
+
+    tables maps database name to table names (default
+    LOCAL_ENGINE_CONFIG['snapshot_tables']). Each file is written beside the
+    old one and swapped in when complete. Returns the updated manifest.
+    """
+    duckdb = _duckdb()
+    tables = tables or LOCAL_ENGINE_CONFIG['snapshot_tables']
+    os.makedirs(snapshot_directory(), exist_ok=True)
+    manifest = load_manifest()
+
+    for database_name, table_names in tables.items():
+        path = snapshot_path(database_name)
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if os.path.exists(path):
+            # Keep the tables this run does not refresh
+            os.replace(path, tmp_path)
+        con = duckdb.connect(tmp_path)
+        entries = manifest.setdefault(database_name, {})
+
+        for table_name in table_names:
+            print(f"  Snapshotting {database_name}.{table_name}...")
+            fields = set(db.get_table_structure(table_name, database_name)['Field'])
+            if 'id' in fields:
+                chunks = db.iter_table_chunks(table_name, database_name,
+                                              chunksize=LOCAL_ENGINE_CONFIG['chunksize'])
+            else:
+                chunks = iter([db.execute_query(f"SELECT * FROM `{table_name}`", database_name)])
+
+            con.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            rows = 0
+            for chunk in chunks:
+                con.register('chunk', chunk)
+                if rows == 0:
+                    con.execute(f'CREATE TABLE "{table_name}" AS SELECT * FROM chunk')
+                else:
+                    con.execute(f'INSERT INTO "{table_name}" BY NAME SELECT * FROM chunk')
+                con.unregister('chunk')
+                rows += len(chunk)
+            entries[table_name] = {'rows': rows, 'taken_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+        con.close()
+        os.replace(tmp_path, path)
+
+    with open(manifest_path(), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+class LocalEngine:
+    """In-process DuckDB with the raw and cleaned databases attached
+
+    source 'scanner' reads the live databases through DuckDB's MySQL or
+    SQLite extension (on the first bulk-read endpoint, so snapshots and
+    replicas are preferred); 'snapshot' attaches the files written by
+    take_snapshot(); 'auto' tries the scanner and falls back to snapshots.
+    """
+
+    def __init__(self, db, source=None):
+        self.db = db
+        self.source = source or LOCAL_ENGINE_CONFIG['source']
+        self.con = _duckdb().connect()
+        self.con.execute(f"SET memory_limit = '{LOCAL_ENGINE_CONFIG['memory_limit']}'")
+        self.con.execute(f"SET threads = {int(LOCAL_ENGINE_CONFIG['threads'])}")
+        self.catalogs = {}
+        self.attached_from = None
+
+        errors = []
+        if self.source in ('auto', 'scanner'):
+            try:
+                self._attach_scanners()
+                self.attached_from = 'scanner'
+            except Exception as e:
+                if self.source == 'scanner':
+                    raise
+                errors.append(f"scanner: {str(e)}")
+                self._detach_all()
+        if self.attached_from is None:
+            self._attach_snapshots(errors)
+            self.attached_from = 'snapshot'
+
+    def _attach_scanners(self):
+        endpoint = self.db.router.route("SELECT 1", ROUTING_CONFIG['bulk_read_roles'])[0]
+        for database_name, alias in LOCAL_ENGINE_CONFIG['catalogs'].items():
+            statement = scanner_attach(endpoint.urls[database_name], alias)
+            if statement is None:
+                raise ValueError(f"no DuckDB scanner for {endpoint.dialect}")
+            extension = 'sqlite' if 'TYPE sqlite' in statement else 'mysql'
+            self.con.execute(f"INSTALL {extension}")
+            self.con.execute(f"LOAD {extension}")
+            self.con.execute(statement)
+            self.catalogs[alias] = database_name
+
+    def _attach_snapshots(self, errors):
+        manifest = load_manifest()
+        for database_name, alias in LOCAL_ENGINE_CONFIG['catalogs'].items():
+            path = snapshot_path(database_name)
+            if not os.path.exists(path):
+                reasons = "; ".join(errors + [f"no snapshot at {path}"])
+                raise FileNotFoundError(f"Cannot attach {database_name} ({reasons}). "
+                                        f"Run: python3 cross_database.py snapshot")
+            self.con.execute(f"ATTACH '{path}' AS {alias} (READ_ONLY)")
+            self.catalogs[alias] = database_name
+
+            taken = [entry['taken_at'] for entry in manifest.get(database_name, {}).values()]
+            if taken:
+                age_hours = (time.time() - datetime.strptime(min(taken), '%Y-%m-%d %H:%M:%S').timestamp()) / 3600
+                if age_hours > LOCAL_ENGINE_CONFIG['snapshot_max_age_hours']:
+                    print(f"🟡 {database_name} snapshot is {age_hours:.0f}h old "
+                          f"(run: python3 cross_database.py snapshot)")
+
+    def _detach_all(self):
+        for alias in list(self.catalogs):
+            self.con.execute(f"DETACH {alias}")
+        self.catalogs = {}
+
+    def query(self, sql):
+        """DataFrame for SQL over the `raw` and `cleaned` catalogs"""
+        return self.con.execute(sql).df()
+
+    def compare(self, name, limit=None):
+        """Run one of COMPARISONS"""
+        if name not in COMPARISONS:
+            raise KeyError(f"Unknown comparison '{name}' (expected one of {', '.join(COMPARISONS)})")
+        limit = int(limit or LOCAL_ENGINE_CONFIG['default_limit'])
+        return self.query(COMPARISONS[name][1].format(limit=limit))
+
+    def close(self):
+        self.con.close()
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+    if not args or args[0] == 'list':
+        print("Usage: python3 cross_database.py [snapshot [table ...] | list | <comparison> [limit] | sql <query>]")
+        print("\nComparisons:")
+        for name, (description, _) in COMPARISONS.items():
+            print(f"  {name:<28} {description}")
+        return
+
+    db = DatabaseConnection()
+    if not db.test_connections():
+        print("Database connection failed!")
+        return
+
+    if args[0] == 'snapshot':
+        tables = LOCAL_ENGINE_CONFIG['snapshot_tables']
+        if len(args) > 1:
+            # Named tables are looked up in whichever database has them
+            tables = {name: [t for t in args[1:] if t in db.get_table_list(name)]
+                      for name in LOCAL_ENGINE_CONFIG['catalogs']}
+        start = time.time()
+        manifest = take_snapshot(db, tables)
+        for database_name, table_names in tables.items():
+            for table_name in table_names:
+                print(f"✅ {database_name}.{table_name}: {manifest[database_name][table_name]['rows']:,} rows")
+        print(f"Snapshots written to {snapshot_directory()} in {time.time() - start:.1f}s")
+        return
+
+    engine = LocalEngine(db)
+    start = time.time()
+    if args[0] == 'sql':
+        df = engine.query(" ".join(args[1:]))
+    else:
+        df = engine.compare(args[0], args[1] if len(args) > 1 else None)
+    elapsed = time.time() - start
+
+    print(f"\n{len(df):,} rows in {elapsed:.2f}s (catalogs attached from {engine.attached_from})")
+    if len(df):
+        print(df.to_string(index=False))
+    engine.close()
+
+if __name__ == "__main__":
+    main()
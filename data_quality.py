@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Data Quality Scoring - DATA_QUALITY_THRESHOLDS measured for every table
+Completeness (null and blank cells), consistency (duplicate keys), accuracy
+(amount values that do not parse as numbers) and integrity (account
+numbers with no user row) per table in both databases. Results are cached
+per table watermark, so re-runs only rescan tables that changed
+Usage: python3 data_quality.py [table ...] [--force]
+"""
+
+import argparse
+import json
+import re
+import os
+import time
+from datetime import datetime
+from database_connection import DatabaseConnection
+from account_table_summary import find_account_column
+from column_profiler import load_profiles
+from report_model import Report
+from cli import lazy_import
+from config import CACHE_CONFIG, DATA_QUALITY_THRESHOLDS, DATA_QUALITY_CONFIG, ROUTING_CONFIG
+
+pd = lazy_import('pandas')
+
+METRICS = ['completeness', 'consistency', 'accuracy', 'integrity']
+TEXT_TYPES = ('char', 'text', 'enum', 'set')
+AMOUNT_COLUMN = re.compile(DATA_QUALITY_CONFIG['amount_column_pattern'], re.IGNORECASE)
+NUMBER = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+
+def print_and_log(message, file_handle=None):
+    """Print to console and optionally write to file"""
+    print(message)
+    if file_handle:
+        file_handle.write(message + '\n')
+
+def cache_path():
+    return os.path.join(CACHE_CONFIG['directory'], DATA_QUALITY_CONFIG['cache_file'])
+
+def load_cache():
+    """{"database.table": result} from the last run"""
+    if not os.path.exists(cache_path()):
+        return {}
+    with open(cache_path()) as f:
+        return json.load(f)
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(cache_path()) or '.', exist_ok=True)
+    tmp_path = cache_path() + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, cache_path())
+
+def _is_text(kind):
+    return any(name in str(kind).lower() for name in TEXT_TYPES)
+
+def _plain(value):
+    """JSON-friendly scalar for watermark comparisons"""
+    if value is None or pd.isna(value):
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    return value if isinstance(value, (int, float, str)) else str(value)
+
+def _ratio(bad, total):
+    return None if not total else round(1 - bad / total, 6)
+
+class TableCheck:
+    """The columns one table is measured on"""
+
+    def __init__(self, db, database_name, table_name):
+        self.database_name = database_name
+        self.table_name = table_name
+        structure = db.get_table_structure(table_name, database_name)
+        self.columns = list(structure['Field'])
+        self.text_columns = {field for field, kind in zip(structure['Field'], structure['Type']) if _is_text(kind)}
+        lower = {field.lower(): field for field in self.columns}
+
+        self.watermark_columns = [lower[col] for col in DATA_QUALITY_CONFIG['watermark_columns'] if col in lower]
+        key_names = ['id'] + DATA_QUALITY_CONFIG['unique_keys'].get(table_name, [])
+        self.key_columns = list(dict.fromkeys(lower[col.lower()] for col in key_names if col.lower() in lower))
+        # Only text-typed amounts can fail to parse; numeric columns are checked by the server
+        self.amount_columns = [col for col in self.columns if AMOUNT_COLUMN.search(col) and col in self.text_columns]
+
+        self.reference = None
+        reference_table, reference_key = DATA_QUALITY_CONFIG['reference_tables'].get(database_name, (None, None))
+        account_column = find_account_column(db, table_name, database_name)
+        if reference_table and table_name != reference_table and account_column:
+            self.reference = (account_column, reference_table, reference_key)
+
+    def _null(self, col):
+        if col in self.text_columns:
+            return f"SUM(CASE WHEN `{col}` IS NULL OR TRIM(`{col}`) = '' THEN 1 ELSE 0 END)"
+        return f"SUM(CASE WHEN `{col}` IS NULL THEN 1 ELSE 0 END)"
+
+    def probe_query(self):
+        """Cheap query for the watermark: row count and the watermark columns' maxima"""
+        parts = ["COUNT(*) AS row_count"] + [f"MAX(`{col}`) AS w{i}" for i, col in enumerate(self.watermark_columns)]
+        return f"SELECT {', '.join(parts)} FROM `{self.table_name}`"
+
+    def aggregate_query(self):
+        """One pass for the watermark, null counts and distinct key counts"""
+        parts = ["COUNT(*) AS row_count"]
+        parts += [f"MAX(`{col}`) AS w{i}" for i, col in enumerate(self.watermark_columns)]
+        parts += [f"{self._null(col)} AS n{i}" for i, col in enumerate(self.columns)]
+        parts += [f"COUNT(DISTINCT `{col}`) AS d{i}" for i, col in enumerate(self.key_columns)]
+        return f"SELECT {', '.join(parts)} FROM `{self.table_name}`"
+
+    def watermark(self, row):
+        return {'row_count': int(row['row_count']), 'columns': self.columns,
+                **{col: _plain(row[f"w{i}"]) for i, col in enumerate(self.watermark_columns)}}
+
+    def parse_failures(self, db):
+        """Non-blank amount values that are not numbers, per column (chunked scan)"""
+        failures = dict.fromkeys(self.amount_columns, 0)
+        if not self.amount_columns:
+            return failures
+        if 'id' in self.columns:
+            # Cached against the probe's watermark, so read from the probe's tiers, not a snapshot
+            chunks = db.iter_table_chunks(self.table_name, self.database_name, columns=self.amount_columns,
+                                          chunksize=DATA_QUALITY_CONFIG['chunksize'],
+                                          roles=ROUTING_CONFIG['read_roles'])
+        else:
+            select_list = ", ".join(f"`{col}`" for col in self.amount_columns)
+            chunks = [db.execute_query(f"SELECT {select_list} FROM `{self.table_name}`", self.database_name)]
+        for chunk in chunks:
+            for col in self.amount_columns:
+                values = chunk[col].dropna().astype(str).str.strip()
+                values = values[values != '']
+                failures[col] += int((~values.str.match(NUMBER)).sum())
+        return failures
+
+    def orphans(self, db):
+        """Account numbers with no row in the reference table"""
+        column, reference_table, reference_key = self.reference
+        query = f"""
+            SELECT COUNT(*) AS orphans
+            FROM `{self.table_name}` t
+            LEFT JOIN `{reference_table}` r ON r.`{reference_key}` = t.`{column}`
+            WHERE t.`{column}` IS NOT NULL AND r.`{reference_key}` IS NULL
+        """
+        return int(db.execute_query(query, self.database_name)['orphans'].iloc[0])
+
+    def integrity(self, db, references):
+        """Orphan count and integrity score for `references` non-null account numbers"""
+        if not self.reference:
+            return {'account_column': None, 'references': None, 'orphans': None, 'integrity': None}
+        orphans = self.orphans(db)
+        return {'account_column': self.reference[0], 'references': references,
+                'orphans': orphans, 'integrity': _ratio(orphans, references)}
+
+    def measure(self, db, row):
+        """All four metrics for the table from its aggregate row"""
+        rows = int(row['row_count'])
+        nulls = {col: int(row[f"n{i}"] or 0) for i, col in enumerate(self.columns)}
+        duplicates = {col: rows - nulls[col] - int(row[f"d{i}"] or 0) for i, col in enumerate(self.key_columns)}
+        failures = self.parse_failures(db)
+        amount_values = sum(rows - nulls[col] for col in self.amount_columns)
+
+        result = {
+            'database': self.database_name, 'table': self.table_name, 'rows': rows,
+            'completeness': _ratio(sum(nulls.values()), rows * len(self.columns)),
+            'consistency': _ratio(max(duplicates.values(), default=0), rows),
+            'accuracy': _ratio(sum(failures.values()), amount_values),
+            'null_cells': sum(nulls.values()), 'duplicate_keys': duplicates, 'parse_failures': failures,
+        }
+        references = rows - nulls[self.reference[0]] if self.reference else None
+        result.update(self.integrity(db, references))
+        result['checked_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        result['watermark'] = self.watermark(row)
+        return result
+
+def assess(db, tables=None, force=False):
+    """Measure every table of both databases, reusing cached results
+
+    A table is rescanned when its row count, columns or watermark maxima
+    changed since the cached result; integrity alone is re-checked when only
+    its reference table changed. Returns (results, rescanned table count).
+    """
+    cache = {} if force else load_cache()
+    results, rescanned = [], 0
+
+    for database_name in [db.raw_db, db.cleaned_db]:
+        names = db.get_table_list(database_name)
+        if tables:
+            names = [name for name in names if name in tables]
+
+        reference_table = DATA_QUALITY_CONFIG['reference_tables'].get(database_name, (None,))[0]
+        reference_watermark = None
+        if reference_table in db.get_table_list(database_name):
+            check = TableCheck(db, database_name, reference_table)
+            reference_watermark = check.watermark(db.execute_query(check.probe_query(), database_name).iloc[0])
+
+        for table_name in names:
+            key = f"{database_name}.{table_name}"
+            try:
+                check = TableCheck(db, database_name, table_name)
+                watermark = check.watermark(db.execute_query(check.probe_query(), database_name).iloc[0])
+                result = cache.get(key)
+                if result and result['watermark'] == watermark:
+                    if check.reference and result['reference_watermark'] != reference_watermark:
+                        # Only the reference table moved: re-check integrity alone
+                        result.update(check.integrity(db, result['references']))
+                else:
+                    result = check.measure(db, db.execute_query(check.aggregate_query(), database_name).iloc[0])
+                    rescanned += 1
+                result['reference_watermark'] = reference_watermark
+                cache[key] = result
+                results.append(result)
+            except Exception as e:
+                print(f"  ✗ Skipping {key}: {str(e)}")
+
+    save_cache(cache)
+    load_profiles().save()
+    return results, rescanned
+
+def results_frame(results):
+    """One row per table with its four scores and pass/fail flags"""
+    df = pd.DataFrame(results, columns=['database', 'table', 'rows'] + METRICS +
+                      ['null_cells', 'orphans', 'account_column', 'checked_at'])
+    for metric in METRICS:
+        df[f"{metric}_ok"] = df[metric].isna() | (df[metric] >= DATA_QUALITY_THRESHOLDS[f"{metric}_threshold"])
+    return df
+
+def weighted_scores(df):
+    """Row-weighted score per metric (tables where a metric applies)"""
+    scores = {}
+    for metric in METRICS:
+        measured = df[df[metric].notna() & (df['rows'] > 0)]
+        scores[metric] = (None if measured.empty else
+                          float((measured[metric] * measured['rows']).sum() / measured['rows'].sum()))
+    return scores
+
+def write_report(df, report_file):
+    """Per-database scores against the thresholds and the failing tables"""
+    for database_name, group in df.groupby('database', sort=False):
+        print_and_log(f"\n{database_name}: {len(group)} tables, {int(group['rows'].sum()):,} rows", report_file)
+        print_and_log("-" * 80, report_file)
+        for metric, score in weighted_scores(group).items():
+            threshold = DATA_QUALITY_THRESHOLDS[f"{metric}_threshold"]
+            failing = int((~group[f"{metric}_ok"]).sum())
+            if score is None:
+                print_and_log(f"  {metric:<13} not applicable", report_file)
+                continue
+            mark = "✅" if score >= threshold and not failing else "❌"
+            print_and_log(f"  {mark} {metric:<13} {score:>8.2%} (target {threshold:.0%}, "
+                          f"{failing} tables below)", report_file)
+            report_file.add_value(f"{database_name}.{metric}", round(score, 6))
+
+        failing = group[~group[[f"{metric}_ok" for metric in METRICS]].all(axis=1)]
+        if len(failing):
+            print_and_log(f"\n  Tables below a threshold:", report_file)
+            for _, row in failing.iterrows():
+                below = ", ".join(f"{metric} {row[metric]:.2%}" for metric in METRICS if not row[f"{metric}_ok"])
+                print_and_log(f"    {row['table']:<30} | {int(row['rows']):>9,} rows | {below}", report_file)
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Score every table against DATA_QUALITY_THRESHOLDS")
+    parser.add_argument('tables', nargs='*', help="Only these tables (default: all tables in both databases)")
+    parser.add_argument('--force', action='store_true', help="Ignore cached results and rescan every table")
+    args = parser.parse_args()
+
+    db = DatabaseConnection()
+    if not db.test_connections():
+        print("Database connection failed!")
+        return
+
+    reports_dir = "forensic_reports"
+    os.makedirs(reports_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(reports_dir, f"data_quality_{timestamp}.txt")
+
+    start = time.time()
+    results, rescanned = assess(db, args.tables, args.force)
+    df = results_frame(results)
+
+    with Report('data_quality', 'all_tables', report_path) as report_file:
+        report_file.write(f"DATA QUALITY REPORT\n")
+        report_file.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        report_file.write(f"{'='*80}\n")
+        print_and_log(f"Scored {len(df)} tables in {time.time() - start:.1f}s "
+                      f"({rescanned} rescanned, {len(df) - rescanned} unchanged since the last run)", report_file)
+        write_report(df, report_file)
+        report_file.add_table('tables', df)
+        print_and_log(f"\nReport saved to: {report_path}", report_file)
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,434 @@
 # database_connection.py - Simple database connection utility
-import mysql.connector
-import pandas as pd
-from sqlalchemy import create_engine
-from config import MYSQL_CONFIG, RAW_DATABASE, CLEANED_DATABASE
+import re
+import threading
+import time
+from collections import OrderedDict
+from cli import lazy_import
+from config import MYSQL_CONFIG, RAW_DATABASE, CLEANED_DATABASE, QUERY_CONFIG, ROUTING_CONFIG, GOVERNOR_CONFIG
+from query_profiler import QueryProfiler
+from typed_schema import apply_schema, apply_arrow_schema
+from endpoint_router import EndpointRouter
+from concurrency_governor import ConcurrencyGovernor
+from arrow_fetch import resolve_fetch_mode, read_connectorx, read_columnar, to_pandas_arrow, result_bytes
+
+# Imported on first use so scripts start (and fail on bad arguments) quickly
+mysql_connector = lazy_import('mysql.connector')
+pd = lazy_import('pandas')
+sqlalchemy = lazy_import('sqlalchemy')
+
+# MySQL: 3024 = MAX_EXECUTION_TIME exceeded, 1317 = interrupted by KILL QUERY
+TIMEOUT_ERRNOS = {3024, 1317}
+# MySQL client errors meaning the server could not be reached or went away
+CONNECTION_ERRNOS = {2002, 2003, 2005, 2006, 2013, 2055}
+_SELECT = re.compile(r'^(\s*SELECT\b)(?!\s*/\*\+)', re.IGNORECASE)
+
+class QueryTimeoutError(Exception):
+    """Raised when a query misses its deadline and was cancelled on the server"""
+
+    def __init__(self, database_name, query, seconds, waiting=False):
+        self.database_name = database_name
+        self.query = query
+        self.seconds = seconds
+        if waiting:
+            message = f"no query slot for {database_name} within {seconds:g}s"
+        else:
+            message = f"query on {database_name} exceeded {seconds:g}s and was cancelled"
+        super().__init__(f"{message} (results for this part are incomplete)")
+
+def _is_timeout(error):
+    """True for server-side time limit / KILL QUERY errors from any driver"""
+    original = getattr(error, 'orig', error)
+    if getattr(original, 'errno', None) in TIMEOUT_ERRNOS:
+        return True
+    return 'interrupted' in str(original).lower()
+
+def _is_connection_error(error):
+    """True when an endpoint is unreachable (worth failing over), not a bad query"""
+    if getattr(error, 'connection_invalidated', False):
+        return True
+    original = getattr(error, 'orig', error)
+    if getattr(original, 'errno', None) in CONNECTION_ERRNOS:
+        return True
+    return 'unable to open database' in str(original).lower()
+
+class _QueryWatchdog:
+    """Cancels the query running on conn if it outlives its deadline
+
+    MySQL statements are killed from a second connection (KILL QUERY);
+    SQLite connections are interrupted directly. Timeout errors leaving
+    the block are raised as QueryTimeoutError.
+    """
+
+    def __init__(self, db, engine, conn, database_name, query, seconds):
+        self.db = db
+        self.engine = engine
+        self.conn = conn
+        self.database_name = database_name
+        self.query = query
+        self.seconds = seconds
+        self.fired = False
+        self.timer = None
+        self.connection_id = None
+
+    def __enter__(self):
+        if not self.seconds:
+            return self
+        if self.engine.dialect.name == 'mysql':
+            # Looked up once per pooled connection
+            info = self.conn.connection.info
+            if 'connection_id' not in info:
+                info['connection_id'] = self.conn.exec_driver_sql("SELECT CONNECTION_ID()").scalar()
+            self.connection_id = info['connection_id']
+        # The server-side hint normally fires first; this covers the fetch
+        # and statements the hint does not apply to
+        self.timer = threading.Timer(self.seconds + QUERY_CONFIG['timeout_grace_seconds'], self._cancel)
+        self.timer.daemon = True
+        self.timer.start()
+        return self
+
+    def _cancel(self):
+        self.fired = True
+        try:
+            if self.connection_id is not None:
+                with self.engine.connect() as killer:
+                    killer.exec_driver_sql(f"KILL QUERY {int(self.connection_id)}")
+            else:
+                self.conn.connection.dbapi_connection.interrupt()
+        except Exception as e:
+            print(f"✗ Could not cancel query on {self.database_name}: {str(e)}")
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.timer:
+            self.timer.cancel()
+        if exc is not None and (self.fired or _is_timeout(exc)):
+            self.db._count_timeout()
+            raise QueryTimeoutError(self.database_name, self.query, self.seconds) from exc
+        return False
 
 class DatabaseConnection:
-    def __init__(self):
+    def __init__(self, query_slots=None, urls=None, query_timeout=None):
         self.config = MYSQL_CONFIG
         self.raw_db = RAW_DATABASE
         self.cleaned_db = CLEANED_DATABASE
 
-        # Create SQLAlchemy engines
-        self.engines = {}
-        for db_name in [self.raw_db, self.cleaned_db]:
-            connection_string = (
-                f"mysql+mysqlconnector://{self.config['user']}:{self.config['password']}"
-                f"@{self.config['host']}:{self.config['port']}/{db_name}"
-            )
-            self.engines[db_name] = create_engine(connection_string)
+        # Endpoints from DATABASE_ENDPOINTS (or MYSQL_CONFIG alone); urls maps
+        # database name -> URL for a single endpoint, e.g. the SQLite stand-ins
+        # used by the benchmarks. Engines are created on first query.
+        database_names = [self.raw_db, self.cleaned_db]
+        self.router = EndpointRouter.from_config(
+            database_names, {name: urls[name] for name in database_names} if urls else None,
+            probe=self._probe)
+        self.urls = self.router.primary.urls
+        self.dialect = self.router.primary.dialect
+        self.config = dict(MYSQL_CONFIG, **{key: value for key, value in self.router.primary.settings.items()
+                                            if key in MYSQL_CONFIG})
+        self._engines = {}
+        self._engine_lock = threading.Lock()
+
+        # Optional semaphore shared with other processes to cap in-flight queries
+        self.query_slots = query_slots
+        # Per-query deadline in seconds (0 or None disables it)
+        self.query_timeout = QUERY_CONFIG['timeout_seconds'] if query_timeout is None else query_timeout
+        self.timeouts = 0
+        # Adaptive in-flight limit per endpoint, created on first use
+        self.governors = {}
+
+        # Small results of execute_query(..., cache=True) calls are reused within a run
+        self.result_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Table lists and structures are looked up constantly and change rarely
+        self.schema_cache = {}
+        self.profiler = QueryProfiler() if QUERY_CONFIG['profile_queries'] else None
+
+    def execute_query(self, query, database_name, schema=None, drop_text=False, fetch_mode=None,
+                      timeout=None, roles=None, cache=False):
+        """Execute query using SQLAlchemy
+
+        schema names a TABLE_SCHEMAS entry whose compact dtypes are applied
+        to the result; drop_text also removes its optional text columns.
+        fetch_mode is 'pandas' (default, QUERY_CONFIG['fetch_mode']),
+        'arrow' for a pyarrow Table or 'pandas_arrow' for a DataFrame with
+        pd.ArrowDtype columns; the last two decode rows column-wise.
+        timeout overrides the connection's deadline for this call; queries
+        that miss it are cancelled and raise QueryTimeoutError. roles picks
+        the endpoint tiers for a read-only query (see ROUTING_CONFIG).
+        cache=True reuses a fresh earlier result of the same query; only
+        schema lookups opt in, since data, MAX(id) watermark and keyset page
+        queries must see rows written since the last call.
+        """
+        fetch_mode = resolve_fetch_mode(fetch_mode)
+        if schema is None and fetch_mode == 'pandas':
+            cache_key = query
+        else:
+            cache_key = (query, schema, drop_text, fetch_mode)
+        cached = self._cache_get(cache_key, database_name) if cache else None
+        if cached is not None:
+            if self.profiler:
+                self.profiler.record(database_name, query, len(cached), 0, 0.0, 0.0, cached=True)
+            return _copy(cached)
+
+        timeout = self.query_timeout if timeout is None else timeout
+        df, fetch_seconds, convert_seconds = self._route(query, database_name, fetch_mode, timeout, roles)
+
+        if schema is not None or fetch_mode == 'pandas_arrow':
+            typed = time.perf_counter()
+            if fetch_mode == 'pandas':
+                df = apply_schema(df, schema, drop_text)
+            else:
+                df = apply_arrow_schema(df, schema, drop_text)
+                if fetch_mode == 'pandas_arrow':
+                    df = to_pandas_arrow(df)
+            convert_seconds += time.perf_counter() - typed
+
+        if self.profiler:
+            self.profiler.record(database_name, query, len(df), result_bytes(df), fetch_seconds, convert_seconds)
+
+        if cache:
+            self._cache_put(cache_key, database_name, df)
+        return df
+
+    def _route(self, query, database_name, fetch_mode, timeout, roles=None):
+        """Fetch on the best endpoint, failing over to the next when one is unreachable"""
+        endpoints = self.router.route(query, roles)
+        if not endpoints:
+            raise ValueError(f"No usable endpoint with role {' / '.join(roles)}")
+
+        for position, endpoint in enumerate(endpoints):
+            self.router.begin(endpoint)
+            try:
+                result = self._fetch_with_slot(endpoint, query, database_name, fetch_mode, timeout)
+                if not endpoint.healthy:
+                    self.router.mark_ok(endpoint)
+                return result
+            except Exception as e:
+                if position == len(endpoints) - 1 or not _is_connection_error(e):
+                    raise
+                self.router.mark_failed(endpoint, e)
+                print(f"✗ {endpoint.name} unavailable ({str(e).splitlines()[0]}), "
+                      f"failing over to {endpoints[position + 1].name}")
+            finally:
+                self.router.end(endpoint)
+
+    def _fetch_with_slot(self, endpoint, query, database_name, fetch_mode, timeout):
+        """_fetch inside the endpoint's adaptive limit and the shared query cap
+
+        Waiting for either counts against the deadline, so a batch never
+        queues forever behind other workers' slow queries.
+        """
+        engine = self.engine(database_name, endpoint)
+        url = endpoint.urls[database_name]
+        governor = self.governor(endpoint)
+
+        if governor and not governor.acquire(timeout or None):
+            self._count_timeout()
+            raise QueryTimeoutError(database_name, query, timeout, waiting=True)
+        # The governor only hears about execution time; time spent queued
+        # for a shared slot says nothing about the server's load
+        start = None
+        try:
+            if self.query_slots is None:
+                start = time.perf_counter()
+                return self._fetch(engine, query, database_name, fetch_mode, timeout, url)
+            if not self.query_slots.acquire(timeout=timeout or None):
+                self._count_timeout()
+                raise QueryTimeoutError(database_name, query, timeout, waiting=True)
+            try:
+                start = time.perf_counter()
+                return self._fetch(engine, query, database_name, fetch_mode, timeout, url)
+            finally:
+                self.query_slots.release()
+        finally:
+            if governor:
+                governor.release(None if start is None else time.perf_counter() - start)
+
+    def governor(self, endpoint=None):
+        """The endpoint's ConcurrencyGovernor (None when GOVERNOR_CONFIG disables it)"""
+        if not GOVERNOR_CONFIG['enabled']:
+            return None
+        endpoint = endpoint or self.router.primary
+        with self._engine_lock:
+            if endpoint.name not in self.governors:
+                self.governors[endpoint.name] = ConcurrencyGovernor(lambda: self._threads_running(endpoint))
+            return self.governors[endpoint.name]
+
+    def _threads_running(self, endpoint):
+        """MySQL Threads_running on an endpoint (None for other servers)"""
+        if endpoint.dialect != 'mysql':
+            return None
+        with self.engine(self.raw_db, endpoint).connect() as conn:
+            row = conn.exec_driver_sql("SHOW GLOBAL STATUS LIKE 'Threads_running'").first()
+        return int(row[1]) if row else None
+
+    def engine(self, database_name, endpoint=None):
+        """SQLAlchemy engine for a database on an endpoint (primary by default)"""
+        endpoint = endpoint or self.router.primary
+        key = (endpoint.name, database_name)
+        with self._engine_lock:
+            if key not in self._engines:
+                self._engines[key] = sqlalchemy.create_engine(endpoint.urls[database_name])
+            return self._engines[key]
+
+    @property
+    def engines(self):
+        """Primary engines for both databases (creates any not yet used)"""
+        return {db_name: self.engine(db_name) for db_name in self.urls}
+
+    def target_description(self):
+        """Servers and databases this connection points at, without passwords"""
+        def strip(url):
+            return re.sub(r'://([^:/@]*):[^@]*@', r'://\1@', url)
+        if len(self.router.endpoints) == 1:
+            return {db_name: strip(url) for db_name, url in self.urls.items()}
+        return {f"{endpoint.name}/{db_name}": strip(url)
+                for endpoint in self.router.endpoints for db_name, url in endpoint.urls.items()}
+
+    def _probe(self, endpoint):
+        """Health check for an endpoint: a round trip plus replication lag (seconds or None)"""
+        with self.engine(self.raw_db, endpoint).connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+            if endpoint.dialect != 'mysql' or endpoint.role != 'replica':
+                return None
+            for statement, column in [("SHOW REPLICA STATUS", 'Seconds_Behind_Source'),
+                                      ("SHOW SLAVE STATUS", 'Seconds_Behind_Master')]:
+                try:
+                    status = conn.exec_driver_sql(statement).mappings().first()
+                except Exception:
+                    continue  # Older servers only know SHOW SLAVE STATUS
+                if status is None:
+                    return None  # Not replicating (e.g. a restored copy)
+                return status.get(column)
+        return None
+
+    def _fetch(self, engine, query, database_name=None, fetch_mode='pandas', timeout=None, url=None):
+        """Run query and build the DataFrame, timing each half separately
 
-    def execute_query(self, query, database_name):
-        """Execute query using SQLAlchemy"""
-        engine = self.engines[database_name]
-        return pd.read_sql(query, engine)
+        The Arrow modes return an Arrow table; decoding happens while
+        fetching there, so it all counts as fetch time.
+        """
+        sql = self._with_time_limit(query, timeout, engine.dialect.name)
+        start = time.perf_counter()
+        if fetch_mode != 'pandas':
+            try:
+                table = read_connectorx(url or self.urls[database_name], sql)
+            except Exception as e:
+                if not _is_timeout(e):
+                    raise
+                self._count_timeout()
+                raise QueryTimeoutError(database_name, query, timeout) from e
+            if table is not None:
+                return table, time.perf_counter() - start, 0.0
+
+        with engine.connect() as conn, _QueryWatchdog(self, engine, conn, database_name, query, timeout):
+            result = conn.exec_driver_sql(sql)
+            if fetch_mode != 'pandas':
+                return read_columnar(result), time.perf_counter() - start, 0.0
+            columns = list(result.keys())
+            rows = result.fetchall()
+        fetched = time.perf_counter()
+
+        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        return df, fetched - start, time.perf_counter() - fetched
+
+    def _with_time_limit(self, query, timeout, dialect=None):
+        """query with a MySQL MAX_EXECUTION_TIME hint when a deadline applies"""
+        if not timeout or (dialect or self.dialect) != 'mysql':
+            return query
+        return _SELECT.sub(rf"\1 /*+ MAX_EXECUTION_TIME({int(timeout * 1000)}) */", query, count=1)
+
+    def _count_timeout(self):
+        with self._cache_lock:
+            self.timeouts += 1
+
+    def _cache_get(self, query, database_name):
+        """Cached result for this exact query, if still fresh"""
+        if not QUERY_CONFIG['cache_results']:
+            return None
+        with self._cache_lock:
+            entry = self.result_cache.get((database_name, query))
+            if entry is None:
+                return None
+            stored_at, df = entry
+            if time.time() - stored_at > QUERY_CONFIG['cache_ttl_seconds']:
+                del self.result_cache[(database_name, query)]
+                return None
+            self.result_cache.move_to_end((database_name, query))
+            return df
+
+    def _cache_put(self, query, database_name, df):
+        """Remember a small result, evicting the least recently used entry"""
+        if not QUERY_CONFIG['cache_results'] or len(df) > QUERY_CONFIG['cache_max_rows']:
+            return
+        with self._cache_lock:
+            self.result_cache[(database_name, query)] = (time.time(), _copy(df))
+            self.result_cache.move_to_end((database_name, query))
+            while len(self.result_cache) > QUERY_CONFIG['cache_max_entries']:
+                self.result_cache.popitem(last=False)
+
+    def clear_cache(self):
+        """Drop all cached query results and schema lookups"""
+        with self._cache_lock:
+            self.result_cache.clear()
+            self.schema_cache.clear()
+
+    def _schema_lookup(self, key, loader):
+        """Schema catalog entry, loading it on a miss or once it is too old"""
+        with self._cache_lock:
+            entry = self.schema_cache.get(key)
+        if entry is not None and time.time() - entry[0] <= QUERY_CONFIG['schema_cache_ttl_seconds']:
+            return entry[1].copy()
+
+        value = loader()
+        with self._cache_lock:
+            self.schema_cache[key] = (time.time(), value)
+        return value.copy()
+
+    def write_query_profile(self, run_name, directory=None):
+        """Save this connection's query profile and start a fresh one"""
+        if not self.profiler:
+            return None
+        path = self.profiler.write(run_name, directory)
+        self.profiler.reset()
+        return path
 
     def test_connections(self):
         """Test connections to both databases"""
         print("Testing Database Connections...")
         print("=" * 50)
 
+        if self.dialect != 'mysql':
+            return self._test_engine_connections()
+
         try:
             # Test server connection
-            conn = mysql.connector.connect(**self.config)
+            conn = mysql_connector.connect(**self.config)
             print("✅ MySQL Server: Connected successfully")
-            conn.close()
 
-            # Test both databases
-            for db_name in [self.raw_db, self.cleaned_db]:
-                config = self.config.copy()
-                config['database'] = db_name
-                conn = mysql.connector.connect(**config)
+            # Test both databases over the same connection
+            try:
                 cursor = conn.cursor()
-                cursor.execute("SHOW TABLES")
-                tables = cursor.fetchall()
-                print(f"✅ {db_name}: {len(tables)} tables found")
+                for db_name in [self.raw_db, self.cleaned_db]:
+                    cursor.execute(f"SHOW TABLES FROM `{db_name}`")
+                    tables = cursor.fetchall()
+                    print(f"✅ {db_name}: {len(tables)} tables found")
                 cursor.close()
+            finally:
                 conn.close()
 
+            self._test_other_endpoints()
+            print("🚀 All connections successful! Ready for analysis.")
+            return True
+
+        except Exception as e:
+            print(f"❌ Connection failed: {e}")
+            return False
+
+    def _test_engine_connections(self):
+        """Test non-MySQL stand-in databases through their engines"""
+        try:
+            for db_name in [self.raw_db, self.cleaned_db]:
+                tables = self.get_table_list(db_name)
+                print(f"✅ {db_name} ({self.dialect}): {len(tables)} tables found")
+            self._test_other_endpoints()
             print("🚀 All connections successful! Ready for analysis.")
             return True
 
@@ -54,16 +436,54 @@ class DatabaseConnection:
             print(f"❌ Connection failed: {e}")
             return False
 
+    def _test_other_endpoints(self):
+        """Report replicas and snapshots; an unreachable one only loses its traffic"""
+        for endpoint in self.router.endpoints:
+            if endpoint.role == 'primary':
+                continue
+            try:
+                lag = self._probe(endpoint)
+                self.router.mark_ok(endpoint)
+                print(f"✅ {endpoint.name} ({endpoint.role}): reachable"
+                      + (f", {lag}s behind" if lag is not None else ""))
+            except Exception as e:
+                self.router.mark_failed(endpoint, e)
+                print(f"🟡 {endpoint.name} ({endpoint.role}): unavailable, reads go elsewhere ({str(e).splitlines()[0]})")
+
     def get_table_list(self, database_name):
         """Get list of all tables"""
-        query = "SHOW TABLES"
-        df = self.execute_query(query, database_name)
+        return self._schema_lookup(('tables', database_name),
+                                   lambda: self._load_table_list(database_name))
+
+    def _load_table_list(self, database_name):
+        if self.dialect == 'sqlite':
+            query = "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+        else:
+            query = "SHOW TABLES"
+        df = self.execute_query(query, database_name, cache=True)
         return df.iloc[:, 0].tolist()
 
     def get_table_structure(self, table_name, database_name):
         """Get table structure"""
+        return self._schema_lookup(('structure', database_name, table_name),
+                                   lambda: self._load_table_structure(table_name, database_name))
+
+    def _load_table_structure(self, table_name, database_name):
+        if self.dialect == 'sqlite':
+            # Same columns as MySQL's DESCRIBE output
+            info = self.execute_query(f"PRAGMA table_info(`{table_name}`)", database_name, cache=True)
+            if info.empty:
+                raise ValueError(f"Table '{table_name}' doesn't exist")
+            return pd.DataFrame({
+                'Field': info['name'],
+                'Type': info['type'],
+                'Null': info['notnull'].map({0: 'YES', 1: 'NO'}),
+                'Key': info['pk'].map(lambda pk: 'PRI' if pk else ''),
+                'Default': info['dflt_value'],
+                'Extra': ''
+            })
         query = f"DESCRIBE `{table_name}`"
-        return self.execute_query(query, database_name)
+        return self.execute_query(query, database_name, cache=True)
 
     def get_table_sample(self, table_name, database_name, limit=10):
         """Get sample data"""
@@ -74,4 +494,92 @@ class DatabaseConnection:
         """Get row count"""
         query = f"SELECT COUNT(*) as row_count FROM `{table_name}`"
         result = self.execute_query(query, database_name)
-        return result.iloc[0]['row_count']
\ No newline at end of file
+        return result.iloc[0]['row_count']
+
+    def get_table_watermarks(self, database_name, key_columns, batch_size=100):
+        """Highest key of many tables, as {table: int or None for an empty table}
+
+        key_columns maps each table to its integer key column. Tables are
+        read batch_size at a time in one UNION ALL query; when a batch
+        fails its tables are read one by one, and a table that still
+        fails is left out of the result.
+        """
+        def query(tables):
+            return " UNION ALL ".join(
+                f"SELECT '{table}' AS table_name, MAX(`{key_columns[table]}`) AS watermark FROM `{table}`"
+                for table in tables)
+
+        tables = list(key_columns)
+        watermarks = {}
+        for start in range(0, len(tables), batch_size):
+            batch = tables[start:start + batch_size]
+            try:
+                frames = [self.execute_query(query(batch), database_name)]
+            except Exception:
+                frames = []
+                for table in batch:
+                    try:
+                        frames.append(self.execute_query(query([table]), database_name))
+                    except Exception:
+                        continue
+            for df in frames:
+                for table, watermark in zip(df['table_name'], df['watermark']):
+                    watermarks[table] = None if pd.isna(watermark) else int(watermark)
+        return watermarks
+
+    def iter_table_chunks(self, table_name, database_name, columns='*', key_column='id',
+                          chunksize=100000, start_after=None, where=None, schema=None,
+                          drop_text=False, fetch_mode=None, roles=None):
+        """Stream a table in key order using keyset pagination
+
+        Yields one DataFrame per chunk so whole-table passes never hold the
+        full table in memory. The key column is always included in the
+        selected columns so the next page can start after the last key seen.
+        schema / drop_text / fetch_mode are passed through to execute_query
+        (fetch_mode defaults to QUERY_CONFIG['bulk_fetch_mode']), as are
+        roles. Sweeps from the start default to
+        ROUTING_CONFIG['bulk_read_roles'] and prefer snapshots and replicas
+        over the primary; catch-ups past start_after use the read_roles of
+        the MAX(id) probes that set their target, since a snapshot may lag
+        behind that id. Pages never use the result cache: the short or empty
+        last page is what an incremental refresh polls for new rows.
+        """
+        if columns != '*':
+            columns = list(columns)
+            if key_column not in columns:
+                columns = [key_column] + columns
+            select_list = ", ".join(f"`{col}`" for col in columns)
+        else:
+            select_list = '*'
+
+        if roles is None and start_after is None:
+            roles = ROUTING_CONFIG['bulk_read_roles']
+        last_key = start_after
+        while True:
+            conditions = []
+            if last_key is not None:
+                conditions.append(f"`{key_column}` > {last_key}")
+            if where:
+                conditions.append(f"({where})")
+            where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+            query = (
+                f"SELECT {select_list} FROM `{table_name}` {where_clause} "
+                f"ORDER BY `{key_column}` LIMIT {int(chunksize)}"
+            )
+            chunk = self.execute_query(query, database_name, schema, drop_text,
+                                       fetch_mode or QUERY_CONFIG['bulk_fetch_mode'],
+                                       roles=roles)
+            if len(chunk) == 0:
+                return
+
+            yield chunk
+
+            if len(chunk) < chunksize:
+                return
+            keys = chunk[key_column]
+            last_key = keys.iloc[-1] if hasattr(keys, 'iloc') else keys[-1].as_py()
+
+def _copy(result):
+    """Defensive copy of a cached result (Arrow tables are immutable)"""
+    return result.copy() if hasattr(result, 'copy') else result
@@ -0,0 +1,168 @@
+# endpoint_router.py - Choose a database endpoint per query by role, load and health
+import itertools
+import re
+import threading
+import time
+from config import MYSQL_CONFIG, DATABASE_ENDPOINTS, ROUTING_CONFIG
+
+READ_ONLY = re.compile(r'^\s*(?:/\*.*?\*/\s*)*(SELECT|SHOW|DESCRIBE|DESC|EXPLAIN|WITH|PRAGMA)\b',
+                       re.IGNORECASE | re.DOTALL)
+
+def is_read_only(query):
+    """True for statements that are safe to send to a replica or snapshot"""
+    return bool(READ_ONLY.match(query))
+
+def endpoint_url(settings, database_name):
+    """SQLAlchemy URL of one database on an endpoint
+
+    Endpoints either give a url_template ("sqlite:///snapshots/{database}.db")
+    or MySQL connection settings, with anything missing taken from MYSQL_CONFIG.
+    """
+    if settings.get('url_template'):
+        return settings['url_template'].format(database=database_name)
+    merged = dict(MYSQL_CONFIG, **settings)
+    return (f"mysql+mysqlconnector://{merged['user']}:{merged['password']}"
+            f"@{merged['host']}:{merged['port']}/{database_name}")
+
+class Endpoint:
+    """One server (or local snapshot) holding both databases"""
+
+    def __init__(self, name, role, urls, settings=None):
+        self.name = name
+        self.role = role
+        self.urls = urls
+        self.settings = settings or {}
+        self.dialect = next(iter(urls.values())).split(':', 1)[0].split('+', 1)[0]
+        self.in_flight = 0
+        self.queries = 0
+        self.healthy = True
+        self.failed_at = None
+        self.last_error = None
+        self.checked_at = 0.0
+        self.lag_seconds = None
+
+    def describe(self):
+        return {'name': self.name, 'role': self.role, 'healthy': self.healthy,
+                'in_flight': self.in_flight, 'queries': self.queries,
+                'lag_seconds': self.lag_seconds, 'last_error': self.last_error}
+
+class EndpointRouter:
+    """Routes read-only queries to replicas/snapshots and everything else to the primary
+
+    Read queries go to the first tier in ROUTING_CONFIG['read_roles'] that
+    has a usable endpoint, picked round-robin or by fewest in-flight
+    queries. Endpoints that fail are skipped for failure_cooldown_seconds;
+    replicas are re-checked (reachability and replication lag) every
+    health_check_interval_seconds by the probe function.
+    """
+
+    def __init__(self, endpoints, policy=None, probe=None):
+        if not any(endpoint.role == 'primary' for endpoint in endpoints):
+            raise ValueError("DATABASE_ENDPOINTS needs an endpoint with role 'primary'")
+        self.endpoints = endpoints
+        self.policy = policy or ROUTING_CONFIG['policy']
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._turns = itertools.count()
+
+    @classmethod
+    def from_config(cls, database_names, urls=None, probe=None):
+        """Router for explicit urls (one primary), DATABASE_ENDPOINTS or MYSQL_CONFIG"""
+        if urls:
+            return cls([Endpoint('primary', 'primary', dict(urls))], probe=probe)
+        settings = DATABASE_ENDPOINTS or [{'name': 'primary', 'role': 'primary'}]
+        endpoints = [
+            Endpoint(entry.get('name', f"{entry['role']}{position}"), entry['role'],
+                     {name: endpoint_url(entry, name) for name in database_names}, entry)
+            for position, entry in enumerate(settings)
+        ]
+        return cls(endpoints, probe=probe)
+
+    @property
+    def primary(self):
+        return next(endpoint for endpoint in self.endpoints if endpoint.role == 'primary')
+
+    def _usable(self, endpoint):
+        if endpoint.healthy:
+            return True
+        # Give failed endpoints another chance after the cooldown
+        return time.time() - (endpoint.failed_at or 0) > ROUTING_CONFIG['failure_cooldown_seconds']
+
+    def _refresh_health(self, endpoint):
+        if self.probe is None or endpoint.role == 'primary':
+            return
+        if time.time() - endpoint.checked_at < ROUTING_CONFIG['health_check_interval_seconds']:
+            return
+        endpoint.checked_at = time.time()
+        try:
+            endpoint.lag_seconds = self.probe(endpoint)
+            max_lag = ROUTING_CONFIG['max_replica_lag_seconds']
+            if endpoint.lag_seconds is not None and max_lag and endpoint.lag_seconds > max_lag:
+                self.mark_failed(endpoint, f"replication lag {endpoint.lag_seconds}s")
+            else:
+                self.mark_ok(endpoint)
+        except Exception as e:
+            self.mark_failed(endpoint, str(e))
+
+    def _pick(self, tier):
+        with self._lock:
+            if self.policy == 'least_loaded':
+                fewest = min(endpoint.in_flight for endpoint in tier)
+                tier = [endpoint for endpoint in tier if endpoint.in_flight == fewest]
+            return tier[next(self._turns) % len(tier)]
+
+    def route(self, query, roles=None):
+        """Endpoints to try for a query, best first (failover order)
+
+        roles lists the tiers to use, in order (e.g. ['snapshot', 'replica']);
+        writes always go to the primary. Without roles read-only queries use
+        ROUTING_CONFIG['read_roles'] and fall back to the primary.
+        """
+        if not is_read_only(query):
+            roles = ['primary']
+        elif roles:
+            roles = list(roles)
+        else:
+            roles = list(ROUTING_CONFIG['read_roles'])
+            if 'primary' not in roles:
+                roles.append('primary')
+
+        order = []
+        for tier_role in roles:
+            tier = [endpoint for endpoint in self.endpoints if endpoint.role == tier_role]
+            for endpoint in tier:
+                self._refresh_health(endpoint)
+            tier = [endpoint for endpoint in tier if self._usable(endpoint)]
+            if tier:
+                first = self._pick(tier)
+                order.append(first)
+                order.extend(endpoint for endpoint in tier if endpoint is not first)
+        if not order:
+            # Nothing is marked usable; try the primary rather than fail outright
+            order = [self.primary] if 'primary' in roles else []
+        return order
+
+    def begin(self, endpoint):
+        with self._lock:
+            endpoint.in_flight += 1
+            endpoint.queries += 1
+
+    def end(self, endpoint):
+        with self._lock:
+            endpoint.in_flight -= 1
+
+    def mark_failed(self, endpoint, error):
+        with self._lock:
+            endpoint.healthy = False
+            endpoint.failed_at = time.time()
+            endpoint.last_error = str(error)
+
+    def mark_ok(self, endpoint):
+        with self._lock:
+            endpoint.healthy = True
+            endpoint.last_error = None
+
+    def status(self):
+        """Per-endpoint role, health and load"""
+        with self._lock:
+            return [endpoint.describe() for endpoint in self.endpoints]
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Fund Flow Graph - Follow money between accounts
+Builds a compact sender -> receiver graph from the whole credit_debit table
+and answers k-hop neighborhood, path and cycle (SCC) questions for an account
+Usage:
+    python3 fund_flow_graph.py build
+    python3 fund_flow_graph.py [user_id] [hops]
+    python3 fund_flow_graph.py path <from_user_id> <to_user_id>
+"""
+
+import numpy as np
+import pandas as pd
+import sys
+import os
+import time
+from datetime import datetime
+from database_connection import DatabaseConnection
+from config import TARGET_ACCOUNT, CACHE_CONFIG, FUND_FLOW_CONFIG
+
+def print_and_log(message, file_handle=None):
+    """Print to console and optionally write to file"""
+    print(message)
+    if file_handle:
+        file_handle.write(message + '\n')
+
+def graph_path():
+    """Location of the persisted graph file"""
+    return os.path.join(CACHE_CONFIG['directory'], FUND_FLOW_CONFIG['graph_file'])
+
+def _to_amount(series):
+    """Convert a text/decimal amount column to float, treating junk as 0"""
+    return pd.to_numeric(series, errors='coerce').fillna(0.0).astype('float64')
+
+def _aggregate_edges(frames):
+    """Collapse partial (sender, receiver) aggregates into one frame"""
+    combined = pd.concat(frames, ignore_index=True)
+    return combined.groupby(['sender_id', 'receiver_id'], sort=False, as_index=False).agg(
+        amount=('amount', 'sum'),
+        count=('count', 'sum')
+    )
+
+class FundFlowGraph:
+    """Directed fund-flow graph stored as CSR arrays
+
+    Nodes are user_ids (sorted, so lookups are a binary search). Edge
+    i -> j aggregates every credit_debit row with sender_id i and
+    receiver_id j: total amount moved and number of transactions.
+    watermark is the highest credit_debit id the graph covers.
+    """
+
+    def __init__(self, node_ids, indptr, indices, amounts, counts, built_at=None, watermark=None):
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.built_at = time.time() if built_at is None else built_at
+        self.watermark = watermark
+        self._reverse = None
+        self._scc_labels = None
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    @classmethod
+    def from_edges(cls, senders, receivers, amounts, counts):
+        """Build CSR arrays from aggregated edge columns"""
+        senders = np.asarray(senders, dtype=np.int64)
+        receivers = np.asarray(receivers, dtype=np.int64)
+
+        node_ids = np.unique(np.concatenate([senders, receivers]))
+        src = np.searchsorted(node_ids, senders)
+        dst = np.searchsorted(node_ids, receivers)
+
+        order = np.lexsort((dst, src))
+        src, dst = src[order], dst[order]
+        amounts = np.asarray(amounts, dtype=np.float64)[order]
+        counts = np.asarray(counts, dtype=np.int64)[order]
+
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(node_ids)), out=indptr[1:])
+
+        return cls(node_ids, indptr, dst, amounts, counts)
+
+    def edge_frame(self):
+        """Every edge as sender_id, receiver_id, amount, count columns"""
+        return pd.DataFrame({
+            'sender_id': np.repeat(self.node_ids, np.diff(self.indptr)),
+            'receiver_id': self.node_ids[self.indices],
+            'amount': self.amounts,
+            'count': self.counts
+        })
+
+    @staticmethod
+    def _scan(db, chunksize=None, start_after=None):
+        """Aggregate credit_debit rows past start_after into edges
+
+        Returns (edges or None, rows read, highest id read).
+        """
+        chunksize = chunksize or CACHE_CONFIG['chunk_size']
+        ignore_ids = set(FUND_FLOW_CONFIG['ignore_ids'])
+
+        partials = []
+        rows_seen = 0
+        watermark = start_after
+
+        for chunk in db.iter_table_chunks('credit_debit', db.raw_db,
+                                          columns=['sender_id', 'receiver_id', 'credit_amt', 'debit_amt'],
+                                          chunksize=chunksize, start_after=start_after):
+            rows_seen += len(chunk)
+            watermark = int(chunk['id'].max())
+
+            edges = pd.DataFrame({
+                'sender_id': pd.to_numeric(chunk['sender_id'], errors='coerce'),
+                'receiver_id': pd.to_numeric(chunk['receiver_id'], errors='coerce'),
+            })
+            credit = _to_amount(chunk['credit_amt'])
+            debit = _to_amount(chunk['debit_amt'])
+            edges['amount'] = np.where(credit > 0, credit, debit)
+            edges['count'] = 1
+
+            edges = edges.dropna(subset=['sender_id', 'receiver_id'])
+            edges = edges[
+                (edges['sender_id'] != edges['receiver_id'])
+                & ~edges['sender_id'].isin(ignore_ids)
+                & ~edges['receiver_id'].isin(ignore_ids)
+            ]
+            if edges.empty:
+                continue
+
+            edges = edges.astype({'sender_id': 'int64', 'receiver_id': 'int64'})
+            partials.append(_aggregate_edges([edges]))
+
+            # Keep the number of partial frames bounded on very large ledgers
+            if len(partials) >= 16:
+                partials = [_aggregate_edges(partials)]
+
+        return (_aggregate_edges(partials) if partials else None), rows_seen, watermark
+
+    @classmethod
+    def build(cls, db, chunksize=None):
+        """Stream credit_debit once and build the graph"""
+        edges, rows_seen, watermark = cls._scan(db, chunksize)
+        print(f"Scanned {rows_seen:,} credit_debit rows")
+
+        if edges is None:
+            graph = cls.from_edges([], [], [], [])
+        else:
+            graph = cls.from_edges(edges['sender_id'].to_numpy(), edges['receiver_id'].to_numpy(),
+                                   edges['amount'].to_numpy(), edges['count'].to_numpy())
+        graph.watermark = 0 if watermark is None else watermark
+        return graph
+
+    def refresh(self, db, chunksize=None):
+        """Add the credit_debit rows past the watermark; returns the rows read
+
+        A graph made with from_edges has no watermark and is left alone.
+        """
+        if self.watermark is None:
+            return 0
+        edges, rows_seen, watermark = self._scan(db, chunksize, self.watermark)
+        self.watermark = watermark
+        if edges is not None:
+            merged = _aggregate_edges([self.edge_frame(), edges])
+            graph = FundFlowGraph.from_edges(merged['sender_id'].to_numpy(), merged['receiver_id'].to_numpy(),
+                                             merged['amount'].to_numpy(), merged['count'].to_numpy())
+            self.node_ids, self.indptr, self.indices = graph.node_ids, graph.indptr, graph.indices
+            self.amounts, self.counts = graph.amounts, graph.counts
+            self._reverse = self._scc_labels = None
+        return rows_seen
+
+    def save(self, path=None):
+        """Persist CSR arrays to a compressed .npz file"""
+        path = path or graph_path()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Written under a per-process name and moved into place, so readers in
+        # other processes never open a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, node_ids=self.node_ids, indptr=self.indptr,
+                            indices=self.indices, amounts=self.amounts, counts=self.counts,
+                            built_at=np.array([self.built_at]),
+                            watermark=np.int64(-1 if self.watermark is None else self.watermark))
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        """Load a graph previously written by save()"""
+        with np.load(path or graph_path()) as data:
+            watermark = int(data['watermark'])
+            return cls(data['node_ids'], data['indptr'], data['indices'], data['amounts'], data['counts'],
+                       float(data['built_at'][0]), None if watermark < 0 else watermark)
+
+    def node_index(self, user_id):
+        """Position of user_id in node_ids, or None if it has no edges"""
+        pos = np.searchsorted(self.node_ids, user_id)
+        if pos < self.num_nodes and self.node_ids[pos] == user_id:
+            return int(pos)
+        return None
+
+    def _reversed(self):
+        """Receiver -> sender CSR arrays, built on first use"""
+        if self._reverse is None:
+            src = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+            order = np.lexsort((src, self.indices))
+            indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=self.num_nodes), out=indptr[1:])
+            self._reverse = (indptr, src[order].astype(np.int32), self.amounts[order], self.counts[order])
+        return self._reverse
+
+    def _adjacency(self, direction):
+        """CSR arrays for 'out' (sent to) or 'in' (received from) edges"""
+        if direction == 'out':
+            return self.indptr, self.indices, self.amounts, self.counts
+        return self._reversed()
+
+    def edges(self, user_id, direction='out'):
+        """Direct counterparties as a DataFrame sorted by amount"""
+        idx = self.node_index(user_id)
+        if idx is None:
+            return pd.DataFrame(columns=['user_id', 'amount', 'count'])
+
+        indptr, indices, amounts, counts = self._adjacency(direction)
+        start, end = indptr[idx], indptr[idx + 1]
+        df = pd.DataFrame({
+            'user_id': self.node_ids[indices[start:end]],
+            'amount': amounts[start:end],
+            'count': counts[start:end]
+        })
+        return df.sort_values('amount', ascending=False, ignore_index=True)
+
+    def _expand(self, frontier, direction):
+        """All neighbours of a frontier of node indices"""
+        if direction == 'both':
+            return np.concatenate([self._expand(frontier, 'out'), self._expand(frontier, 'in')])
+
+        indptr, indices, _, _ = self._adjacency(direction)
+        starts, ends = indptr[frontier], indptr[frontier + 1]
+        if len(frontier) == 0 or (ends - starts).sum() == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([indices[s:e] for s, e in zip(starts, ends)]).astype(np.int64)
+
+    def neighborhood(self, user_id, hops=None, direction='out'):
+        """Accounts reachable within k hops, mapped to their hop distance"""
+        hops = hops or FUND_FLOW_CONFIG['default_hops']
+        idx = self.node_index(user_id)
+        if idx is None:
+            return {}
+
+        distance = np.full(self.num_nodes, -1, dtype=np.int32)
+        distance[idx] = 0
+        frontier = np.array([idx], dtype=np.int64)
+
+        for hop in range(1, hops + 1):
+            reached = np.unique(self._expand(frontier, direction))
+            frontier = reached[distance[reached] < 0]
+            if len(frontier) == 0:
+                break
+            distance[frontier] = hop
+
+        found = np.flatnonzero(distance > 0)
+        return dict(zip(self.node_ids[found].tolist(), distance[found].tolist()))
+
+    def shortest_path(self, source_id, target_id, max_hops=None, direction='out'):
+        """Fewest-hop chain of accounts from source to target, or None"""
+        max_hops = max_hops or FUND_FLOW_CONFIG['max_path_hops']
+        source, target = self.node_index(source_id), self.node_index(target_id)
+        if source is None or target is None:
+            return None
+
+        parent = np.full(self.num_nodes, -1, dtype=np.int64)
+        parent[source] = source
+        frontier = np.array([source], dtype=np.int64)
+
+        for _ in range(max_hops):
+            if parent[target] >= 0:
+                break
+            next_frontier = []
+            for node in frontier:
+                neighbours = self._expand(np.array([node]), direction)
+                neighbours = neighbours[parent[neighbours] < 0]
+                parent[neighbours] = node
+                next_frontier.append(neighbours)
+            frontier = np.unique(np.concatenate(next_frontier)) if next_frontier else frontier[:0]
+            if len(frontier) == 0:
+                break
+
+        if parent[target] < 0:
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(int(parent[path[-1]]))
+        return self.node_ids[path[::-1]].tolist()
+
+    def strongly_connected_component(self, user_id):
+        """Accounts that can both send funds to and receive funds from user_id"""
+        idx = self.node_index(user_id)
+        if idx is None:
+            return []
+
+        if self._scc_labels is None:
+            from scipy.sparse import csr_matrix
+            from scipy.sparse.csgraph import connected_components
+
+            matrix = csr_matrix((np.ones(self.num_edges), self.indices, self.indptr),
+                                shape=(self.num_nodes, self.num_nodes))
+            _, self._scc_labels = connected_components(matrix, directed=True, connection='strong')
+
+        members = np.flatnonzero(self._scc_labels == self._scc_labels[idx])
+        return sorted(self.node_ids[members].tolist())
+
+def load_or_build(db=None):
+    """Load the persisted graph, catching it up with new credit_debit rows
+
+    Rebuilt from scratch when missing or older than max_age_hours (which
+    also picks up edited and deleted rows).
+    """
+    graph = None
+    if os.path.exists(graph_path()):
+        graph = FundFlowGraph.load()
+        if time.time() - graph.built_at >= FUND_FLOW_CONFIG['max_age_hours'] * 3600:
+            graph = None
+
+    db = db or DatabaseConnection()
+    if graph is None:
+        graph = FundFlowGraph.build(db)
+        graph.save()
+    elif graph.refresh(db):
+        graph.save()
+    return graph
+
+def build_graph():
+    """Rebuild the graph from the database and persist it"""
+    print("Building fund flow graph from credit_debit...")
+    db = DatabaseConnection()
+    if not db.test_connections():
+        print("Database connection failed!")
+        return
+
+    graph = FundFlowGraph.build(db)
+    path = graph.save()
+    print(f"✅ Graph built: {graph.num_nodes:,} accounts, {graph.num_edges:,} edges")
+    print(f"Saved to: {path}")
+
+def report_account(user_id, hops):
+    """Write the fund flow report for one account"""
+    graph = load_or_build()
+
+    reports_dir = "forensic_reports"
+    os.makedirs(reports_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(reports_dir, f"fund_flow_{user_id}_{timestamp}.txt")
+
+    with open(report_path, 'w') as report_file:
+        report_file.write(f"FUND FLOW REPORT\n")
+        report_file.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        report_file.write(f"User ID: {user_id}\n")
+        report_file.write(f"{'='*80}\n")
+
+        if graph.node_index(user_id) is None:
+            print_and_log(f"\nUser {user_id} has no sender/receiver links in credit_debit", report_file)
+            return
+
+        for direction, title in [('out', 'FUNDS SENT TO'), ('in', 'FUNDS RECEIVED FROM')]:
+            print_and_log("\n" + "="*80, report_file)
+            print_and_log(f"DIRECT COUNTERPARTIES - {title}", report_file)
+            print_and_log("="*80, report_file)
+
+            edges = graph.edges(user_id, direction)
+            if edges.empty:
+                print_and_log("None", report_file)
+                continue
+
+            print_and_log(f"{'User ID':<15} | {'Transactions':<15} | {'Total Amount':<20}", report_file)
+            print_and_log("-" * 56, report_file)
+            for row in edges.itertuples(index=False):
+                print_and_log(f"{row.user_id:<15} | {row.count:<15} | {row.amount:<20.10f}", report_file)
+
+        for direction, title in [('out', 'DOWNSTREAM (where funds went)'), ('in', 'UPSTREAM (where funds came from)')]:
+            print_and_log("\n" + "="*80, report_file)
+            print_and_log(f"{hops}-HOP NEIGHBORHOOD - {title}", report_file)
+            print_and_log("="*80, report_file)
+
+            reached = graph.neighborhood(user_id, hops, direction)
+            if not reached:
+                print_and_log("None", report_file)
+                continue
+
+            for hop in range(1, hops + 1):
+                accounts = sorted(uid for uid, d in reached.items() if d == hop)
+                if accounts:
+                    print_and_log(f"Hop {hop}: {len(accounts)} account(s)", report_file)
+                    print_and_log("  " + ", ".join(str(uid) for uid in accounts), report_file)
+
+        print_and_log("\n" + "="*80, report_file)
+        print_and_log("CIRCULAR FLOWS (strongly connected component)", report_file)
+        print_and_log("="*80, report_file)
+
+        component = [uid for uid in graph.strongly_connected_component(user_id) if uid != user_id]
+        if component:
+            print_and_log(f"🔴 {len(component)} account(s) both send to and receive from this user (directly or indirectly):", report_file)
+            print_and_log("  " + ", ".join(str(uid) for uid in component), report_file)
+        else:
+            print_and_log("✓ No circular fund flows detected", report_file)
+
+        print_and_log(f"\nReport saved to: {report_path}", report_file)
+
+def report_path_between(source_id, target_id):
+    """Print the shortest fund chain between two accounts"""
+    graph = load_or_build()
+    path = graph.shortest_path(source_id, target_id)
+
+    if path is None:
+        print(f"No fund path from {source_id} to {target_id} within {FUND_FLOW_CONFIG['max_path_hops']} hops")
+        return
+
+    print(f"Fund path ({len(path) - 1} hop(s)):")
+    for sender, receiver in zip(path, path[1:]):
+        edges = graph.edges(sender, 'out')
+        edge = edges[edges['user_id'] == receiver].iloc[0]
+        print(f"  {sender} -> {receiver} | {int(edge['count'])} transaction(s) | {edge['amount']:.10f} BTC")
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+
+    if args and args[0] == 'build':
+        build_graph()
+        return
+
+    try:
+        if args and args[0] == 'path':
+            if len(args) != 3:
+                raise ValueError
+            report_path_between(int(args[1]), int(args[2]))
+            return
+
+        user_id = int(args[0]) if args else TARGET_ACCOUNT
+        hops = int(args[1]) if len(args) > 1 else FUND_FLOW_CONFIG['default_hops']
+    except ValueError:
+        print("Error: User IDs and hop counts must be valid integers")
+        print("Usage: python3 fund_flow_graph.py [build | user_id [hops] | path <from> <to>]")
+        return
+
+    if not args:
+        print(f"No user ID provided, using default: {user_id}")
+
+    report_account(user_id, hops)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Fuzzy Duplicate Matching
+Blocking keys (normalized email, phonetic name codes, phone suffix) over
+user_registration so only small blocks of candidates are compared, then
+Jaro-Winkler scoring to catch typo and alias variants of an account
+Usage:
+    python3 fuzzy_matching.py build
+    python3 fuzzy_matching.py [user_id]
+"""
+
+import re
+import sys
+import os
+import threading
+import time
+from database_connection import DatabaseConnection
+from cli import lazy_import
+from config import TARGET_ACCOUNT, CACHE_CONFIG, FUZZY_MATCH_CONFIG
+
+pd = lazy_import('pandas')
+
+# Loaded blocking table per file modification time, so repeated profiles skip the file read
+_loaded = {}
+_load_lock = threading.Lock()
+
+REGISTRATION_COLUMNS = ['user_id', 'username', 'first_name', 'last_name', 'email', 'telephone', 'country', 'city']
+GMAIL_DOMAINS = {'gmail.com', 'googlemail.com'}
+SOUNDEX_CODES = {c: str(d) for d, letters in enumerate(
+    ['aeiouyhw', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r']) for c in letters}
+TRAILING_DIGITS = re.compile(r'^(.*?)(\d*)$')
+
+def blocking_path():
+    """Location of the persisted blocking table"""
+    return os.path.join(CACHE_CONFIG['directory'], FUZZY_MATCH_CONFIG['blocking_file'])
+
+def _clean(value):
+    """Stripped lowercase string, or '' for nulls and placeholders"""
+    if value is None or pd.isna(value):
+        return ''
+    value = str(value).strip().lower()
+    return '' if value in ('0', 'none', 'null') else value
+
+def normalize_email(email):
+    """Canonical mailbox: lowercase, no +tag, no dots for Gmail"""
+    email = _clean(email)
+    if '@' not in email:
+        return ''
+    local, domain = email.rsplit('@', 1)
+    local = local.split('+', 1)[0]
+    if domain in GMAIL_DOMAINS:
+        local = local.replace('.', '')
+        domain = 'gmail.com'
+    return f"{local}@{domain}" if local else ''
+
+def split_digit_suffix(local):
+    """Email local part as (stem, trailing digits): 'pieter.naidoo72' -> ('pieter.naidoo', '72')"""
+    stem, digits = TRAILING_DIGITS.match(local).groups()
+    return stem, digits
+
+def soundex(name):
+    """American Soundex code of a name ('' if it has no letters)"""
+    letters = re.sub(r'[^a-z]', '', _clean(name))
+    if not letters:
+        return ''
+
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char, '')
+        if digit != '0' and digit != previous:
+            code += digit
+        if char not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+def phone_suffix(phone):
+    """Last N digits of a phone number, ignoring country code and formatting"""
+    digits = re.sub(r'\D', '', _clean(phone))
+    n = FUZZY_MATCH_CONFIG['phone_suffix_digits']
+    return digits[-n:] if len(digits) >= n else ''
+
+def jaro_winkler(a, b):
+    """Jaro-Winkler similarity in [0, 1]"""
+    if a == b:
+        return 1.0 if a else 0.0
+    len_a, len_b = len(a), len(b)
+    if not len_a or not len_b:
+        return 0.0
+
+    window = max(max(len_a, len_b) // 2 - 1, 0)
+    matched_a = [False] * len_a
+    matched_b = [False] * len_b
+    matches = 0
+    for i, char in enumerate(a):
+        for j in range(max(0, i - window), min(len_b, i + window + 1)):
+            if not matched_b[j] and b[j] == char:
+                matched_a[i] = matched_b[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+
+    b_matched = [char for char, used in zip(b, matched_b) if used]
+    transpositions = sum(char != b_matched[k] for k, char in
+                         enumerate(char for char, used in zip(a, matched_a) if used)) / 2
+
+    jaro = (matches / len_a + matches / len_b + (matches - transpositions) / matches) / 3
+
+    prefix = 0
+    for char_a, char_b in zip(a[:4], b[:4]):
+        if char_a != char_b:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+def name_similarity(first_a, last_a, first_b, last_b):
+    """Best full-name similarity, also trying first/last transposed"""
+    name_a = f"{_clean(first_a)} {_clean(last_a)}".strip()
+    if not name_a:
+        return 0.0
+    straight = jaro_winkler(name_a, f"{_clean(first_b)} {_clean(last_b)}".strip())
+    swapped = jaro_winkler(name_a, f"{_clean(last_b)} {_clean(first_b)}".strip())
+    return max(straight, swapped)
+
+def blocking_keys(row):
+    """Block keys for one registration record"""
+    keys = []
+
+    email = normalize_email(row.get('email'))
+    if email:
+        keys.append('e:' + email.split('@', 1)[0])
+
+    codes = sorted(filter(None, [soundex(row.get('first_name')), soundex(row.get('last_name'))]))
+    if len(codes) == 2:
+        keys.append('n:' + ''.join(codes))  # Sorted, so transposed names share a block
+
+    suffix = phone_suffix(row.get('telephone'))
+    if suffix:
+        keys.append('p:' + suffix)
+
+    return keys
+
+class FuzzyMatcher:
+    """Blocked fuzzy matcher over user_registration"""
+
+    def __init__(self, records, built_at=None):
+        self.records = records.reset_index(drop=True)
+        self.built_at = built_at or time.time()
+        self.blocks = {}
+        for pos, keys in enumerate(self.records['keys']):
+            for key in keys:
+                self.blocks.setdefault(key, []).append(pos)
+
+    @classmethod
+    def build(cls, db, chunksize=None):
+        """Stream user_registration once and compute every record's block keys"""
+        chunksize = chunksize or CACHE_CONFIG['chunk_size']
+        frames = []
+        for chunk in db.iter_table_chunks('user_registration', db.raw_db,
+                                          columns=REGISTRATION_COLUMNS, chunksize=chunksize):
+            chunk = chunk.drop(columns=['id'])
+            chunk['email_norm'] = chunk['email'].map(normalize_email)
+            chunk['phone_suffix'] = chunk['telephone'].map(phone_suffix)
+            chunk['keys'] = [blocking_keys(row) for row in chunk.to_dict('records')]
+            frames.append(chunk)
+
+        records = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=REGISTRATION_COLUMNS + ['email_norm', 'phone_suffix', 'keys'])
+        return cls(records)
+
+    def save(self, path=None):
+        """Persist the blocking table"""
+        path = path or blocking_path()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.records.attrs['built_at'] = self.built_at
+        # Written under a per-process name and moved into place, so readers in
+        # other processes never open a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.records.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        """Load a blocking table written by save()"""
+        records = pd.read_pickle(path or blocking_path())
+        return cls(records, records.attrs.get('built_at'))
+
+    def _block_members(self, keys):
+        """Record positions sharing at least one usable block"""
+        members = set()
+        for key in keys:
+            block = self.blocks.get(key, [])
+            if len(block) <= FUZZY_MATCH_CONFIG['max_block_size']:
+                members.update(block)
+        return members
+
+    def score_pair(self, a, b):
+        """Fuzzy evidence that two records are the same person
+
+        Returns (points, matches). Exact email/phone/name equality is left
+        to the caller's exact searches, so only near-matches score here.
+        """
+        points, matches = 0, []
+        weights = FUZZY_MATCH_CONFIG['points']
+
+        email_a, email_b = _clean(a.get('email')), _clean(b.get('email'))
+        norm_a, norm_b = normalize_email(email_a), normalize_email(email_b)
+        if norm_a and norm_b and email_a != email_b:
+            if norm_a == norm_b:
+                points += weights['email_alias']
+                matches.append(f"Email (alias: {email_b})")
+            elif norm_a.split('@')[1] == norm_b.split('@')[1]:
+                # A different trailing number (naidoo72 / naidoo97) is usually another
+                # person picking a free address, not a typo, so the digits must match
+                stem_a, digits_a = split_digit_suffix(norm_a.split('@')[0])
+                stem_b, digits_b = split_digit_suffix(norm_b.split('@')[0])
+                similarity = jaro_winkler(stem_a, stem_b) if digits_a == digits_b else 0.0
+                if similarity >= FUZZY_MATCH_CONFIG['email_similarity_threshold']:
+                    points += weights['email_fuzzy']
+                    matches.append(f"Email (fuzzy {similarity:.2f}: {email_b})")
+
+        phone_a, phone_b = _clean(a.get('telephone')), _clean(b.get('telephone'))
+        suffix_a, suffix_b = phone_suffix(phone_a), phone_suffix(phone_b)
+        if suffix_a and suffix_a == suffix_b and phone_a != phone_b:
+            points += weights['phone_suffix']
+            matches.append(f"Telephone (suffix: {phone_b})")
+
+        exact_name = (_clean(a.get('first_name')), _clean(a.get('last_name'))) == \
+                     (_clean(b.get('first_name')), _clean(b.get('last_name')))
+        if not exact_name:
+            similarity = name_similarity(a.get('first_name'), a.get('last_name'),
+                                         b.get('first_name'), b.get('last_name'))
+            if similarity >= FUZZY_MATCH_CONFIG['name_similarity_threshold']:
+                points += weights['name_fuzzy']
+                matches.append(f"Full Name (fuzzy {similarity:.2f})")
+
+        return points, matches
+
+    def candidates_for(self, profile, exclude_user=None):
+        """Score every record blocked with the profile
+
+        Returns [(user_id, record, points, matches)] for records with at
+        least one fuzzy match, best first.
+        """
+        results = []
+        for pos in self._block_members(blocking_keys(profile)):
+            record = self.records.iloc[pos]
+            uid = int(record['user_id'])
+            if uid == exclude_user:
+                continue
+            points, matches = self.score_pair(profile, record)
+            if points:
+                results.append((uid, record, points, matches))
+        return sorted(results, key=lambda item: item[2], reverse=True)
+
+    def candidate_pairs(self):
+        """Unique record pairs that share a block (population-wide dedupe)"""
+        seen = set()
+        for block in self.blocks.values():
+            if len(block) < 2 or len(block) > FUZZY_MATCH_CONFIG['max_block_size']:
+                continue
+            for i, first in enumerate(block):
+                for second in block[i + 1:]:
+                    pair = (first, second)
+                    if pair not in seen:
+                        seen.add(pair)
+                        yield pair
+
+def load_or_build(db=None):
+    """Load the persisted blocking table, rebuilding it when missing or stale"""
+    path = blocking_path()
+    with _load_lock:
+        if os.path.exists(path):
+            key = (path, os.path.getmtime(path))
+            matcher = _loaded.get(key) or FuzzyMatcher.load(path)
+            if time.time() - matcher.built_at < FUZZY_MATCH_CONFIG['max_age_hours'] * 3600:
+                _loaded.clear()
+                _loaded[key] = matcher
+                return matcher
+
+        db = db or DatabaseConnection()
+        matcher = FuzzyMatcher.build(db)
+        matcher.save(path)
+        _loaded.clear()
+        _loaded[(path, os.path.getmtime(path))] = matcher
+        return matcher
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+
+    if args and args[0] == 'build':
+        db = DatabaseConnection()
+        if not db.test_connections():
+            print("Database connection failed!")
+            return
+        matcher = FuzzyMatcher.build(db)
+        path = matcher.save()
+        print(f"✅ Blocked {len(matcher.records):,} registrations into {len(matcher.blocks):,} blocks")
+        print(f"Saved to: {path}")
+        return
+
+    try:
+        user_id = int(args[0]) if args else TARGET_ACCOUNT
+    except ValueError:
+        print("Error: User ID must be a valid integer")
+        print("Usage: python3 fuzzy_matching.py [build | user_id]")
+        return
+
+    matcher = load_or_build()
+    rows = matcher.records[matcher.records['user_id'] == user_id]
+    if rows.empty:
+        print(f"User {user_id} not found in user_registration")
+        return
+
+    results = matcher.candidates_for(rows.iloc[0], exclude_user=user_id)
+    print(f"Fuzzy matches for user {user_id}: {len(results)}\n")
+    for uid, record, points, matches in results:
+        print(f"  User ID: {uid} (Score: {points})")
+        print(f"    Name: {record['first_name']} {record['last_name']}")
+        print(f"    Email: {record['email']}")
+        print(f"    Phone: {record['telephone']}")
+        print(f"    Matching Fields: {', '.join(matches)}")
+        print()
+
+if __name__ == "__main__":
+    main()
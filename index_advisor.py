@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Index Advisor - Check the server's indexes against the forensic query workload
+Compares information_schema.STATISTICS and EXPLAIN output for the query
+shapes the analysis scripts issue, and suggests DDL for missing indexes
+Usage: python3 index_advisor.py [--all-tables]
+"""
+
+import pandas as pd
+import sys
+import os
+from datetime import datetime
+from database_connection import DatabaseConnection
+from account_table_summary import find_account_column
+from column_profiler import load_profiles
+from config import TARGET_ACCOUNT, RAW_DATABASE, CLEANED_DATABASE
+
+# Canonical query shapes issued by the analysis scripts. 'index' lists the
+# key parts (columns, or SQL expressions in parentheses) that would serve
+# the filter; 'note' explains shapes no ordinary index can fix.
+WORKLOAD = [
+    {'script': 'wallet_analysis', 'database': RAW_DATABASE, 'table': 'credit_debit',
+     'query': "SELECT * FROM credit_debit WHERE user_id = {account} ORDER BY ts",
+     'index': ['user_id', 'ts'],
+     'note': "The user's whole ledger, loaded once and shared by the e-wallet, deposit and withdrawal "
+             "sections; (user_id, ts) serves both the filter and the ORDER BY."},
+    {'script': 'wallet_analysis', 'database': RAW_DATABASE, 'table': 'user_addresses',
+     'query': "SELECT * FROM user_addresses WHERE user_id = {account}", 'index': ['user_id']},
+    {'script': 'wallet_analysis', 'database': RAW_DATABASE, 'table': 'working_e_wallet',
+     'query': "SELECT * FROM working_e_wallet WHERE user_id = {account}", 'index': ['user_id']},
+    {'script': 'wallet_analysis', 'database': RAW_DATABASE, 'table': 'roi_e_wallet',
+     'query': "SELECT * FROM roi_e_wallet WHERE user_id = {account}", 'index': ['user_id']},
+    {'script': 'wallet_analysis', 'database': RAW_DATABASE, 'table': 'final_e_wallet',
+     'query': "SELECT * FROM final_e_wallet WHERE user_id = {account}", 'index': ['user_id']},
+    {'script': 'wallet_analysis', 'database': RAW_DATABASE, 'table': 'withdraw_request',
+     'query': "SELECT * FROM withdraw_request WHERE user_id = {account} ORDER BY id", 'index': ['user_id']},
+    {'script': 'wallet_analysis', 'database': RAW_DATABASE, 'table': 'withdraw_confirm',
+     'query': "SELECT * FROM withdraw_confirm WHERE userid = {account} ORDER BY id", 'index': ['userid']},
+    {'script': 'build_user_profile', 'database': RAW_DATABASE, 'table': 'visitor',
+     'query': "SELECT * FROM visitor WHERE user_id = {account}", 'index': ['user_id']},
+    {'script': 'ip_index', 'database': RAW_DATABASE, 'table': 'visitor',
+     'query': "SELECT user_id, `ipadd` AS ip, MIN(`times`) AS first_seen, MAX(`times`) AS last_seen, "
+              "COUNT(*) AS visits FROM visitor WHERE `ipadd` IS NOT NULL AND `ipadd` != '' GROUP BY user_id, `ipadd`",
+     'index': ['user_id', 'ipadd', 'times'],
+     'note': "A full pass by design (the IP index is rebuilt from it); a covering index lets the server "
+             "scan the index instead of the table."},
+    {'script': 'ip_index', 'database': RAW_DATABASE, 'table': 'visitor',
+     'query': "SELECT user_id, `ip` AS ip, MIN(`times`) AS first_seen, MAX(`times`) AS last_seen, "
+              "COUNT(*) AS visits FROM visitor WHERE `ip` IS NOT NULL AND `ip` != '' GROUP BY user_id, `ip`",
+     'index': ['user_id', 'ip', 'times']},
+    {'script': 'build_user_profile', 'database': RAW_DATABASE, 'table': 'user_registration',
+     'query': "SELECT * FROM user_registration WHERE user_id = {account}", 'index': ['user_id']},
+    {'script': 'build_user_profile', 'database': RAW_DATABASE, 'table': 'user_registration',
+     'query': "SELECT user_id FROM user_registration WHERE user_id != {account} "
+              "AND LOWER(email) = LOWER('someone@example.com')",
+     'index': ['(LOWER(email))'],
+     'note': "LOWER(column) hides a plain index on email. Use a functional index (MySQL 8.0.13+) or a "
+             "generated column; with a case-insensitive collation a plain index on email plus "
+             "`email = '...'` is equivalent."},
+    {'script': 'build_user_profile', 'database': RAW_DATABASE, 'table': 'user_registration',
+     'query': "SELECT user_id FROM user_registration WHERE user_id != {account} AND telephone = '0833218173'",
+     'index': ['telephone']},
+    {'script': 'build_user_profile', 'database': RAW_DATABASE, 'table': 'user_registration',
+     'query': "SELECT user_id FROM user_registration WHERE user_id != {account} "
+              "AND LOWER(first_name) = LOWER('Herman') AND LOWER(last_name) = LOWER('Bester')",
+     'index': ['(LOWER(last_name))', '(LOWER(first_name))']},
+    {'script': 'account_table_summary', 'database': CLEANED_DATABASE, 'table': 'mtitransactions',
+     'query': "SELECT COUNT(*) as count FROM mtitransactions WHERE userid = {account}", 'index': ['userid']},
+]
+
+PROFILE_SIDE_TABLES = ['manage_messages', 'previous_record', 'updated_record', 'support_log']
+
+def print_and_log(message, file_handle=None):
+    """Print to console and optionally write to file"""
+    print(message)
+    if file_handle:
+        file_handle.write(message + '\n')
+
+def load_index_catalog(db, database_name):
+    """Every index in a schema as {table: {index_name: [key parts]}}
+
+    Key parts are column names, or '(expression)' for functional indexes.
+    """
+    base = f"""
+        SELECT TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX, COLUMN_NAME{{expression}}
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = '{database_name}'
+        ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+    """
+    try:
+        stats = db.execute_query(base.format(expression=", EXPRESSION"), database_name)
+    except Exception:
+        # MariaDB and MySQL < 8.0.13 have no EXPRESSION column
+        stats = db.execute_query(base.format(expression=""), database_name)
+        stats['EXPRESSION'] = None
+
+    catalog = {}
+    for row in stats.itertuples(index=False):
+        part = row.COLUMN_NAME if pd.notna(row.COLUMN_NAME) else f"({row.EXPRESSION})"
+        catalog.setdefault(row.TABLE_NAME, {}).setdefault(row.INDEX_NAME, []).append(part)
+    return catalog
+
+def _normalize_part(part):
+    return str(part).lower().replace('`', '').replace(' ', '')
+
+def has_leading_index(catalog, table, key_parts):
+    """Name of an index whose leading key part matches the first wanted part"""
+    wanted = _normalize_part(key_parts[0])
+    for name, parts in catalog.get(table, {}).items():
+        if _normalize_part(parts[0]) == wanted:
+            return name
+    return None
+
+def suggest_ddl(table, key_parts):
+    """ALTER TABLE statements that would create the wanted index"""
+    names = [part.strip('()').lower().replace('(', '_').replace(')', '') for part in key_parts]
+    index_name = f"idx_{table}_{'_'.join(names)}"[:64]
+    parts_sql = ", ".join(part if part.startswith('(') else f"`{part}`" for part in key_parts)
+    statements = [f"ALTER TABLE `{table}` ADD INDEX `{index_name}` ({parts_sql});"]
+
+    expressions = [part for part in key_parts if part.startswith('(')]
+    if expressions:
+        # Generated-column alternative for servers without functional indexes
+        columns, generated = [], []
+        for part in key_parts:
+            if part.startswith('('):
+                inner = part[1:-1]
+                column = inner.lower().replace('(', '_').replace(')', '')
+                generated.append(f"ADD COLUMN `{column}` VARCHAR(255) AS ({inner}) STORED")
+                columns.append(f"`{column}`")
+            else:
+                columns.append(f"`{part}`")
+        statements.append(
+            f"-- MariaDB / MySQL < 8.0.13:\n"
+            f"ALTER TABLE `{table}` {', '.join(generated)}, ADD INDEX `{index_name}` ({', '.join(columns)});"
+        )
+    return statements
+
+def explain(db, query, database_name):
+    """EXPLAIN rows for a query as a DataFrame"""
+    return db.execute_query(f"EXPLAIN {query}", database_name)
+
+def analyze_workload(db, report_file, account):
+    """EXPLAIN every canonical shape and check it has a usable index"""
+    print_and_log("\n" + "="*80, report_file)
+    print_and_log("CANONICAL QUERY SHAPES", report_file)
+    print_and_log("="*80, report_file)
+
+    catalogs = {name: load_index_catalog(db, name) for name in [db.raw_db, db.cleaned_db]}
+    suggestions = []
+
+    for item in WORKLOAD:
+        query = item['query'].format(account=account)
+        catalog = catalogs[item['database']]
+        print_and_log(f"\n[{item['script']}] {item['table']}", report_file)
+        print_and_log(f"  Query: {query}", report_file)
+
+        try:
+            plan = explain(db, query, item['database'])
+            for row in plan.to_dict('records'):
+                access = row.get('type')
+                print_and_log(f"  Plan: type={access} key={row.get('key')} rows={row.get('rows')} "
+                              f"extra={row.get('Extra')}", report_file)
+                if access == 'ALL':
+                    print_and_log(f"  🔴 FULL TABLE SCAN (~{row.get('rows')} rows examined)", report_file)
+        except Exception as e:
+            print_and_log(f"  ✗ EXPLAIN failed: {str(e)}", report_file)
+            continue
+
+        existing = has_leading_index(catalog, item['table'], item['index'])
+        if existing:
+            print_and_log(f"  ✓ Served by index {existing} ({', '.join(catalog[item['table']][existing])})", report_file)
+        else:
+            print_and_log(f"  🔴 Missing index on ({', '.join(item['index'])})", report_file)
+            suggestions.append((item['table'], item['index']))
+
+        if item.get('note'):
+            print_and_log(f"  Note: {item['note']}", report_file)
+
+    return suggestions
+
+def analyze_account_columns(db, report_file, tables=None):
+    """account_table_summary counts on the account column of every table"""
+    print_and_log("\n" + "="*80, report_file)
+    print_and_log("ACCOUNT COLUMN INDEXES (account_table_summary workload)", report_file)
+    print_and_log("="*80, report_file)
+
+    suggestions = []
+    for database_name in [db.raw_db, db.cleaned_db]:
+        catalog = load_index_catalog(db, database_name)
+        names = db.get_table_list(database_name)
+        if tables is not None:
+            names = [name for name in names if name in tables]
+
+        missing = 0
+        for table in names:
+            try:
+                column = find_account_column(db, table, database_name)
+            except Exception:
+                continue
+            if column and not has_leading_index(catalog, table, [column]):
+                missing += 1
+                print_and_log(f"  🔴 {database_name}.{table}: no index on `{column}`", report_file)
+                if database_name == db.raw_db:
+                    suggestions.append((table, [column]))
+        print_and_log(f"  {database_name}: {missing} of {len(names)} table(s) lack an account-column index", report_file)
+
+    load_profiles().save()
+    return suggestions
+
+def main():
+    """Main entry point"""
+    all_tables = '--all-tables' in sys.argv[1:]
+
+    db = DatabaseConnection()
+    if not db.test_connections():
+        print("Database connection failed!")
+        return
+    if db.dialect != 'mysql':
+        print("Index advisor requires a MySQL/MariaDB server")
+        return
+
+    reports_dir = "forensic_reports"
+    os.makedirs(reports_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(reports_dir, f"index_advisor_{timestamp}.txt")
+
+    with open(report_path, 'w') as report_file:
+        report_file.write(f"INDEX ADVISOR REPORT\n")
+        report_file.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        report_file.write(f"{'='*80}\n")
+
+        suggestions = analyze_workload(db, report_file, TARGET_ACCOUNT)
+        side_tables = None if all_tables else PROFILE_SIDE_TABLES + [item['table'] for item in WORKLOAD]
+        suggestions += analyze_account_columns(db, report_file, side_tables)
+
+        print_and_log("\n" + "="*80, report_file)
+        print_and_log("SUGGESTED DDL", report_file)
+        print_and_log("="*80, report_file)
+
+        seen = set()
+        for table, key_parts in suggestions:
+            key = (table, tuple(key_parts))
+            # A wider index on the same leading columns serves both shapes
+            wider = any(other_table == table and len(other) > len(key_parts)
+                        and list(other[:len(key_parts)]) == list(key_parts)
+                        for other_table, other in suggestions)
+            if key in seen or wider:
+                continue
+            seen.add(key)
+            print_and_log("", report_file)
+            for statement in suggest_ddl(table, key_parts):
+                print_and_log(statement, report_file)
+
+        if not seen:
+            print_and_log("\n✓ Every canonical query shape has a usable index", report_file)
+
+        print_and_log(f"\nReport saved to: {report_path}", report_file)
+
+if __name__ == "__main__":
+    main()
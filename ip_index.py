@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+IP Address Index
+Sorted packed-integer index of every (IP, user_id) pair in the visitor table
+with first/last-seen times, for exact, /24 and arbitrary CIDR lookups,
+caught up from the visitor id watermark
+Usage:
+    python3 ip_index.py build
+    python3 ip_index.py <ip | cidr>
+"""
+
+import ipaddress
+import sys
+import os
+import threading
+import time
+from database_connection import DatabaseConnection
+from cli import lazy_import
+from config import CACHE_CONFIG, IP_INDEX_CONFIG
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Loaded index per file modification time, so repeated lookups skip the file read
+_loaded = {}
+_load_lock = threading.Lock()
+
+def index_path():
+    """Location of the persisted index file"""
+    return os.path.join(CACHE_CONFIG['directory'], IP_INDEX_CONFIG['index_file'])
+
+def pack_ips(values):
+    """Vectorized dotted-quad -> uint32 conversion; invalid/IPv6 become -1"""
+    parts = pd.Series(values, dtype='object').astype(str).str.strip().str.split('.', expand=True)
+    if parts.shape[1] < 4:
+        return np.full(len(values), -1, dtype=np.int64)
+
+    octets = parts.iloc[:, :4].apply(pd.to_numeric, errors='coerce')
+    valid = octets.notna().all(axis=1) & octets.ge(0).all(axis=1) & octets.le(255).all(axis=1)
+    valid &= parts.iloc[:, 4:].isna().all(axis=1)
+    octets = octets.fillna(0).astype(np.int64).to_numpy()
+
+    packed = (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+    return np.where(valid.to_numpy(), packed, -1)
+
+def unpack_ip(value):
+    """uint32 -> dotted-quad string"""
+    return str(ipaddress.IPv4Address(int(value)))
+
+def network_range(network):
+    """Inclusive packed bounds of an IP or CIDR string"""
+    net = ipaddress.IPv4Network(str(network).strip(), strict=False)
+    return int(net.network_address), int(net.broadcast_address)
+
+class IPIndex:
+    """Parallel NumPy arrays sorted by packed IP
+
+    Each position is one (ip, user_id) pair aggregated over all of that
+    user's visits from the address.
+    """
+
+    def __init__(self, ips, user_ids, first_seen, last_seen, visits, built_at=None, watermark=None):
+        self.ips = np.asarray(ips, dtype=np.uint32)
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.first_seen = np.asarray(first_seen, dtype='datetime64[s]')
+        self.last_seen = np.asarray(last_seen, dtype='datetime64[s]')
+        self.visits = np.asarray(visits, dtype=np.int64)
+        self.built_at = time.time() if built_at is None else built_at
+        # Highest visitor id covered; None when visitor has no id column
+        self.watermark = watermark
+
+    def __len__(self):
+        return len(self.ips)
+
+    @staticmethod
+    def _latest_id(db):
+        """Highest visitor id right now, 0 for an empty table, None without an id column"""
+        structure = db.get_table_structure('visitor', db.raw_db)
+        if 'id' not in set(structure['Field']):
+            return None
+        df = db.execute_query("SELECT MAX(`id`) AS watermark FROM visitor", db.raw_db)
+        latest = df['watermark'].iloc[0]
+        return 0 if pd.isna(latest) else int(latest)
+
+    @staticmethod
+    def _pairs(db, after=None, upto=None):
+        """Visits aggregated server-side per (ip, user_id), optionally for after < id <= upto"""
+        structure = db.get_table_structure('visitor', db.raw_db)
+        fields = {name.lower(): name for name in structure['Field']}
+
+        ip_columns = [fields[col] for col in IP_INDEX_CONFIG['ip_columns'] if col in fields]
+        time_column = next((fields[col] for col in IP_INDEX_CONFIG['time_columns'] if col in fields), None)
+        if not ip_columns:
+            raise ValueError("visitor table has none of the configured IP columns")
+
+        first = f"MIN(`{time_column}`)" if time_column else "NULL"
+        last = f"MAX(`{time_column}`)" if time_column else "NULL"
+        id_range = ""
+        if after is not None:
+            id_range += f" AND `id` > {after}"
+        if upto is not None:
+            id_range += f" AND `id` <= {upto}"
+
+        frames = []
+        for col in ip_columns:
+            query = f"""
+                SELECT user_id, `{col}` AS ip, {first} AS first_seen, {last} AS last_seen, COUNT(*) AS visits
+                FROM visitor
+                WHERE `{col}` IS NOT NULL AND `{col}` != ''{id_range}
+                GROUP BY user_id, `{col}`
+            """
+            frames.append(db.execute_query(query, db.raw_db))
+
+        pairs = pd.concat(frames, ignore_index=True)
+        pairs['ip'] = pack_ips(pairs['ip'].to_numpy())
+        pairs['user_id'] = pd.to_numeric(pairs['user_id'], errors='coerce')
+        pairs = pairs[(pairs['ip'] >= 0) & pairs['user_id'].notna()]
+        pairs['first_seen'] = pd.to_datetime(pairs['first_seen'], errors='coerce')
+        pairs['last_seen'] = pd.to_datetime(pairs['last_seen'], errors='coerce')
+
+        # ip and ipadd usually hold the same address for a visit, so take the
+        # larger count rather than adding the two columns together
+        return pairs.groupby(['ip', 'user_id'], as_index=False).agg(
+            first_seen=('first_seen', 'min'),
+            last_seen=('last_seen', 'max'),
+            visits=('visits', 'max')
+        )
+
+    def _set_pairs(self, pairs):
+        pairs = pairs.sort_values(['ip', 'user_id'])
+        self.ips = pairs['ip'].to_numpy(dtype=np.uint32)
+        self.user_ids = pairs['user_id'].to_numpy(dtype=np.int64)
+        self.first_seen = pairs['first_seen'].to_numpy(dtype='datetime64[s]')
+        self.last_seen = pairs['last_seen'].to_numpy(dtype='datetime64[s]')
+        self.visits = pairs['visits'].to_numpy(dtype=np.int64)
+
+    @classmethod
+    def build(cls, db):
+        """Aggregate visitor server-side per (user_id, ip) and index the result"""
+        watermark = cls._latest_id(db)
+        index = cls([], [], [], [], [], watermark=watermark)
+        index._set_pairs(cls._pairs(db, upto=watermark))
+        return index
+
+    def refresh(self, db):
+        """Merge in visits past the id watermark; returns True if any were added
+
+        Indexes without a watermark (visitor has no id) are left alone and
+        only rebuilt once they pass max_age_hours.
+        """
+        if self.watermark is None:
+            return False
+        latest = self._latest_id(db)
+        if latest is None or latest <= self.watermark:
+            return False
+
+        new = self._pairs(db, after=self.watermark, upto=latest)
+        self.watermark = latest
+        if new.empty:
+            return True
+        current = pd.DataFrame({'ip': self.ips.astype(np.int64), 'user_id': self.user_ids,
+                                'first_seen': self.first_seen, 'last_seen': self.last_seen,
+                                'visits': self.visits})
+        self._set_pairs(pd.concat([current, new], ignore_index=True).groupby(['ip', 'user_id'], as_index=False).agg(
+            first_seen=('first_seen', 'min'),
+            last_seen=('last_seen', 'max'),
+            visits=('visits', 'sum')
+        ))
+        return True
+
+    def save(self, path=None):
+        """Persist arrays to a compressed .npz file"""
+        path = path or index_path()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Written under a per-process name and moved into place, so readers in
+        # other processes never open a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, ips=self.ips, user_ids=self.user_ids,
+                            first_seen=self.first_seen.astype(np.int64),
+                            last_seen=self.last_seen.astype(np.int64),
+                            visits=self.visits, built_at=np.array([self.built_at]),
+                            watermark=np.int64(-1 if self.watermark is None else self.watermark))
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        """Load an index written by save()"""
+        with np.load(path or index_path()) as data:
+            watermark = int(data['watermark'])
+            return cls(data['ips'], data['user_ids'],
+                       data['first_seen'].astype('datetime64[s]'),
+                       data['last_seen'].astype('datetime64[s]'),
+                       data['visits'], float(data['built_at'][0]), None if watermark < 0 else watermark)
+
+    def lookup_range(self, low, high):
+        """All (ip, user_id) rows with low <= ip <= high as a DataFrame"""
+        start = np.searchsorted(self.ips, low, side='left')
+        end = np.searchsorted(self.ips, high, side='right')
+        return pd.DataFrame({
+            'ip': [unpack_ip(ip) for ip in self.ips[start:end]],
+            'user_id': self.user_ids[start:end],
+            'first_seen': self.first_seen[start:end],
+            'last_seen': self.last_seen[start:end],
+            'visits': self.visits[start:end]
+        })
+
+    def lookup(self, ip_or_cidr):
+        """Exact IP (a.b.c.d) or CIDR (a.b.c.0/24) lookup"""
+        low, high = network_range(ip_or_cidr)
+        return self.lookup_range(low, high)
+
+    def subnet(self, ip, prefix=None):
+        """Everything in the same /prefix network as ip (default /24)"""
+        prefix = prefix or IP_INDEX_CONFIG['subnet_prefix']
+        return self.lookup(f"{ip}/{prefix}")
+
+    def colocated_users(self, ips, prefix=32, exclude_user=None):
+        """Users seen on any of the given IPs (or their /prefix networks)
+
+        Returns one row per user with the matching IPs and the overall
+        first/last time they were seen there.
+        """
+        frames = []
+        for ip in ips:
+            try:
+                frames.append(self.lookup(f"{ip}/{prefix}"))
+            except ValueError:
+                continue  # IPv6 or malformed addresses are not indexed
+
+        if not frames:
+            return pd.DataFrame(columns=['user_id', 'ips', 'first_seen', 'last_seen', 'visits'])
+
+        matches = pd.concat(frames, ignore_index=True)
+        if exclude_user is not None:
+            matches = matches[matches['user_id'] != exclude_user]
+
+        return matches.groupby('user_id', as_index=False).agg(
+            ips=('ip', lambda values: sorted(set(values))),
+            first_seen=('first_seen', 'min'),
+            last_seen=('last_seen', 'max'),
+            visits=('visits', 'sum')
+        )
+
+def load_or_build(db=None):
+    """Load the persisted index, catching it up with new visits
+
+    Rebuilt from scratch when missing or older than max_age_hours (which
+    also picks up edited and deleted visits).
+    """
+    path = index_path()
+    with _load_lock:
+        index = None
+        if os.path.exists(path):
+            # An empty index is falsy (__len__), so test for a cache miss explicitly
+            index = _loaded.get((path, os.path.getmtime(path)))
+            if index is None:
+                index = IPIndex.load(path)
+            if time.time() - index.built_at >= IP_INDEX_CONFIG['max_age_hours'] * 3600:
+                index = None
+
+        db = db or DatabaseConnection()
+        if index is None:
+            index = IPIndex.build(db)
+            index.save(path)
+        elif index.refresh(db):
+            index.save(path)
+        _loaded.clear()
+        _loaded[(path, os.path.getmtime(path))] = index
+        return index
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python3 ip_index.py [build | <ip> | <cidr>]")
+        return
+
+    if args[0] == 'build':
+        db = DatabaseConnection()
+        if not db.test_connections():
+            print("Database connection failed!")
+            return
+        index = IPIndex.build(db)
+        path = index.save()
+        print(f"✅ Indexed {len(index):,} (ip, user) pairs from {len(np.unique(index.ips)):,} distinct IPs")
+        print(f"Saved to: {path}")
+        return
+
+    try:
+        network_range(args[0])
+    except ValueError:
+        print(f"Error: {args[0]} is not a valid IPv4 address or CIDR range")
+        return
+
+    index = load_or_build()
+    matches = index.lookup(args[0])
+    print(f"{len(matches)} (ip, user) pair(s) in {args[0]}:\n")
+    if not matches.empty:
+        print(f"{'IP':<18} | {'User ID':<12} | {'Visits':<8} | {'First Seen':<20} | {'Last Seen':<20}")
+        print("-" * 90)
+        for row in matches.itertuples(index=False):
+            print(f"{row.ip:<18} | {row.user_id:<12} | {row.visits:<8} | {str(row.first_seen):<20} | {str(row.last_seen):<20}")
+
+if __name__ == "__main__":
+    main()
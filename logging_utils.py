@@ -0,0 +1,22 @@
+# logging_utils.py - Shared logger setup driven by LOGGING_CONFIG
+import logging
+import os
+from logging.handlers import RotatingFileHandler
+from config import LOGGING_CONFIG
+
+def get_logger(name):
+    """Logger writing to the rotating log file configured in LOGGING_CONFIG"""
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+
+    log_file = LOGGING_CONFIG['file']
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+
+    handler = RotatingFileHandler(log_file, maxBytes=LOGGING_CONFIG['max_bytes'],
+                                  backupCount=LOGGING_CONFIG['backup_count'])
+    handler.setFormatter(logging.Formatter(LOGGING_CONFIG['format']))
+    logger.addHandler(handler)
+    logger.setLevel(LOGGING_CONFIG['level'])
+    logger.propagate = False
+    return logger
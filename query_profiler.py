@@ -0,0 +1,119 @@
+# query_profiler.py - Per-query timing and result-size instrumentation
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from config import QUERY_CONFIG
+from logging_utils import get_logger
+
+_COMMENTS = re.compile(r'/\*.*?\*/|--[^\n]*', re.S)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBERS = re.compile(r'(?<![\w`])-?\d+(?:\.\d+)?(?![\w`])')
+_IN_LISTS = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.I)
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_sql(query):
+    """Query shape with literals replaced by ?, e.g. for grouping timings
+
+    "SELECT * FROM visitor WHERE user_id = 88295329" and the same query for
+    another user share the shape "SELECT * FROM visitor WHERE user_id = ?".
+    """
+    shape = _COMMENTS.sub(' ', str(query))
+    shape = _STRINGS.sub('?', shape)
+    shape = _NUMBERS.sub('?', shape)
+    shape = _IN_LISTS.sub('IN (?...)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+class QueryProfiler:
+    """Collects one record per execute_query call and summarizes them by shape"""
+
+    def __init__(self):
+        self.records = []
+        self.started = datetime.now()
+        self._lock = threading.Lock()
+
+    def record(self, database, query, rows, size_bytes, fetch_seconds, convert_seconds, cached=False):
+        """Add one query measurement"""
+        with self._lock:
+            self.records.append({
+                'database': database,
+                'shape': normalize_sql(query),
+                'rows': int(rows),
+                'bytes': int(size_bytes),
+                'fetch_seconds': fetch_seconds,
+                'convert_seconds': convert_seconds,
+                'cached': cached
+            })
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self.records = []
+            self.started = datetime.now()
+
+    def summary(self, top_n=None):
+        """Per-run totals plus the slowest query shapes"""
+        top_n = top_n or QUERY_CONFIG['profile_top_n']
+        with self._lock:
+            records = list(self.records)
+
+        shapes = {}
+        for rec in records:
+            key = (rec['database'], rec['shape'])
+            shape = shapes.setdefault(key, {
+                'database': rec['database'], 'shape': rec['shape'], 'calls': 0, 'round_trips': 0,
+                'cache_hits': 0, 'rows': 0, 'bytes': 0, 'fetch_seconds': 0.0, 'convert_seconds': 0.0
+            })
+            shape['calls'] += 1
+            shape['cache_hits' if rec['cached'] else 'round_trips'] += 1
+            shape['rows'] += rec['rows']
+            shape['bytes'] += rec['bytes']
+            shape['fetch_seconds'] += rec['fetch_seconds']
+            shape['convert_seconds'] += rec['convert_seconds']
+
+        for shape in shapes.values():
+            shape['total_seconds'] = round(shape['fetch_seconds'] + shape['convert_seconds'], 6)
+            shape['fetch_seconds'] = round(shape['fetch_seconds'], 6)
+            shape['convert_seconds'] = round(shape['convert_seconds'], 6)
+
+        fetch = sum(rec['fetch_seconds'] for rec in records)
+        convert = sum(rec['convert_seconds'] for rec in records)
+        return {
+            'started': self.started.strftime('%Y-%m-%d %H:%M:%S'),
+            'queries': len(records),
+            'round_trips': sum(1 for rec in records if not rec['cached']),
+            'cache_hits': sum(1 for rec in records if rec['cached']),
+            'distinct_shapes': len(shapes),
+            'rows': sum(rec['rows'] for rec in records),
+            'bytes': sum(rec['bytes'] for rec in records),
+            'fetch_seconds': round(fetch, 6),
+            'convert_seconds': round(convert, 6),
+            'slowest_shapes': sorted(shapes.values(), key=lambda s: s['total_seconds'], reverse=True)[:top_n]
+        }
+
+    def write(self, run_name, directory=None):
+        """Write the run profile to JSON and log its headline numbers
+
+        Returns the JSON path.
+        """
+        directory = directory or QUERY_CONFIG['profile_directory']
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(directory, f"{run_name}_{timestamp}.json")
+
+        summary = self.summary()
+        summary['run'] = run_name
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+        logger = get_logger('query_profile')
+        logger.info(
+            f"{run_name}: {summary['queries']} queries ({summary['round_trips']} round trips, "
+            f"{summary['cache_hits']} cache hits), {summary['rows']} rows, {summary['bytes']} bytes, "
+            f"fetch {summary['fetch_seconds']:.3f}s, convert {summary['convert_seconds']:.3f}s"
+        )
+        for shape in summary['slowest_shapes']:
+            logger.info(f"{run_name}: {shape['total_seconds']:.3f}s x{shape['calls']} "
+                        f"[{shape['database']}] {shape['shape'][:200]}")
+        return path
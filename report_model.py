@@ -0,0 +1,194 @@
+# report_model.py - Structured analysis results written alongside the text reports
+import importlib.util
+import json
+import os
+import re
+from datetime import datetime
+from cli import lazy_import
+from config import REPORTING_CONFIG
+
+pd = lazy_import('pandas')
+
+_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+_warned = set()
+
+def _skip_once(fmt, reason):
+    """Print why a configured format was skipped, once per process"""
+    if fmt not in _warned:
+        _warned.add(fmt)
+        print(f"✗ Skipping {fmt} report output: {reason}")
+
+class IncompleteReportError(Exception):
+    """A report was written, but some of its sections failed
+
+    path is the written report; errors lists (section, message) pairs.
+    """
+
+    def __init__(self, path, errors):
+        self.path = path
+        self.errors = list(errors)
+        super().__init__(f"{len(self.errors)} section(s) failed: " +
+                         "; ".join(f"{section}: {message}" for section, message in self.errors))
+
+def _naive(df):
+    """Copy with timezone-aware datetimes made naive (Excel cannot store tz)"""
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+            df[col] = df[col].dt.tz_localize(None)
+    return df
+
+def _stringify_objects(df):
+    """Copy with object columns as text, for writers that reject mixed types"""
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].map(lambda v: None if v is None or (not isinstance(v, str) and pd.isna(v)) else str(v))
+    return df
+
+class Report:
+    """One analysis result: the text report plus its tables and headline values
+
+    Behaves like the open text file the analysis sections already write to
+    (print_and_log calls .write()), while sections also record the frames
+    and numbers behind the text with add_table() / add_value(). close()
+    writes the structured copies next to the .txt file in every format
+    listed in REPORTING_CONFIG['report_formats'].
+    """
+
+    def __init__(self, kind, subject, text_path, formats=None):
+        self.kind = kind
+        self.subject = subject
+        self.text_path = text_path
+        self.formats = formats if formats is not None else REPORTING_CONFIG['report_formats']
+        self.generated = datetime.now()
+        self.values = {}
+        self.tables = {}
+        self.errors = []
+        self.outputs = [text_path]
+        self._text = open(text_path, 'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def write(self, text):
+        self._text.write(text)
+
+    def flush(self):
+        self._text.flush()
+
+    def add_value(self, name, value):
+        """Record a headline number or field"""
+        self.values[name] = value
+
+    def add_table(self, name, df):
+        """Record a result frame; repeated names are appended to one table"""
+        if df is None:
+            return
+        if name in self.tables:
+            self.tables[name] = pd.concat([self.tables[name], df], ignore_index=True)
+        else:
+            self.tables[name] = df.reset_index(drop=True)
+
+    def add_error(self, section, message):
+        """Record a section that failed; the text report already says so"""
+        self.errors.append((section, str(message)))
+
+    @property
+    def _stem(self):
+        return os.path.splitext(self.text_path)[0]
+
+    def to_dict(self):
+        """JSON-ready copy of the whole model"""
+        return {
+            'kind': self.kind,
+            'subject': self.subject,
+            'generated': self.generated.strftime('%Y-%m-%d %H:%M:%S'),
+            'values': self.values,
+            'errors': [{'section': section, 'message': message} for section, message in self.errors],
+            'tables': {
+                name: json.loads(df.to_json(orient='records', date_format='iso', default_handler=str))
+                for name, df in self.tables.items()
+            }
+        }
+
+    def _write_json(self):
+        path = self._stem + '.json'
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        return [path]
+
+    def _write_csv(self):
+        directory = self._stem + '_csv'
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, df in self.tables.items():
+            path = os.path.join(directory, f"{name}.csv")
+            df.to_csv(path, index=False)
+            paths.append(path)
+        return paths
+
+    def _write_excel(self):
+        if importlib.util.find_spec('xlsxwriter') is None:
+            _skip_once('excel', "xlsxwriter is not installed")
+            return []
+        path = self._stem + '.xlsx'
+        with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+            summary = pd.DataFrame({
+                'field': ['kind', 'subject', 'generated'] + list(self.values),
+                'value': [self.kind, str(self.subject), self.generated.strftime('%Y-%m-%d %H:%M:%S')]
+                         + [str(v) for v in self.values.values()]
+            })
+            summary.to_excel(writer, sheet_name='summary', index=False)
+            used = {'summary'}
+            for name, df in self.tables.items():
+                sheet = _SHEET_CHARS.sub('_', name)[:31]
+                suffix = 1
+                while sheet in used:
+                    suffix += 1
+                    sheet = f"{_SHEET_CHARS.sub('_', name)[:28]}_{suffix}"
+                used.add(sheet)
+                _naive(df).to_excel(writer, sheet_name=sheet, index=False)
+        return [path]
+
+    def _write_parquet(self):
+        if importlib.util.find_spec('pyarrow') is None and importlib.util.find_spec('fastparquet') is None:
+            _skip_once('parquet', "needs pyarrow or fastparquet")
+            return []
+        directory = self._stem + '_parquet'
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, df in self.tables.items():
+            path = os.path.join(directory, f"{name}.parquet")
+            try:
+                df.to_parquet(path, index=False)
+            except Exception:
+                # Object columns mixing numbers and text (common in the raw tables)
+                _stringify_objects(df).to_parquet(path, index=False)
+            paths.append(path)
+        return paths
+
+    def close(self):
+        """Finish the text report and write the structured outputs
+
+        Returns every path written, text report first.
+        """
+        if self._text.closed:
+            return self.outputs
+        self._text.close()
+
+        writers = {'json': self._write_json, 'csv': self._write_csv,
+                   'excel': self._write_excel, 'parquet': self._write_parquet}
+        for fmt in self.formats:
+            writer = writers.get(fmt)
+            if writer is None:
+                _skip_once(fmt, "format not supported")
+                continue
+            try:
+                self.outputs.extend(writer())
+            except Exception as e:
+                print(f"✗ Could not write {fmt} report output: {str(e)}")
+        return self.outputs
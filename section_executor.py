@@ -0,0 +1,90 @@
+# section_executor.py - Run report sections concurrently, assemble them in order
+from concurrent.futures import ThreadPoolExecutor
+from config import QUERY_CONFIG
+
+class Section:
+    """One report section: a function plus the names of the inputs it reads
+
+    run is called as run(report_file, inputs) where report_file is the
+    section's own SectionBuffer and inputs maps each name to its value.
+    """
+
+    def __init__(self, name, run, inputs=()):
+        self.name = name
+        self.run = run
+        self.inputs = tuple(inputs)
+
+class SectionBuffer:
+    """Report stand-in that records one section's text, tables, values and errors
+
+    replay() copies everything into the real report (and echoes the text to
+    the console) once it is this section's turn, so output keeps the fixed
+    section order however the sections were scheduled.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.calls = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def flush(self):
+        pass
+
+    def add_table(self, name, df):
+        self.calls.append(('add_table', name, df))
+
+    def add_value(self, name, value):
+        self.calls.append(('add_value', name, value))
+
+    def add_error(self, section, message):
+        self.calls.append(('add_error', section, message))
+
+    def replay(self, report_file, echo=True):
+        text = ''.join(self.parts)
+        if echo:
+            print(text, end='')
+        report_file.write(text)
+        for method, name, value in self.calls:
+            getattr(report_file, method)(name, value)
+
+def run_sections(sections, loaders, report_file, max_workers=None):
+    """Load each shared input once, run sections concurrently, replay in order
+
+    loaders maps input names to zero-argument functions. An input that
+    fails to load is passed to its sections as the exception, so each
+    section reports the failure in its own place. With
+    QUERY_CONFIG['parallel_processing'] off everything runs in one thread.
+    """
+    if max_workers is None:
+        max_workers = QUERY_CONFIG['section_workers'] if QUERY_CONFIG['parallel_processing'] else 1
+
+    needed = []
+    for section in sections:
+        needed.extend(name for name in section.inputs if name not in needed)
+
+    def load(name):
+        try:
+            return loaders[name]()
+        except Exception as e:
+            return e
+
+    def run(section, input_futures):
+        buffer = SectionBuffer()
+        try:
+            inputs = {name: input_futures[name].result() for name in section.inputs}
+            section.run(buffer, inputs)
+        except Exception as e:
+            buffer.write(f"\nError in section {section.name}: {str(e)}\n")
+            buffer.add_error(section.name, e)
+        return buffer
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # Loaders are queued ahead of every section, so a section waiting on
+        # an input never holds the last free worker the loader needs
+        input_futures = {name: executor.submit(load, name) for name in needed}
+        section_futures = [executor.submit(run, section, input_futures) for section in sections]
+
+        for future in section_futures:
+            future.result().replay(report_file)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Transaction Classifier - Categorize credit_debit rows once
+Applies the TRANSACTION_CATEGORIES keyword rules to every ledger row and
+keeps a local snapshot of (id, user_id, categories), caught up by id on
+each use, so reports select rows by category instead of LIKE scans
+Usage:
+    python3 transaction_classifier.py build
+    python3 transaction_classifier.py [user_id]
+"""
+
+import json
+import sys
+import os
+import threading
+from database_connection import DatabaseConnection
+from cli import lazy_import
+from config import TARGET_ACCOUNT, CACHE_CONFIG, CLASSIFIER_CONFIG, TRANSACTION_CATEGORIES
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+CATEGORIES = list(TRANSACTION_CATEGORIES)
+
+# Loaded snapshots, so repeated reports in one process skip the file read
+_loaded = {}
+_load_lock = threading.Lock()
+
+def snapshot_path():
+    """Location of the persisted classification snapshot"""
+    return os.path.join(CACHE_CONFIG['directory'], CLASSIFIER_CONFIG['snapshot_file'])
+
+def rules_key():
+    """Fingerprint of the rules; a snapshot built from other rules is discarded"""
+    return json.dumps(TRANSACTION_CATEGORIES, sort_keys=True)
+
+def category_bit(category):
+    """Bit for a category in the per-row mask"""
+    return np.uint16(1 << CATEGORIES.index(category))
+
+def classify(ttype, description):
+    """Category bitmask for each row given its ttype and TranDescription"""
+    ttype = pd.Series(ttype).reset_index(drop=True).fillna('').astype(str)
+    description = pd.Series(description).reset_index(drop=True).fillna('').astype(str)
+    # Newline keeps a keyword from matching across the two columns
+    text = (ttype + '\n' + description).str.lower()
+
+    masks = np.zeros(len(text), dtype=np.uint16)
+    for category, keywords in TRANSACTION_CATEGORIES.items():
+        matched = np.zeros(len(text), dtype=bool)
+        for keyword in keywords:
+            matched |= text.str.contains(keyword.lower(), regex=False).to_numpy()
+        masks[matched] |= category_bit(category)
+    return masks
+
+class TransactionCategories:
+    """Per-row category masks for credit_debit, sorted by (user_id, id)
+
+    The ledger is treated as append-only: refresh() classifies rows with an
+    id past the watermark. Run `build` after bulk edits to ttype or
+    TranDescription, or after changing the rules.
+    """
+
+    def __init__(self, ids=None, user_ids=None, masks=None, watermark=None):
+        self.ids = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        self.user_ids = np.asarray(user_ids if user_ids is not None else [], dtype=np.int64)
+        self.masks = np.asarray(masks if masks is not None else [], dtype=np.uint16)
+        self.watermark = watermark
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rows_for(self, user_id):
+        start = np.searchsorted(self.user_ids, user_id, side='left')
+        end = np.searchsorted(self.user_ids, user_id, side='right')
+        return slice(start, end)
+
+    def ids_for(self, user_id, category):
+        """credit_debit ids of the user's rows in a category, ascending"""
+        rows = self._rows_for(user_id)
+        masks = self.masks[rows]
+        if category == 'other':
+            selected = masks == 0
+        else:
+            selected = (masks & category_bit(category)) != 0
+        return self.ids[rows][selected]
+
+    def counts_for(self, user_id):
+        """Number of the user's rows per category"""
+        rows = self._rows_for(user_id)
+        masks = self.masks[rows]
+        counts = {category: int(((masks & category_bit(category)) != 0).sum()) for category in CATEGORIES}
+        counts['other'] = int((masks == 0).sum())
+        return counts
+
+    def refresh(self, db, chunksize=None):
+        """Classify rows past the id watermark and merge them in
+
+        The first call is a full build. Returns the number of rows read.
+        """
+        chunksize = chunksize or CACHE_CONFIG['chunk_size']
+        ids, user_ids, masks = [self.ids], [self.user_ids], [self.masks]
+        rows_read = 0
+
+        for chunk in db.iter_table_chunks('credit_debit', db.raw_db,
+                                          columns=['user_id', 'ttype', 'TranDescription'],
+                                          chunksize=chunksize, start_after=self.watermark):
+            rows_read += len(chunk)
+            uid = pd.to_numeric(chunk['user_id'], errors='coerce')
+            keep = uid.notna().to_numpy()
+            ids.append(pd.to_numeric(chunk['id']).to_numpy(dtype=np.int64)[keep])
+            user_ids.append(uid.to_numpy()[keep].astype(np.int64))
+            masks.append(classify(chunk['ttype'], chunk['TranDescription'])[keep])
+            self.watermark = int(chunk['id'].iloc[-1])
+
+        if rows_read:
+            ids, user_ids, masks = np.concatenate(ids), np.concatenate(user_ids), np.concatenate(masks)
+            order = np.lexsort((ids, user_ids))
+            self.ids, self.user_ids, self.masks = ids[order], user_ids[order], masks[order]
+        return rows_read
+
+    def save(self, path=None):
+        """Persist the snapshot to a compressed .npz file"""
+        path = path or snapshot_path()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Per-process name: batch workers may save the same snapshot at once
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, ids=self.ids, user_ids=self.user_ids, masks=self.masks,
+                            watermark=np.int64(-1 if self.watermark is None else self.watermark),
+                            rules=np.array(rules_key()))
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        """Load a snapshot written by save(); None if the rules have changed"""
+        with np.load(path or snapshot_path()) as data:
+            if str(data['rules']) != rules_key():
+                return None
+            watermark = int(data['watermark'])
+            return cls(data['ids'], data['user_ids'], data['masks'],
+                       None if watermark < 0 else watermark)
+
+def load_and_refresh(db):
+    """Load the snapshot, classify new ledger rows and save it"""
+    path = snapshot_path()
+    with _load_lock:
+        categories = _loaded.get(path)
+        if categories is None and os.path.exists(path):
+            categories = TransactionCategories.load(path)
+        if categories is None:
+            categories = TransactionCategories()
+
+        if categories.refresh(db):
+            categories.save(path)
+        _loaded[path] = categories
+        return categories
+
+def build_snapshot():
+    """Reclassify the whole ledger and persist it"""
+    print("Classifying credit_debit...")
+    db = DatabaseConnection()
+    if not db.test_connections():
+        print("Database connection failed!")
+        return
+
+    categories = TransactionCategories()
+    rows = categories.refresh(db)
+    path = categories.save()
+    _loaded[path] = categories
+    print(f"✅ Classified {rows:,} rows (watermark id {categories.watermark})")
+    print(f"Saved to: {path}")
+
+def report_account(user_id):
+    """Print the account's row count per category"""
+    db = DatabaseConnection()
+    if not db.test_connections():
+        print("Database connection failed!")
+        return
+
+    counts = load_and_refresh(db).counts_for(user_id)
+    print(f"\nTRANSACTION CATEGORIES - User ID: {user_id}")
+    print("="*50)
+    for category, count in counts.items():
+        print(f"  {category:<15} | {count:>8} rows")
+
+def main():
+    """Main entry point"""
+    args = sys.argv[1:]
+
+    if args and args[0] == 'build':
+        build_snapshot()
+        return
+
+    if args:
+        try:
+            user_id = int(args[0])
+        except ValueError:
+            print("Usage: python3 transaction_classifier.py [build | user_id]")
+            return
+    else:
+        user_id = TARGET_ACCOUNT
+        print(f"No user ID provided, using default: {user_id}")
+
+    report_account(user_id)
+
+if __name__ == "__main__":
+    main()
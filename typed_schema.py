@@ -0,0 +1,102 @@
+# typed_schema.py - Compact dtypes for known tables, applied as frames are loaded
+from cli import lazy_import
+from config import TABLE_SCHEMAS
+
+pd = lazy_import('pandas')
+
+def schema_for(schema):
+    """Schema dict for a table name (or a dict passed straight through)"""
+    if schema is None or isinstance(schema, dict):
+        return schema
+    return TABLE_SCHEMAS.get(schema)
+
+def _blank(series):
+    """Values that count as missing in the raw tables"""
+    return series.isna() | series.astype(str).str.strip().isin(['', 'None', 'NULL'])
+
+def _lossless(original, converted):
+    """True if every non-blank original value survived the conversion"""
+    return not (converted.isna() & ~_blank(original)).any()
+
+def _to_int(series):
+    converted = pd.to_numeric(series, errors='coerce')
+    if not _lossless(series, converted) or (converted.dropna() % 1 != 0).any():
+        return series
+    if converted.isna().any():
+        return converted.astype('Int64')
+    # At least 32 bits so ids from different chunks share a dtype
+    converted = pd.to_numeric(converted, downcast='integer')
+    return converted.astype('int32') if converted.dtype.itemsize < 4 else converted
+
+def _to_float(series):
+    converted = pd.to_numeric(series, errors='coerce')
+    if not _lossless(series, converted):
+        return series
+    return converted.astype('float64')
+
+def _to_datetime(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    converted = pd.to_datetime(series, errors='coerce', format='mixed')
+    if not _lossless(series, converted):
+        return series
+    return converted
+
+def apply_schema(df, schema, drop_text=False):
+    """Frame with the schema's dtypes applied (in place where possible)
+
+    Categoricals for low-cardinality labels, downcast integers for ids,
+    float64 amounts and datetime64 timestamps. With drop_text the schema's
+    optional free-text columns are removed. Unknown columns are untouched.
+    """
+    schema = schema_for(schema)
+    if not schema or df.empty:
+        return df
+
+    converters = [('int', _to_int), ('float', _to_float), ('datetime', _to_datetime),
+                  ('category', lambda s: s.astype('category'))]
+    for kind, convert in converters:
+        for col in schema.get(kind, []):
+            if col in df.columns:
+                df[col] = convert(df[col])
+
+    if drop_text:
+        df = df.drop(columns=[col for col in schema.get('optional_text', []) if col in df.columns])
+    return df
+
+def apply_arrow_schema(table, schema, drop_text=False):
+    """Arrow-table counterpart of apply_schema
+
+    Labels are dictionary-encoded, numeric/decimal amounts become float64
+    and text timestamps are parsed when every value parses. Integer columns
+    already arrive with the database's fixed-width types.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    schema = schema_for(schema)
+    if not schema or table.num_rows == 0:
+        return table
+
+    def replace(table, col, convert):
+        position = table.column_names.index(col)
+        try:
+            return table.set_column(position, col, convert(table.column(col)))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            return table  # Not lossless for this column, keep it as loaded
+
+    for col in schema.get('float', []):
+        if col in table.column_names:
+            kind = table.schema.field(col).type
+            if pa.types.is_integer(kind) or pa.types.is_decimal(kind) or pa.types.is_floating(kind):
+                table = replace(table, col, lambda values: values.cast(pa.float64()))
+    for col in schema.get('datetime', []):
+        if col in table.column_names and pa.types.is_string(table.schema.field(col).type):
+            table = replace(table, col, lambda values: values.cast(pa.timestamp('us')))
+    for col in schema.get('category', []):
+        if col in table.column_names and not pa.types.is_dictionary(table.schema.field(col).type):
+            table = replace(table, col, pc.dictionary_encode)
+
+    if drop_text:
+        table = table.drop_columns([col for col in schema.get('optional_text', []) if col in table.column_names])
+    return table
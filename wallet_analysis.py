@@ -2,31 +2,87 @@
 """
 Wallet Analysis - Complete wallet and transaction tracker
 Analyzes all wallet addresses, e-wallets, deposits, and withdrawals
-Usage: python3 wallet_analysis.py [user_id]
+Usage: python3 wallet_analysis.py [user_id] [--check | --no-check]
 """
 
-import pandas as pd
-import sys
+import argparse
 import os
 from datetime import datetime
 from database_connection import DatabaseConnection
-from config import TARGET_ACCOUNT
+from transaction_classifier import load_and_refresh as load_categories
+from report_model import Report, IncompleteReportError
+from section_executor import Section, SectionBuffer, run_sections
+from cli import lazy_import, add_connection_arguments, connections_ready
+from config import TARGET_ACCOUNT, TRANSACTION_CATEGORIES
+
+pd = lazy_import('pandas')
 
 def print_and_log(message, file_handle=None):
-    """Print to console and optionally write to file"""
-    print(message)
+    """Print to console and optionally write to file
+
+    Section buffers echo their text to the console when they are replayed.
+    """
+    if not isinstance(file_handle, SectionBuffer):
+        print(message)
     if file_handle:
         file_handle.write(message + '\n')
 
-def analyze_wallet_addresses(user_id, db, report_file):
+def load_addresses(user_id, db):
+    """The user's user_addresses rows (sections 1 and 4)"""
+    query = f"SELECT * FROM user_addresses WHERE user_id = {user_id}"
+    return db.execute_query(query, db.raw_db)
+
+def load_ledger(user_id, db):
+    """All of the user's credit_debit rows in time order (sections 3 to 5)"""
+    query = f"SELECT * FROM credit_debit WHERE user_id = {user_id} ORDER BY ts"
+    return db.execute_query(query, db.raw_db, schema='credit_debit')
+
+def _shared(value):
+    """A shared input, raising the loader's error if it failed to load"""
+    if isinstance(value, Exception):
+        raise value
+    return value
+
+def _keyword_mask(ledger, category):
+    """Ledger rows whose ttype / TranDescription mention one of the category's keywords"""
+    mask = pd.Series(False, index=ledger.index)
+    for col in ['ttype', 'TranDescription']:
+        text = ledger[col].astype('string').str.lower()
+        for keyword in TRANSACTION_CATEGORIES[category]:
+            mask |= text.str.contains(keyword, regex=False).fillna(False).astype(bool)
+    return mask
+
+def category_rows(ledger, user_id, category, db):
+    """The user's ledger rows in a transaction category, in ledger order
+
+    Uses the classification snapshot ids and falls back to keyword
+    matching on ttype / TranDescription if the snapshot cannot be loaded.
+    Rows written after the snapshot's id watermark are matched by keyword
+    too, so they are never left out.
+    """
+    try:
+        categories = load_categories(db)
+        mask = ledger['id'].isin(categories.ids_for(user_id, category))
+        if categories.watermark is None:
+            newer = pd.Series(True, index=ledger.index)
+        else:
+            newer = pd.to_numeric(ledger['id'], errors='coerce').gt(categories.watermark).fillna(False).astype(bool)
+        if newer.any():
+            mask |= newer & _keyword_mask(ledger, category)
+    except Exception as e:
+        print(f"  Transaction categories unavailable ({str(e)}), using keyword search")
+        mask = _keyword_mask(ledger, category)
+    return ledger[mask].reset_index(drop=True)
+
+def analyze_wallet_addresses(user_id, db, report_file, addresses=None):
     """Analyze cryptocurrency wallet addresses"""
     print_and_log("\n" + "="*80, report_file)
     print_and_log("SECTION 1: CRYPTOCURRENCY WALLET ADDRESSES", report_file)
     print_and_log("="*80, report_file)
 
     try:
-        query = f"SELECT * FROM user_addresses WHERE user_id = {user_id}"
-        df = db.execute_query(query, db.raw_db)
+        df = load_addresses(user_id, db) if addresses is None else _shared(addresses)
+        report_file.add_table('user_addresses', df)
 
         if not df.empty:
             row = df.iloc[0]
@@ -64,6 +120,7 @@ def analyze_wallet_addresses(user_id, db, report_file):
 
     except Exception as e:
         print_and_log(f"\nError analyzing wallet addresses: {str(e)}", report_file)
+        report_file.add_error('wallet_addresses', str(e))
 
 def analyze_ewallets(user_id, db, report_file):
     """Analyze internal e-wallet balances"""
@@ -92,6 +149,7 @@ def analyze_ewallets(user_id, db, report_file):
         try:
             query = f"SELECT * FROM {table} WHERE user_id = {user_id}"
             df = db.execute_query(query, db.raw_db)
+            report_file.add_table('e_wallets', df.assign(wallet_table=table))
 
             if not df.empty:
                 row = df.iloc[0]
@@ -106,12 +164,14 @@ def analyze_ewallets(user_id, db, report_file):
 
         except Exception as e:
             print_and_log(f"\nError reading {table}: {str(e)}", report_file)
+            report_file.add_error('ewallets', f"{table}: {str(e)}")
 
     print_and_log(f"\n{'='*80}", report_file)
     print_and_log(f"TOTAL E-WALLET BALANCE: {total_balance:.10f} BTC", report_file)
+    report_file.add_value('total_ewallet_balance', total_balance)
     print_and_log(f"{'='*80}", report_file)
 
-def analyze_ewallet_usage(user_id, db, report_file):
+def analyze_ewallet_usage(user_id, db, report_file, ledger=None):
     """Analyze e-wallet usage from credit_debit transactions"""
     print_and_log("\n" + "="*80, report_file)
     print_and_log("SECTION 3: E-WALLET USAGE ANALYSIS", report_file)
@@ -119,8 +179,18 @@ def analyze_ewallet_usage(user_id, db, report_file):
     print_and_log("Analyzing which e-wallets were used in transactions...", report_file)
 
     try:
-        query = f"SELECT ewallet_used_by, COUNT(*) as count, SUM(credit_amt) as total_credits, SUM(debit_amt) as total_debits FROM credit_debit WHERE user_id = {user_id} GROUP BY ewallet_used_by ORDER BY count DESC"
-        df = db.execute_query(query, db.raw_db)
+        ledger = load_ledger(user_id, db) if ledger is None else _shared(ledger)
+        amounts = ledger[['ewallet_used_by']].assign(
+            credit_amt=pd.to_numeric(ledger['credit_amt'], errors='coerce'),
+            debit_amt=pd.to_numeric(ledger['debit_amt'], errors='coerce'))
+        df = (amounts.groupby('ewallet_used_by', dropna=False, observed=True)
+              .agg(count=('ewallet_used_by', 'size'), total_credits=('credit_amt', 'sum'),
+                   total_debits=('debit_amt', 'sum'))
+              .reset_index()
+              .sort_values('count', ascending=False, kind='stable')
+              .reset_index(drop=True))
+        df['ewallet_used_by'] = df['ewallet_used_by'].astype(object)
+        report_file.add_table('ewallet_usage', df)
 
         if not df.empty:
             print_and_log(f"\nFound {len(df)} different e-wallet types used:\n", report_file)
@@ -152,8 +222,8 @@ def analyze_ewallet_usage(user_id, db, report_file):
                 print_and_log(f"\n--- {ewallet.upper()} ---", report_file)
 
                 # Get detailed transactions for this e-wallet
-                detail_query = f"SELECT * FROM credit_debit WHERE user_id = {user_id} AND ewallet_used_by = '{ewallet}' ORDER BY ts"
-                detail_df = db.execute_query(detail_query, db.raw_db)
+                detail_df = ledger[ledger['ewallet_used_by'] == ewallet].reset_index(drop=True)
+                report_file.add_table('ewallet_transactions', detail_df)
 
                 if not detail_df.empty:
                     print_and_log(f"Total Transactions: {len(detail_df)}\n", report_file)
@@ -198,8 +268,9 @@ def analyze_ewallet_usage(user_id, db, report_file):
 
     except Exception as e:
         print_and_log(f"\nError analyzing e-wallet usage: {str(e)}", report_file)
+        report_file.add_error('ewallet_usage', str(e))
 
-def analyze_deposits(user_id, db, report_file):
+def analyze_deposits(user_id, db, report_file, addresses=None, ledger=None):
     """Analyze all deposit transactions"""
     print_and_log("\n" + "="*80, report_file)
     print_and_log("SECTION 4: DEPOSIT ANALYSIS", report_file)
@@ -208,27 +279,21 @@ def analyze_deposits(user_id, db, report_file):
     # First, get the user's deposit address
     deposit_address = None
     try:
-        addr_query = f"SELECT daddress FROM user_addresses WHERE user_id = {user_id}"
-        addr_df = db.execute_query(addr_query, db.raw_db)
+        addr_df = load_addresses(user_id, db) if addresses is None else _shared(addresses)
         if not addr_df.empty and pd.notna(addr_df.iloc[0]['daddress']):
             deposit_address = addr_df.iloc[0]['daddress']
+            report_file.add_value('deposit_address', deposit_address)
             print_and_log(f"\nUser's Deposit Address (daddress): {deposit_address}", report_file)
             print_and_log("This is the Bitcoin address where funds should be deposited.\n", report_file)
     except Exception as e:
         print_and_log(f"\nCould not retrieve deposit address: {str(e)}", report_file)
+        report_file.add_error('deposits', f"deposit address: {str(e)}")
 
     try:
         # Look for deposit-related transactions in credit_debit
-        deposit_keywords = ['deposit', 'payment approved', 'payment received', 'fund received']
-        conditions = " OR ".join([f"LOWER(ttype) LIKE '%{keyword}%' OR LOWER(TranDescription) LIKE '%{keyword}%'" for keyword in deposit_keywords])
-
-        query = f"""
-            SELECT * FROM credit_debit
-            WHERE user_id = {user_id}
-            AND ({conditions})
-            ORDER BY ts
-        """
-        df = db.execute_query(query, db.raw_db)
+        ledger = load_ledger(user_id, db) if ledger is None else _shared(ledger)
+        df = category_rows(ledger, user_id, 'deposit', db)
+        report_file.add_table('deposits', df)
 
         if not df.empty:
             print_and_log(f"\nFound {len(df)} deposit-related transaction(s)\n", report_file)
@@ -275,6 +340,7 @@ def analyze_deposits(user_id, db, report_file):
 
             print_and_log(f"\n{'='*80}", report_file)
             print_and_log(f"TOTAL DEPOSITS: {total_deposits:.10f} BTC", report_file)
+            report_file.add_value('total_deposits', total_deposits)
             print_and_log(f"{'='*80}", report_file)
 
         else:
@@ -282,8 +348,9 @@ def analyze_deposits(user_id, db, report_file):
 
     except Exception as e:
         print_and_log(f"\nError analyzing deposits: {str(e)}", report_file)
+        report_file.add_error('deposits', str(e))
 
-def analyze_withdrawals(user_id, db, report_file):
+def analyze_withdrawals(user_id, db, report_file, ledger=None):
     """Analyze all withdrawal requests and confirmations"""
     print_and_log("\n" + "="*80, report_file)
     print_and_log("SECTION 5: WITHDRAWAL ANALYSIS", report_file)
@@ -296,7 +363,8 @@ def analyze_withdrawals(user_id, db, report_file):
 
     try:
         query = f"SELECT * FROM withdraw_request WHERE user_id = {user_id} ORDER BY id"
-        df = db.execute_query(query, db.raw_db)
+        df = db.execute_query(query, db.raw_db, schema='withdraw_request')
+        report_file.add_table('withdraw_requests', df)
 
         if not df.empty:
             print_and_log(f"\nFound {len(df)} withdrawal request(s)\n", report_file)
@@ -328,6 +396,7 @@ def analyze_withdrawals(user_id, db, report_file):
 
             print_and_log(f"\n{'='*80}", report_file)
             print_and_log(f"TOTAL REQUESTED: {total_requested:.10f} BTC", report_file)
+            report_file.add_value('total_requested', total_requested)
             print_and_log(f"{'='*80}", report_file)
 
         else:
@@ -335,6 +404,7 @@ def analyze_withdrawals(user_id, db, report_file):
 
     except Exception as e:
         print_and_log(f"\nError analyzing withdrawal requests: {str(e)}", report_file)
+        report_file.add_error('withdrawals', f"withdraw_request: {str(e)}")
 
     # Part 2: Withdrawal Confirmations
     print_and_log("\n" + "-"*80, report_file)
@@ -349,7 +419,8 @@ def analyze_withdrawals(user_id, db, report_file):
         user_column = 'userid' if 'userid' in columns else 'user_id'
 
         query = f"SELECT * FROM withdraw_confirm WHERE {user_column} = {user_id} ORDER BY id"
-        df = db.execute_query(query, db.raw_db)
+        df = db.execute_query(query, db.raw_db, schema='withdraw_confirm')
+        report_file.add_table('withdraw_confirmations', df)
 
         if not df.empty:
             print_and_log(f"\nFound {len(df)} withdrawal confirmation(s)\n", report_file)
@@ -381,6 +452,7 @@ def analyze_withdrawals(user_id, db, report_file):
 
             print_and_log(f"\n{'='*80}", report_file)
             print_and_log(f"TOTAL CONFIRMED: {total_confirmed:.10f} BTC", report_file)
+            report_file.add_value('total_confirmed', total_confirmed)
             print_and_log(f"{'='*80}", report_file)
 
         else:
@@ -388,6 +460,7 @@ def analyze_withdrawals(user_id, db, report_file):
 
     except Exception as e:
         print_and_log(f"\nError analyzing withdrawal confirmations: {str(e)}", report_file)
+        report_file.add_error('withdrawals', f"withdraw_confirm: {str(e)}")
 
     # Part 3: Withdrawal-related transactions from credit_debit
     print_and_log("\n" + "-"*80, report_file)
@@ -395,13 +468,9 @@ def analyze_withdrawals(user_id, db, report_file):
     print_and_log("-"*80, report_file)
 
     try:
-        query = f"""
-            SELECT * FROM credit_debit
-            WHERE user_id = {user_id}
-            AND (LOWER(ttype) LIKE '%withdraw%' OR LOWER(TranDescription) LIKE '%withdraw%')
-            ORDER BY ts
-        """
-        df = db.execute_query(query, db.raw_db)
+        ledger = load_ledger(user_id, db) if ledger is None else _shared(ledger)
+        df = category_rows(ledger, user_id, 'withdrawal', db)
+        report_file.add_table('withdrawal_transactions', df)
 
         if not df.empty:
             print_and_log(f"\nFound {len(df)} withdrawal transaction(s)\n", report_file)
@@ -419,54 +488,49 @@ def analyze_withdrawals(user_id, db, report_file):
 
     except Exception as e:
         print_and_log(f"\nError analyzing withdrawal transactions: {str(e)}", report_file)
-
-def main():
-    """Main entry point"""
-
-    # Get user ID from command line or use default
-    if len(sys.argv) > 1:
-        try:
-            user_id = int(sys.argv[1])
-        except ValueError:
-            print("Error: User ID must be a valid integer")
-            print("Usage: python3 wallet_analysis.py [user_id]")
-            return
-    else:
-        user_id = TARGET_ACCOUNT
-        print(f"No user ID provided, using default: {user_id}")
-
-    print(f"\n{'='*80}")
-    print(f"WALLET ANALYSIS")
-    print(f"User ID: {user_id}")
-    print(f"{'='*80}\n")
-
-    db = DatabaseConnection()
-
-    # Test connection
-    if not db.test_connections():
-        print("Database connection failed!")
-        return
-
+        report_file.add_error('withdrawals', str(e))
+
+def wallet_sections(user_id, db):
+    """Report sections in output order, with the shared inputs each reads"""
+    return [
+        Section('wallet_addresses', lambda out, inputs: analyze_wallet_addresses(
+            user_id, db, out, inputs['addresses']), inputs=['addresses']),
+        Section('ewallets', lambda out, inputs: analyze_ewallets(user_id, db, out)),
+        Section('ewallet_usage', lambda out, inputs: analyze_ewallet_usage(
+            user_id, db, out, inputs['ledger']), inputs=['ledger']),
+        Section('deposits', lambda out, inputs: analyze_deposits(
+            user_id, db, out, inputs['addresses'], inputs['ledger']), inputs=['addresses', 'ledger']),
+        Section('withdrawals', lambda out, inputs: analyze_withdrawals(
+            user_id, db, out, inputs['ledger']), inputs=['ledger']),
+    ]
+
+def run_wallet_analysis(user_id, db, reports_dir="forensic_reports", strict=False):
+    """Run every analysis section for one user and return the report path
+
+    Failed sections are reported in place; with strict=True they also raise
+    IncompleteReportError once the report is written.
+    """
     # Create reports directory
-    reports_dir = "forensic_reports"
     os.makedirs(reports_dir, exist_ok=True)
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     report_file_path = os.path.join(reports_dir, f"wallet_analysis_{user_id}_{timestamp}.txt")
 
-    with open(report_file_path, 'w') as report_file:
+    with Report('wallet_analysis', user_id, report_file_path) as report_file:
         # Write header
         report_file.write(f"WALLET ANALYSIS REPORT\n")
         report_file.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         report_file.write(f"User ID: {user_id}\n")
         report_file.write(f"{'='*80}\n")
 
-        # Run all analysis sections
-        analyze_wallet_addresses(user_id, db, report_file)
-        analyze_ewallets(user_id, db, report_file)
-        analyze_ewallet_usage(user_id, db, report_file)
-        analyze_deposits(user_id, db, report_file)
-        analyze_withdrawals(user_id, db, report_file)
+        # Lazy modules must finish importing before the section threads share them
+        _ = pd.DataFrame
+
+        # Run all analysis sections (concurrently, written in this order)
+        run_sections(wallet_sections(user_id, db), {
+            'addresses': lambda: load_addresses(user_id, db),
+            'ledger': lambda: load_ledger(user_id, db),
+        }, report_file)
 
         # Footer
         print_and_log(f"\n{'='*80}", report_file)
@@ -474,5 +538,38 @@ def main():
         print_and_log(f"{'='*80}", report_file)
         print_and_log(f"\nReport saved to: {report_file_path}", report_file)
 
+    if strict and report_file.errors:
+        raise IncompleteReportError(report_file_path, report_file.errors)
+    return report_file_path
+
+def main():
+    """Main entry point"""
+
+    parser = argparse.ArgumentParser(description="Wallet and transaction report for one user")
+    parser.add_argument('user_id', nargs='?', type=int, help=f"User ID (default: {TARGET_ACCOUNT})")
+    add_connection_arguments(parser)
+    args = parser.parse_args()
+
+    # Get user ID from command line or use default
+    user_id = args.user_id
+    if user_id is None:
+        user_id = TARGET_ACCOUNT
+        print(f"No user ID provided, using default: {user_id}")
+
+    print(f"\n{'='*80}")
+    print(f"WALLET ANALYSIS")
+    print(f"User ID: {user_id}")
+    print(f"{'='*80}\n")
+
+    db = DatabaseConnection()
+
+    # Test connection (skipped if a recent check passed)
+    if not connections_ready(db, args.connection_check):
+        print("Database connection failed!")
+        return
+
+    run_wallet_analysis(user_id, db)
+    db.write_query_profile(f"wallet_analysis_{user_id}")
+
 if __name__ == "__main__":
     main()